@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""Throughput and tail latency benchmark for EtcdStore
+
+Runs reads, writes and watches of EtcdStore against the bundled
+in-process etcd over real http and reports the operations per second
+as well as the latency percentiles for several store sizes. Latency
+and failures of etcd can be injected.
+
+    python benchmarks/etcd.py --sizes 10 100 1000 --ops 200 --threads 4
+"""
+
+import argparse
+import threading
+from timeit import default_timer
+
+from layeredconfig import EtcdStore
+from layeredconfig.fakeetcd import FakeEtcd
+from layeredconfig.profiling import percentile
+from layeredconfig.sources.etcdstore import EtcdConnector
+
+
+def fill(etcd, size):
+    """Store size values in sections of ten"""
+    for section in range(max(size // 10, 1)):
+        for key in range(10):
+            etcd.set('/section%d/key%d' % (section, key), 'value%d' % key)
+
+
+def _read(url):
+    def read(op):
+        EtcdStore(url, cached=False).dump()
+    return read
+
+
+def _reload(url):
+    # reloads the whole tree into the cache
+    store = EtcdStore(url)
+    return lambda op: store.reload()
+
+
+def _write(url):
+    # changes a single value which only sends that value
+    store = EtcdStore(url)
+    store.dump()
+    key = 'writer%d' % (threading.current_thread().ident % 100000)
+
+    def write(op):
+        store['section0'][key] = '%d' % op
+        store.write_cache()
+    return write
+
+
+# factories of the operations of a single thread
+OPERATIONS = [
+    ('read', _read),
+    ('reload', _reload),
+    ('write', _write),
+]
+
+
+def measure(url, operation, ops, threads):
+    """Return the operations per second and the latencies of all ops"""
+    latencies = []
+    lock = threading.Lock()
+    start = threading.Event()
+
+    def run():
+        own = []
+        perform = operation(url)
+        start.wait()
+        for op in range(ops):
+            began = default_timer()
+            perform(op)
+            own.append(default_timer() - began)
+        with lock:
+            latencies.extend(own)
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    began = default_timer()
+    start.set()
+    for worker in workers:
+        worker.join()
+    return len(latencies) / (default_timer() - began), latencies
+
+
+def measure_watch(etcd, ops):
+    """Return the latencies from a change until a watch returns it"""
+    connector = EtcdConnector(etcd.url)
+    latencies = []
+    for op in range(ops):
+        ready = threading.Event()
+        changed = []
+
+        def change():
+            ready.wait()
+            changed.append(default_timer())
+            etcd.set('/watched', '%d' % op)
+
+        thread = threading.Thread(target=change)
+        thread.start()
+        index = etcd.index + 1
+        ready.set()
+        connector.watch('/watched', wait_index=index)
+        latencies.append(default_timer() - changed[0])
+        thread.join()
+    return latencies
+
+
+def run(sizes, ops, threads, latency=0, failures=0):
+    """Yield (size, operation, ops/s, p50, p90, p99, max) in seconds"""
+    for size in sizes:
+        with FakeEtcd() as etcd:
+            fill(etcd, size)
+            etcd.latency = latency
+
+            for name, operation in OPERATIONS:
+                # failing requests are retried with backoff
+                etcd.failures = failures
+                throughput, latencies = measure(etcd.url, operation, ops,
+                                                threads)
+                yield (size, name, throughput) + tuple(
+                    percentile(latencies, fraction)
+                    for fraction in (0.5, 0.9, 0.99, 1.0))
+
+            latencies = measure_watch(etcd, ops)
+            yield (size, 'watch', len(latencies) / sum(latencies)) + tuple(
+                percentile(latencies, fraction)
+                for fraction in (0.5, 0.9, 0.99, 1.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10, 100, 1000])
+    parser.add_argument('--ops', type=int, default=100,
+                        help='operations per thread')
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds etcd delays every response')
+    parser.add_argument('--failures', type=int, default=0,
+                        help='failing responses at the start of every run')
+    args = parser.parse_args()
+
+    print('%6s %-8s %10s %10s %10s %10s %10s'
+          % ('size', 'op', 'ops/s', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms'))
+    for row in run(args.sizes, args.ops, args.threads, args.latency,
+                   args.failures):
+        print('%6d %-8s %10.1f %10.3f %10.3f %10.3f %10.3f'
+              % (row[:3] + tuple(value * 1000 for value in row[3:])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""Memory footprint benchmark for sources and layered configs
+
+Reports the peak and retained bytes as well as the retained blocks
+that single lookups, iterations, dumps and writes allocate for every
+source type at several config sizes.
+
+    python benchmarks/memory.py --sizes 10 100 1000
+"""
+
+import argparse
+import gc
+import io
+import json
+import os
+import shutil
+import tempfile
+import tracemalloc
+
+from layeredconfig import (DictSource, Environment, INIFile, JsonFile,
+                           LayeredConfig, YamlFile)
+from layeredconfig.profiling import make_data, make_source, measure_memory
+
+ENV_PREFIX = 'LCMEMBENCH_'
+
+# in-process etcds of the current measurement
+_fakes = []
+
+
+def _json_file(data, directory, **kwargs):
+    path = os.path.join(directory, 'config.json')
+    with open(path, 'w') as fh:
+        json.dump(data, fh)
+    return JsonFile(path, **kwargs)
+
+
+def _yaml_file(data, directory):
+    import yaml
+
+    path = os.path.join(directory, 'config.yaml')
+    with open(path, 'w') as fh:
+        yaml.safe_dump(data, fh)
+    return YamlFile(path)
+
+
+def _ini_file(data, directory):
+    lines = []
+    for section, values in sorted(data.items()):
+        lines.append(u'[%s]' % section)
+        lines.extend(u'%s = %s' % item for item in sorted(values.items()))
+    return INIFile(io.StringIO(u'\n'.join(lines)))
+
+
+def _environment(data, directory):
+    for section, values in data.items():
+        for key, value in values.items():
+            os.environ['%s%s_%s' % (ENV_PREFIX, section.upper(),
+                                    key.upper())] = value
+    return Environment(ENV_PREFIX)
+
+
+def _etcd_store(data, directory):
+    # cached like EtcdStore is by default. Reads that go through to the
+    # in-process etcd would count its allocations as well.
+    path = os.path.join(directory, 'seed.json')
+    with open(path, 'w') as fh:
+        json.dump(data, fh)
+    store, etcd = make_source('fake-etcd:' + path)
+    _fakes.append(etcd)
+    return store
+
+
+def _layered(data, directory):
+    return LayeredConfig(DictSource(data, cached=True),
+                         DictSource({'section0': {}}, cached=True))
+
+
+SOURCES = [
+    ('dict', lambda data, directory: DictSource(data)),
+    ('dict-cached', lambda data, directory: DictSource(data, cached=True)),
+    ('json', _json_file),
+    ('json-cached', lambda data, directory: _json_file(data, directory,
+                                                       cached=True)),
+    ('yaml', _yaml_file),
+    ('ini', _ini_file),
+    ('env', _environment),
+    ('etcd-cached', _etcd_store),
+    ('layered', _layered),
+]
+
+
+def _write(config):
+    config['section0']['key0'] = 'changed'
+
+
+OPERATIONS = [
+    ('getitem', lambda config: config['section0']['key0']),
+    ('items', lambda config: list(config.items())),
+    ('dump', lambda config: config.dump()),
+    ('write', _write),
+]
+
+
+def _is_writable(config):
+    if isinstance(config, LayeredConfig):
+        return any(source.is_writable() for source in config._source_list)
+    return config.is_writable()
+
+
+def run(sizes, repeat=5):
+    """Yield (source, size, operation, peak, retained, blocks)"""
+    for name, factory in SOURCES:
+        for size in sizes:
+            for operation_name, operation in OPERATIONS:
+                directory = tempfile.mkdtemp()
+                try:
+                    try:
+                        config = factory(make_data(size), directory)
+                    except ImportError:
+                        # optional dependency of the source is missing
+                        continue
+                    if operation_name == 'write' and \
+                            not _is_writable(config):
+                        continue
+                    result = measure_memory(lambda: operation(config),
+                                            repeat)
+                finally:
+                    shutil.rmtree(directory)
+                    while _fakes:
+                        _fakes.pop().stop()
+                    for key in [key for key in os.environ
+                                if key.startswith(ENV_PREFIX)]:
+                        del os.environ[key]
+                yield (name, size, operation_name) + result
+
+
+def run_interning(size, layers, intern):
+    """Return the bytes retained by cached json layers of size values"""
+    directory = tempfile.mkdtemp()
+    try:
+        paths = []
+        for layer in range(layers):
+            path = os.path.join(directory, 'layer%d.json' % layer)
+            with open(path, 'w') as fh:
+                json.dump(make_data(size), fh)
+            paths.append(path)
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            sources = [JsonFile(path, cached=True, intern=intern)
+                       for path in paths]
+            for source in sources:
+                source.dump()
+            gc.collect()
+            return tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--layers', type=int, default=3)
+    args = parser.parse_args()
+
+    print('%-12s %6s %-8s %12s %12s %8s'
+          % ('source', 'size', 'op', 'peak bytes', 'retained', 'blocks'))
+    for row in run(args.sizes, args.repeat):
+        print('%-12s %6d %-8s %12d %12d %8d' % row)
+
+    print('\nretained bytes of %d cached json layers' % args.layers)
+    for size in args.sizes:
+        plain = run_interning(size, args.layers, False)
+        interned = run_interning(size, args.layers, True)
+        print('%6d values  plain %10d  interned %10d  (%.0f%%)'
+              % (size, plain, interned, 100.0 * interned / plain))
+
+
+if __name__ == '__main__':
+    main()
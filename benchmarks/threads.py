@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Multi-threaded stress benchmark for thread-safe sources
+
+Runs reader and writer threads against a cached DictSource and reports
+the throughput as well as the number of lost updates with and without
+the reader/writer lock.
+
+    python benchmarks/threads.py --readers 8 --writers 4 --ops 2000
+"""
+
+import argparse
+import threading
+import time
+
+from layeredconfig import DictSource, LayeredConfig
+
+
+def run(threadsafe, readers, writers, ops):
+    source = DictSource({'section': {}, 'value': 1},
+                        cached=True, threadsafe=threadsafe)
+    config = LayeredConfig(source)
+    start = threading.Event()
+
+    def read():
+        start.wait()
+        for _ in range(ops):
+            config.value
+            config.section.get('missing')
+
+    def write(index):
+        start.wait()
+        for op in range(ops):
+            config.section['writer%d' % index] = op
+
+    threads = [threading.Thread(target=read) for _ in range(readers)]
+    threads += [threading.Thread(target=write, args=(index,))
+                for index in range(writers)]
+    for thread in threads:
+        thread.start()
+
+    began = time.time()
+    start.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - began
+
+    section = source.section
+    lost = writers - len(section)
+    lost += sum(1 for key, value in section.items() if value != ops - 1)
+    return (readers + writers) * ops / elapsed, lost
+
+
+def run_cache_misses(threads):
+    release = threading.Event()
+    reads = []
+
+    class SlowSource(DictSource):
+        def _read(self):
+            reads.append(1)
+            release.wait()
+            return super(SlowSource, self)._read()
+
+    source = SlowSource({'a': 1}, cached=True)
+    workers = [threading.Thread(target=lambda: source.a)
+               for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    time.sleep(0.1)
+    release.set()
+    for worker in workers:
+        worker.join()
+    return len(reads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--ops', type=int, default=2000)
+    args = parser.parse_args()
+
+    for threadsafe in (False, True):
+        throughput, lost = run(threadsafe, args.readers, args.writers,
+                               args.ops)
+        print('threadsafe=%-5s %10.0f ops/s  %d lost updates'
+              % (threadsafe, throughput, lost))
+
+    threads = args.readers + args.writers
+    print('%d concurrent cache misses caused %d read(s)'
+          % (threads, run_cache_misses(threads)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,15 @@
 # -*- coding: utf-8 -*-
 
 from .config import LayeredConfig
+from .frozen import FrozenConfig
 from .source import CustomType
 from .sources.dictsource import DictSource
+from .sources.directorysource import DirectorySource
 from .sources.environment import Environment
 from .sources.etcdstore import EtcdStore
 from .sources.inifile import INIFile
 from .sources.jsonfile import JsonFile
+from .sources.sharedmemory import SharedMemory, SharedMemoryPublisher
+from .sources.snapshot import Snapshot
 from .sources.yamlfile import YamlFile
 from .strategy import add, collect, merge
@@ -1,8 +1,63 @@
 # -*- coding: utf-8 -*-
 
-from collections import defaultdict, deque
+import fnmatch
+import hashlib
+from collections import defaultdict, namedtuple
+from operator import itemgetter
 
-from .source import Source
+import six
+
+from . import streaming
+from .diff import diff
+from .frozen import freeze
+from .source import Mapping, Source, sort_key
+from .sources.pinned import PinnedSource
+from .sources.snapshot import Snapshot, write_snapshot
+from .strategy import as_strategy
+
+Origin = namedtuple('Origin', 'source_name label value')
+Provenance = namedtuple('Provenance',
+                        'keypath value origin shadowed coercion')
+
+
+class _Layers(object):
+    """Raw data of the sources of a config, read at most once each
+
+    Sources are indexed by priority, highest first.
+    """
+
+    def __init__(self, sources, keychain):
+        self.sources = list(reversed(sources))
+        self._keychain = tuple(keychain)
+        self._data = {}
+
+    def node(self, index, keys):
+        """Return the raw value at keys relative to the keychain
+
+        Raises KeyError or TypeError if there is no such value.
+        """
+        try:
+            node = self._data[index]
+        except KeyError:
+            node = self._data[index] = self.sources[index]._get_data()
+        for key in self._keychain + tuple(keys):
+            node = node[key]
+        return node
+
+
+class _Section(object):
+    """Raw sections of the layers of a config that share a keypath
+
+    Layers are (root source, section) pairs, highest priority first.
+    They are merged on demand by items().
+    """
+
+    def __init__(self, config, layers):
+        self._config = config
+        self.layers = layers
+
+    def items(self):
+        return self._config._merge_items(self.layers)
 
 
 class LayeredConfig(object):
@@ -10,9 +65,30 @@ class LayeredConfig(object):
 
     _initialized = False
 
+    # the bookkeeping of subscriptions, provenance and freezing is only
+    # set up on first use so that subconfigs stay cheap to create
+
+    # (path pattern, callback) pairs and the merged view that
+    # changes are detected against
+    _subscriptions = ()
+    _merged = None
+    _merged_hashes = None
+    _reloading = False
+
+    # (content hash, provenance index) of the merged view
+    _provenance = None
+
+    # (content hash, frozen config) by keychain of the last freeze
+    _frozen = None
+
     def __init__(self, *sources, **kwargs):
+        include = kwargs.get('include')
+        if include is not None:
+            sources = tuple(source.project(include) for source in sources)
         self._source_list = sources
-        self._strategy_map = kwargs.get('strategies', {})
+        self._strategy_map = dict(
+            (key, as_strategy(strategy))
+            for key, strategy in kwargs.get('strategies', {}).items())
 
         # _keychain is a list of keys that led from the root
         # config to this (sub)config
@@ -22,31 +98,88 @@ class LayeredConfig(object):
     @property
     def _sources(self):
         """Return the sublevels of the sources according to the keychain"""
-        for source in reversed(self._source_list):
-            traversed_source = source
-            for key in self._keychain:
-                traversed_source = traversed_source[key]
-            yield source, traversed_source
-
-    @property
-    def _typed_sources(self):
-        def filter_by_type(source):
-            return source.is_typed()
-
-        for root_source, source in self._iter_sources(filter_by_type):
-            yield root_source, source
-
-    def _iter_sources(self, filter_fn=None):
-        if not filter_fn:
-            filter_fn = lambda s: s
+        return self._iter_sources()
 
+    def _iter_sources(self):
         for source in reversed(self._source_list):
-            if not filter_fn(source):
-                continue
-            traversed_source = source
+            traversed_source = self._traverse(source)
+            if traversed_source is not None:
+                yield source, traversed_source
+
+    def _traverse(self, root_source):
+        source = root_source
+        try:
             for key in self._keychain:
-                traversed_source = traversed_source[key]
-            yield source, traversed_source
+                source = source[key]
+        except (KeyError, TypeError):
+            # lazy sources are added to subconfigs without checking
+            # whether they contain the section as well and projections
+            # of subconfigs may exclude it
+            if root_source.is_lazy() or root_source.is_projected():
+                return None
+            raise
+
+        if (root_source.is_lazy() or root_source.is_projected()) and \
+                not isinstance(source, Source):
+            return None
+        return source
+
+    @classmethod
+    def from_snapshot(cls, path, *sources):
+        """Load a config from a snapshot file
+
+        If sources are given, the snapshot is checked against their
+        fingerprints and a ValueError is raised if any of them changed
+        since the snapshot was compiled.
+        """
+        snapshot = Snapshot(path)
+        if sources and snapshot.is_stale(*sources):
+            raise ValueError("Snapshot '%s' is stale" % path)
+        return cls(snapshot)
+
+    def project(self, include):
+        """Return a read-only config limited to the given subtrees
+
+        Patterns are relative to this config. Every source is projected
+        so that sources which can read single subtrees only read the
+        included ones, see Source.project().
+        """
+        keychain = list(self._keychain)
+        if isinstance(include, six.string_types):
+            include = [include]
+        include = [keychain + (pattern.split('.')
+                               if isinstance(pattern, six.string_types)
+                               else list(pattern))
+                   for pattern in include]
+
+        return LayeredConfig(*self._source_list,
+                             keychain=keychain,
+                             strategies=self._strategy_map,
+                             include=include)
+
+    def generation(self):
+        """Return a counter which increases with every change of a layer"""
+        return sum(source.generation() for source in self._source_list)
+
+    def snapshot(self):
+        """Return an immutable version of this config
+
+        Every layer is pinned to the data it holds right now which takes
+        constant time for cached sources as writes and reloads never
+        change data in place but replace it. Uncached sources are read
+        once. The snapshot is released at the end of a with block.
+
+            with config.snapshot() as snapshot:
+                host, port = snapshot.db.host, snapshot.db.port
+        """
+        return ConfigSnapshot(
+            *[PinnedSource(source) for source in self._source_list],
+            keychain=self._keychain,
+            strategies=self._strategy_map)
+
+    def compile_snapshot(self, path):
+        """Write the merged and typed config into a snapshot file"""
+        write_snapshot(path, self.dump(), self._source_list)
 
     def get(self, name, default=None):
         try:
@@ -54,61 +187,269 @@ class LayeredConfig(object):
         except KeyError:
             return default
 
-    def items(self):
-        def _items():
-            subqueues = defaultdict(deque)
+    def get_many(self, paths, defaults=None):
+        """Resolve several keypaths at once and return them as a dict
+
+        Paths are dotted strings or tuples of keys. Every source is read
+        at most once for all of them, lazy sources only if a lookup
+        falls through to them. Paths that cannot be found resolve to
+        their value in defaults or None.
+        """
+        defaults = defaults or {}
+        layers = _Layers(self._source_list, self._keychain)
+
+        result = {}
+        for path in paths:
+            if isinstance(path, six.string_types):
+                keypath = tuple(path.split('.'))
+            else:
+                keypath = tuple(path)
 
-            yielded = set()
-            results = {}
+            try:
+                result[path] = self._resolve(layers, keypath)
+            except KeyError:
+                result[path] = defaults.get(path)
+        return result
 
-            for root_source, source in self._sources:
-                for key, value in source.items():
-                    # identical keys from different sources that have
-                    # dicts as values needs to be merged
-                    if isinstance(value, dict):
-                        # higher prio sources might override keys with
-                        # simple values that otherwise point to subsections
-                        if key in yielded:
-                            msg = ("The key '%s' from '%s' specifies a"
-                                   " subsection as value which conflicts"
-                                   " with a higher prioritized source"
-                                   " that wants the same value to be a"
-                                   " non-sectional instead")
-                            raise ValueError(msg % (key,
-                                root_source._meta.source_name))
-                        subqueues[key].appendleft(root_source)
+    def _resolve(self, layers, keypath):
+        """Return the value at keypath relative to this config
+
+        Item access and get_many both resolve values here. Sections
+        resolve to subconfigs, missing keys raise a KeyError.
+        """
+        keychain = tuple(self._keychain)
+        candidates = list(range(len(layers.sources)))
+
+        for depth, key in enumerate(keypath):
+            is_last = depth == len(keypath) - 1
+            strategy = self._strategy_map.get(key)
+            if strategy:
+                accumulator = strategy.initialize()
+            found = False
+            sections = []
+
+            for index in candidates:
+                root_source = layers.sources[index]
+                if not root_source.might_contain(keychain +
+                                                 keypath[:depth + 1]):
+                    continue
+
+                if sections and not strategy and root_source.is_lazy():
+                    # the key already is a section. Whether a lazy
+                    # source contributes to it is only checked once a
+                    # lookup falls through to it, no matter whether it
+                    # was read already.
+                    sections.append(index)
+                    continue
+
+                try:
+                    value = layers.node(index, keypath[:depth + 1])
+                except (KeyError, TypeError):
+                    continue
+
+                if isinstance(value, Mapping):
+                    if not (strategy and strategy.folds_sections):
+                        sections.append(index)
                         continue
+                    value = self._type_section(
+                        self._node_sections(layers, candidates,
+                                            keypath[:depth + 1]),
+                        root_source, value)
+                else:
+                    value = self._resolve_typed_value(
+                        layers, candidates, index, keypath[:depth + 1],
+                        value)
+
+                if not strategy:
+                    if not is_last:
+                        raise KeyError(key)
+                    return value
+
+                accumulator = strategy.accumulate(accumulator, value)
+                found = True
+
+            if found:
+                value = strategy.finalize(accumulator)
+                try:
+                    for subkey in keypath[depth + 1:]:
+                        value = value[subkey]
+                except (KeyError, TypeError):
+                    raise KeyError(key)
+                return value
+            elif not sections:
+                raise KeyError(key)
+            elif is_last:
+                return LayeredConfig(
+                    *[layers.sources[index] for index in reversed(sections)],
+                    keychain=list(self._keychain) + list(keypath),
+                    strategies=self._strategy_map)
+            candidates = sections
+
+    def _node_sections(self, layers, candidates, keypath):
+        """Return the raw sections of the candidates at keypath"""
+        sections = []
+        for index in candidates:
+            try:
+                node = layers.node(index, keypath)
+            except (KeyError, TypeError):
+                continue
+            if isinstance(node, Mapping):
+                sections.append((layers.sources[index], node))
+        return sections
+
+    def _type_section(self, layers, root_source, section):
+        """Return a typed copy of a section that is folded by a strategy
+
+        layers are the raw sections of all layers at the keypath of the
+        section, highest priority first. Values get the same custom
+        types and conversions as values which are not folded.
+        """
+        result = {}
+        for key, value in section.items():
+            if isinstance(value, Mapping):
+                sublayers = [(source, subsection[key])
+                             for source, subsection in layers
+                             if isinstance(subsection.get(key), Mapping)]
+                result[key] = self._type_section(sublayers, root_source,
+                                                 value)
+                continue
+
+            value = root_source._to_custom_type(key, value)
+            if not root_source.is_typed():
+                value = self._get_layered_typed_value(layers, key, value)
+            result[key] = value
+        return result
+
+    def _resolve_typed_value(self, layers, candidates, index, keypath,
+                             value):
+        root_source = layers.sources[index]
+        keychain = tuple(self._keychain) + keypath
+        value = root_source._to_custom_type(keypath[-1], value, keychain)
+        if root_source.is_typed():
+            return value
 
-                    if key in subqueues:
+        for typed_index in candidates:
+            typed_source = layers.sources[typed_index]
+            if not typed_source.is_typed() or \
+                    not typed_source.might_contain(keychain):
+                continue
+            try:
+                typed_value = layers.node(typed_index, keypath)
+            except (KeyError, TypeError):
+                continue
+            if isinstance(typed_value, Mapping):
+                continue
+
+            typed_value = typed_source._to_custom_type(keypath[-1],
+                                                       typed_value, keychain)
+            type_info = self._get_type_info(typed_value)
+            return self._convert_value_to_type(value, type_info)
+        return value
+
+    def items(self):
+        result = []
+        for key, value in self._merge_items(self._layer_sections()):
+            if isinstance(value, _Section):
+                value = self._make_subconfig(
+                    [root_source for root_source, _ in reversed(value.layers)],
+                    key)
+            result.append((key, value))
+        return result
+
+    def _layer_sections(self):
+        """Return the raw sections of the layers of this config"""
+        layers = _Layers(self._source_list, self._keychain)
+        keypath = tuple(self._keychain)
+
+        sections = []
+        for index, root_source in enumerate(layers.sources):
+            if keypath and not root_source.might_contain(keypath):
+                continue
+            try:
+                section = layers.node(index, ())
+            except (KeyError, TypeError):
+                # see _traverse()
+                if root_source.is_lazy() or root_source.is_projected():
+                    continue
+                raise
+            if isinstance(section, Mapping):
+                sections.append((root_source, section))
+        return sections
+
+    def _merge_items(self, layers):
+        """Merge the raw sections of layers into sorted (key, value) pairs
+
+        Subsections are returned as _Section of their layers. Only raw
+        data is walked, so neither sources nor subconfigs are created.
+        """
+        sections = defaultdict(list)
+        result = []
+        yielded = set()
+        accumulators = {}
+
+        for root_source, section in layers:
+            for key, value in section.items():
+                strategy = self._strategy_map.get(key)
+
+                # identical keys from different sources that have
+                # dicts as values needs to be merged
+                if isinstance(value, Mapping) and not (
+                        strategy and strategy.folds_sections):
+                    # higher prio sources might override keys with
+                    # simple values that otherwise point to subsections
+                    if key in yielded:
                         msg = ("The key '%s' from '%s' specifies a"
-                               " non-sectional value which conflicts"
+                               " subsection as value which conflicts"
                                " with a higher prioritized source"
                                " that wants the same value to be a"
-                               " subsection instead.")
+                               " non-sectional instead")
                         raise ValueError(msg % (key,
                             root_source._meta.source_name))
+                    sections[key].append((root_source, value))
+                    continue
+
+                if key in sections:
+                    msg = ("The key '%s' from '%s' specifies a"
+                           " non-sectional value which conflicts"
+                           " with a higher prioritized source"
+                           " that wants the same value to be a"
+                           " subsection instead.")
+                    raise ValueError(msg % (key,
+                        root_source._meta.source_name))
+
+                if isinstance(value, Mapping):
+                    value = self._type_section(
+                        [(source, subsection[key])
+                         for source, subsection in layers
+                         if isinstance(subsection.get(key), Mapping)],
+                        root_source, value)
+                elif not root_source.is_typed():
+                    value = self._get_layered_typed_value(layers, key, value)
+
+                # all other identical keys will shadow
+                # subsequent keys
+                if strategy:
+                    if key not in accumulators:
+                        accumulators[key] = strategy.initialize()
+                    accumulators[key] = strategy.accumulate(
+                        accumulators[key], value)
+                elif key in yielded:
+                    continue
+                else:
+                    result.append((key, value))
+                    yielded.add(key)
 
-                    if not source.is_typed():
-                        value = self._get_typed_value(key, value)
-
-                    # all other identical keys will shadow
-                    # subsequent keys
-                    if key in self._strategy_map:
-                        strategy = self._strategy_map[key]
-                        results[key] = strategy(value, results.get(key))
-                    elif key in yielded:
-                        continue
-                    else:
-                        yield key, value
-                        yielded.add(key)
-
-            for key, value in results.items():
-                yield key, value
+        for key, accumulator in accumulators.items():
+            result.append((key, self._strategy_map[key].finalize(accumulator)))
 
-            for key, subqueue in subqueues.items():
-                yield key, self._make_subconfig(subqueue, key)
+        for key, sublayers in sections.items():
+            result.append((key, _Section(self, sublayers)))
 
-        return sorted(_items())
+        try:
+            return sorted(result, key=itemgetter(0))
+        except TypeError:
+            # keys of mixed types
+            return sorted(result, key=lambda item: sort_key(item[0]))
 
     def setdefault(self, name, value):
         try:
@@ -132,13 +473,287 @@ class LayeredConfig(object):
 
         return dict(_dump(self))
 
-    def _get_typed_value(self, key, value):
-        for root_source, source in self._typed_sources:
-            try:
-                typed_value = source[key]
-            except KeyError:
+    def dump_to(self, fh, format='json', **options):
+        """Stream the merged view into a file object
+
+        Sections are written out depth-first as they get merged instead
+        of building the complete tree first. They are merged from the
+        raw data of their parent sections, so the depth of the tree is
+        not limited by the recursion limit. Further options are passed
+        on to the writer (e.g. indent for json).
+        """
+        streaming.dump_to(
+            fh, self._merge_items(self._layer_sections()), format,
+            is_section=lambda value: isinstance(value, (_Section, Mapping)),
+            **options)
+
+    def freeze(self):
+        """Return an immutable copy of the merged and typed values
+
+        Values are read from frozen configs at plain attribute speed.
+        Freezing again only rebuilds the sections whose layers changed
+        since and takes over all others as they are.
+        """
+        if self._frozen is None:
+            self._frozen = {}
+        return self._freeze(self._frozen)
+
+    def _freeze(self, frozen):
+        keychain = tuple(self._keychain)
+        content_hash = self.content_hash()
+        cached = frozen.get(keychain)
+        if cached is not None and cached[0] == content_hash:
+            return cached[1]
+
+        data = {}
+        for key, value in self.items():
+            if isinstance(value, LayeredConfig):
+                value = value._freeze(frozen)
+            data[key] = value
+
+        result = freeze(data)
+        frozen[keychain] = (content_hash, result)
+        return result
+
+    def reload(self):
+        """Reload all sources and notify subscribers once"""
+        self._reloading = True
+        try:
+            for source in self._source_list:
+                source.reload()
+        finally:
+            self._reloading = False
+        self._publish_changes()
+
+    def subscribe(self, path_pattern, callback):
+        """Call callback(path, old, new) when a matching value changes
+
+        The pattern is matched against the dotted keypath, relative to
+        this config, with fnmatch. Keys that were added or removed get
+        layeredconfig.diff.MISSING as old or new value. Callbacks run
+        in the thread that changed the data, which is a background
+        thread for the revalidation of cache files and for watched
+        sources.
+        """
+        if not self._subscriptions:
+            self._subscriptions = []
+            self._merged_hashes = {}
+            self._merged = self._dump_changes(None, self._merged_hashes)
+            for source in self._source_list:
+                source.add_listener(self._on_source_change)
+        self._subscriptions.append((path_pattern, callback))
+
+    def unsubscribe(self, callback):
+        self._subscriptions = [(pattern, subscriber) for pattern, subscriber
+                               in self._subscriptions
+                               if subscriber != callback]
+        if not self._subscriptions:
+            self._merged = None
+            self._merged_hashes = None
+            for source in self._source_list:
+                source.remove_listener(self._on_source_change)
+
+    def _on_source_change(self, source):
+        if not self._reloading:
+            self._publish_changes()
+
+    def _publish_changes(self):
+        if not self._subscriptions:
+            return
+
+        merged = self._dump_changes(self._merged, self._merged_hashes)
+        changes = list(diff(self._merged, merged))
+        self._merged = merged
+
+        for keypath, old, new in changes:
+            if not keypath:
+                continue
+            path = '.'.join('%s' % key for key in keypath)
+            for pattern, callback in self._subscriptions:
+                if fnmatch.fnmatchcase(path, pattern):
+                    callback(path, old, new)
+
+    def _dump_changes(self, previous, hashes):
+        """Dump the merged view but reuse the unchanged parts of previous
+
+        hashes maps keychains to the content hashes of the subconfigs
+        that previous was built from. Subtrees whose layers still have
+        the same hashes are taken over as they are, which lets the diff
+        skip them by identity.
+        """
+        keychain = tuple(self._keychain)
+        content_hash = self.content_hash()
+        if previous is not None and hashes.get(keychain) == content_hash:
+            return previous
+        hashes[keychain] = content_hash
+
+        result = {}
+        for key, value in self.items():
+            if isinstance(value, LayeredConfig):
+                subprevious = None
+                if isinstance(previous, dict):
+                    subprevious = previous.get(key)
+                value = value._dump_changes(subprevious, hashes)
+            result[key] = value
+        return result
+
+    def content_hash(self):
+        """Return a hash over the contents of all layers
+
+        Equal hashes guarantee an equal merged view, which allows to
+        check for changes without merging anything. Strategies and
+        custom types are identified by object, so the hash is only
+        meaningful within the same process.
+        """
+        return self._content_hash(lambda source: source.content_hash())
+
+    def _known_content_hash(self):
+        """Return the content hash if all layers know theirs or None"""
+        return self._content_hash(
+            lambda source: source._known_content_hash())
+
+    def _content_hash(self, layer_hash):
+        sha = hashlib.sha1()
+        for root_source, source in self._sources:
+            digest = layer_hash(source)
+            if digest is None:
+                return None
+            layer = '%s:%s:%s:%r;' % (
+                root_source._meta.source_name, source.is_typed(), digest,
+                sorted((key, id(converter)) for key, converter
+                       in root_source._custom_types.items()))
+            sha.update(layer.encode('utf-8'))
+
+        strategies = sorted((key, id(strategy)) for key, strategy
+                            in self._strategy_map.items())
+        sha.update(repr(strategies).encode('utf-8'))
+        return sha.hexdigest()
+
+    def explain(self, path):
+        """Return the provenance of the value at a dotted keypath"""
+        if not isinstance(path, six.string_types):
+            path = '.'.join(path)
+
+        try:
+            return self.provenance()[path]
+        except KeyError:
+            raise KeyError("Key '%s' was not found" % path)
+
+    def provenance(self):
+        """Return the provenance of every value by dotted keypath
+
+        Every entry tells which source supplied the value, which
+        sources got shadowed by it and how the value was converted
+        from its raw type, if at all. With strategies, the shadowed
+        values also contributed to the result. The index is built in
+        one pass over all layers and reused until any layer changes.
+        """
+        content_hash = self.content_hash()
+        if self._provenance is None or self._provenance[0] != content_hash:
+            self._provenance = (content_hash, self._build_provenance())
+        return self._provenance[1]
+
+    def _build_provenance(self):
+        layers = []
+        for position in reversed(range(len(self._source_list))):
+            root_source = self._source_list[position]
+            source = self._traverse(root_source)
+            if source is None:
                 continue
+            # unnamed sources are labeled by their position in the layers
+            label = root_source._label or '%s#%d' % (
+                root_source._meta.source_name, position)
+            layers.append(((root_source, label), source._get_data()))
+
+        index = {}
+        stack = [((), layers)]
+        while stack:
+            keypath, sections = stack.pop()
+
+            keys, seen = [], set()
+            for layer, section in sections:
+                for key in section:
+                    if key not in seen:
+                        seen.add(key)
+                        keys.append(key)
+
+            for key in keys:
+                candidates = [(layer, section[key])
+                              for layer, section in sections
+                              if key in section]
+
+                strategy = self._strategy_map.get(key)
+                folds_sections = strategy and strategy.folds_sections
+                values = [(layer, value) for layer, value in candidates
+                          if folds_sections or
+                          not isinstance(value, Mapping)]
+
+                if not values:
+                    stack.append((keypath + (key,), candidates))
+                    continue
+
+                path = '.'.join('%s' % part for part in keypath + (key,))
+                index[path] = self._resolve_provenance(
+                    keypath + (key,), values, candidates, sections, strategy)
+
+        return index
+
+    def _resolve_provenance(self, keypath, values, candidates, sections,
+                            strategy):
+        key = keypath[-1]
+
+        def resolve(root_source, raw_value):
+            if isinstance(raw_value, Mapping):
+                return self._type_section(
+                    [(source, section[key])
+                     for (source, _), section in sections
+                     if isinstance(section.get(key), Mapping)],
+                    root_source, raw_value)
+
+            value = root_source._to_custom_type(key, raw_value)
+            if root_source.is_typed():
+                return value
 
+            for (typed_source, _), section in sections:
+                typed_value = section.get(key)
+                if (typed_source.is_typed() and key in section and
+                        not isinstance(typed_value, Mapping)):
+                    typed_value = typed_source._to_custom_type(key,
+                                                               typed_value)
+                    type_info = self._get_type_info(typed_value)
+                    return self._convert_value_to_type(value, type_info)
+            return value
+
+        (root_source, label), raw_value = values[0]
+        value = resolve(root_source, raw_value)
+
+        coercion = None
+        if type(value) is not type(raw_value):
+            coercion = (type(raw_value).__name__, type(value).__name__)
+
+        if strategy:
+            accumulator = strategy.initialize()
+            for (source, _), raw in values:
+                accumulator = strategy.accumulate(accumulator,
+                                                  resolve(source, raw))
+            value = strategy.finalize(accumulator)
+
+        origin = Origin(root_source._meta.source_name, label, raw_value)
+        shadowed = [Origin(source._meta.source_name, source_label, raw)
+                    for (source, source_label), raw in candidates
+                    if source is not root_source]
+        return Provenance(keypath, value, origin, shadowed, coercion)
+
+    def _get_layered_typed_value(self, layers, key, value):
+        """Convert value to the type of key in the first typed layer"""
+        for root_source, section in layers:
+            if not root_source.is_typed() or key not in section:
+                continue
+            typed_value = section[key]
+            if isinstance(typed_value, Mapping):
+                continue
+
+            typed_value = root_source._to_custom_type(key, typed_value)
             type_info = self._get_type_info(typed_value)
             return self._convert_value_to_type(value, type_info)
         return value
@@ -159,43 +774,18 @@ class LayeredConfig(object):
         return self[key]
 
     def __getitem__(self, key):
-        # will be used as input for a new sublevel config with the
-        # key added to the keychain.
-        subqueue = deque()
-
-        strategy = self._strategy_map.get(key)
-        result = None
-
-        for root_source, source in self._sources:
-            try:
-                value = source[key]
-            except KeyError:
-                continue
-
-            if isinstance(value, Source):
-                subqueue.appendleft(root_source)
-                continue
-
-            if not source.is_typed():
-                value = self._get_typed_value(key, value)
-
-            if strategy:
-                result = strategy(value, result)
-            else:
-                return value
-
-        # in the while loop we always ended up in any of the continue
-        # statements which means either the key was not found or the key
-        # is a sublevel source or it is untyped.
-        if result:
-            return result
-        elif subqueue:
-            return self._make_subconfig(subqueue, key)
-        else:
+        try:
+            return self._resolve(_Layers(self._source_list, self._keychain),
+                                 (key,))
+        except KeyError:
             raise KeyError("Key '%s' was not found" % key)
 
     def __setattr__(self, attr, value):
-        self[attr] = value
+        # internal attributes skip the lookup of the source to write to
+        if self._initialized is False or attr in self.__dict__:
+            object.__setattr__(self, attr, value)
+        else:
+            self[attr] = value
 
     def __setitem__(self, key, value):
         if any([self._initialized is False,
@@ -218,12 +808,18 @@ class LayeredConfig(object):
                     return
 
             # no source was found so write it to first writable source
-            if writable_source:
+            if writable_source is not None:
                 writable_source[key] = value
             else:
                 raise TypeError('No writable sources found')
 
     def __eq__(self, other):
+        if isinstance(other, LayeredConfig):
+            # hashing takes longer than dumping, so only hashes that
+            # are known already are used
+            known = self._known_content_hash()
+            if known is not None and known == other._known_content_hash():
+                return True
         return self.dump() == other.dump()
 
     def __len__(self):
@@ -240,3 +836,14 @@ class LayeredConfig(object):
 
     def __repr__(self):
         return repr(self.dump())
+
+
+class ConfigSnapshot(LayeredConfig):
+    """Immutable version of a config, see LayeredConfig.snapshot()"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        # drop the pinned data
+        self._source_list = ()
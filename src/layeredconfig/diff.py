@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+from .source import Mapping, sort_key
+
+
+class _Missing(object):
+    """Marks keys which only exist on one side of a diff"""
+
+    def __repr__(self):
+        return '<missing>'
+
+    def __bool__(self):
+        return False
+    __nonzero__ = __bool__
+
+
+MISSING = _Missing()
+
+
+def diff(old, new):
+    """Yield (keypath, old, new) for every value that differs
+
+    Sections are reported before the changes within them. Subtrees
+    which compare equal are skipped without descending into them.
+    """
+    stack = [((), old, new)]
+
+    while stack:
+        keypath, old, new = stack.pop()
+        if old is new or old == new:
+            continue
+
+        yield keypath, old, new
+
+        if isinstance(old, Mapping) and isinstance(new, Mapping):
+            keys = sorted(set(old) | set(new), key=sort_key, reverse=True)
+            stack.extend((keypath + (key,),
+                          old.get(key, MISSING),
+                          new.get(key, MISSING)) for key in keys)
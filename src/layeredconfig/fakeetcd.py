@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+import time
+from collections import deque
+
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import parse_qs, urlsplit
+
+_PREFIX = '/v2/keys'
+# etcd keeps the last 1000 events for watches
+_HISTORY = 1000
+
+
+class EtcdError(Exception):
+
+    def __init__(self, status, code, message, cause):
+        super(EtcdError, self).__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+        self.cause = cause
+
+
+class FakeEtcd(object):
+    """In-process stand-in for an etcd v2 server
+
+    It serves the keys api on a local port until it gets stopped,
+    including recursive listings, compare-and-swap through prevIndex
+    and prevExist as well as watches through wait and waitIndex.
+    Setting `latency` delays every response by that many seconds and
+    setting `failures` answers that many upcoming requests with
+    `failure_status` instead.
+
+        with FakeEtcd() as etcd:
+            store = EtcdStore(etcd.url)
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.latency = 0
+        self.failures = 0
+        self.failure_status = 500
+        self.requests = 0
+
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._stopping = False
+        self._index = 1
+        # (index, key, result) of the latest changes
+        self._events = deque(maxlen=_HISTORY)
+        self._root = {'key': '/', 'dir': True, 'nodes': {},
+                      'createdIndex': 0, 'modifiedIndex': 0}
+
+        self._server = _Server((host, port), _Handler)
+        self._server.etcd = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://%s:%d/v2' % (host, port)
+
+    @property
+    def index(self):
+        return self._index
+
+    def start(self):
+        self._stopping = False
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._changed:
+            # release all pending watches
+            self._stopping = True
+            self._changed.notify_all()
+
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def get(self, key, recursive=False):
+        with self._lock:
+            node = self._find(key)
+            return {'action': 'get',
+                    'node': self._render(node, recursive, True)}
+
+    def set(self, key, value=None, dir=False, prev_index=None,
+            prev_exist=None):
+        with self._lock:
+            try:
+                node = self._find(key)
+            except EtcdError:
+                node = None
+
+            if prev_exist is True and node is None:
+                raise EtcdError(404, 100, 'Key not found', key)
+            if prev_exist is False and node is not None:
+                raise EtcdError(412, 105, 'Key already exists', key)
+            if prev_index is not None and (
+                    node is None or node['modifiedIndex'] != prev_index):
+                raise EtcdError(412, 101, 'Compare failed',
+                                '[%s != %s]' % (prev_index, node and
+                                                node['modifiedIndex']))
+            if node is not None and node.get('dir'):
+                raise EtcdError(403, 102, 'Not a file', key)
+
+            self._index += 1
+            parent, name = self._make_parents(key)
+            previous = node
+            node = {'key': self._normalize(key),
+                    'createdIndex': self._index,
+                    'modifiedIndex': self._index}
+            if previous is not None:
+                node['createdIndex'] = previous['createdIndex']
+            if dir:
+                node.update(dir=True, nodes={})
+            else:
+                node['value'] = value
+            parent['nodes'][name] = node
+
+            if prev_index is not None:
+                action = 'compareAndSwap'
+            elif previous is None:
+                action = 'create' if prev_exist is False else 'set'
+            else:
+                action = 'update' if prev_exist else 'set'
+
+            result = {'action': action, 'node': self._render(node)}
+            if previous is not None:
+                result['prevNode'] = self._render(previous)
+            self._record(node['key'], result)
+            return result
+
+    def delete(self, key, dir=False, recursive=False, prev_index=None):
+        with self._lock:
+            node = self._find(key)
+            if node is self._root:
+                raise EtcdError(403, 107, 'Root is read only', key)
+            if node.get('dir'):
+                if not dir and not recursive:
+                    raise EtcdError(403, 102, 'Not a file', key)
+                if node['nodes'] and not recursive:
+                    raise EtcdError(403, 108, 'Directory not empty', key)
+            if prev_index is not None and \
+                    node['modifiedIndex'] != prev_index:
+                raise EtcdError(412, 101, 'Compare failed',
+                                '[%s != %s]' % (prev_index,
+                                                node['modifiedIndex']))
+
+            self._index += 1
+            parent = self._find(key.rstrip('/').rsplit('/', 1)[0])
+            del parent['nodes'][node['key'].rsplit('/', 1)[-1]]
+
+            result = {'action': 'delete',
+                      'node': {'key': node['key'],
+                               'createdIndex': node['createdIndex'],
+                               'modifiedIndex': self._index},
+                      'prevNode': self._render(node)}
+            if node.get('dir'):
+                result['node']['dir'] = True
+            self._record(node['key'], result)
+            return result
+
+    def watch(self, key, recursive=False, wait_index=None, timeout=None):
+        """Return the first change of key at or after wait_index
+
+        Without wait_index the next change is awaited. With recursive
+        changes of all keys beneath key count as well. Returns None if
+        nothing changed within timeout seconds or the server stopped.
+        """
+        key = self._normalize(key)
+        deadline = None if timeout is None else time.time() + timeout
+
+        with self._changed:
+            if wait_index is None:
+                wait_index = self._index + 1
+
+            while not self._stopping:
+                if len(self._events) == self._events.maxlen and \
+                        wait_index < self._events[0][0]:
+                    raise EtcdError(
+                        400, 401,
+                        'The event in requested index is outdated and'
+                        ' cleared', 'the requested history has been'
+                        ' cleared [%d/%d]' % (self._events[0][0],
+                                              wait_index))
+
+                for index, event_key, result in self._events:
+                    if index >= wait_index and self._matches(
+                            key, event_key, recursive):
+                        return result
+
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return None
+                self._changed.wait(remaining)
+            return None
+
+    def _record(self, key, result):
+        self._events.append((self._index, key, result))
+        self._changed.notify_all()
+
+    def _matches(self, key, event_key, recursive):
+        if event_key == key:
+            return True
+        return recursive and (key == '/' or
+                              event_key.startswith(key + '/'))
+
+    def _normalize(self, key):
+        return '/' + '/'.join(part for part in key.split('/') if part)
+
+    def _find(self, key):
+        node = self._root
+        for part in self._normalize(key).split('/')[1:]:
+            if not part:
+                continue
+            if not node.get('dir'):
+                raise EtcdError(400, 104, 'Not a directory', key)
+            try:
+                node = node['nodes'][part]
+            except KeyError:
+                raise EtcdError(404, 100, 'Key not found', key)
+        return node
+
+    def _make_parents(self, key):
+        parts = self._normalize(key).split('/')[1:]
+        node = self._root
+        for end, part in enumerate(parts[:-1]):
+            child = node['nodes'].get(part)
+            if child is None:
+                child = node['nodes'][part] = {
+                    'key': '/' + '/'.join(parts[:end + 1]),
+                    'dir': True, 'nodes': {},
+                    'createdIndex': self._index,
+                    'modifiedIndex': self._index}
+            elif not child.get('dir'):
+                raise EtcdError(400, 104, 'Not a directory', key)
+            node = child
+        return node, parts[-1]
+
+    def _render(self, node, recursive=False, expand=False):
+        result = dict((key, value) for key, value in node.items()
+                      if key != 'nodes')
+        if node is self._root:
+            del result['key']
+            del result['createdIndex']
+            del result['modifiedIndex']
+
+        if node.get('dir') and (expand or recursive):
+            result['nodes'] = [self._render(child, recursive, recursive)
+                               for child in node['nodes'].values()]
+        return result
+
+
+class _Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        def get(etcd, key, params, form):
+            if not _flag(params, 'wait'):
+                return etcd.get(key, recursive=_flag(params, 'recursive'))
+
+            wait_index = params.get('waitIndex')
+            return etcd.watch(
+                key, recursive=_flag(params, 'recursive'),
+                wait_index=int(wait_index) if wait_index else None)
+        self._handle(get)
+
+    def do_PUT(self):
+        def put(etcd, key, params, form):
+            prev_index = params.get('prevIndex')
+            prev_exist = params.get('prevExist')
+            return etcd.set(
+                key, form.get('value'),
+                dir=_flag(form, 'dir') or _flag(params, 'dir'),
+                prev_index=int(prev_index) if prev_index else None,
+                prev_exist=None if prev_exist is None else
+                prev_exist == 'true')
+        self._handle(put)
+
+    def do_DELETE(self):
+        def delete(etcd, key, params, form):
+            prev_index = params.get('prevIndex')
+            return etcd.delete(
+                key, dir=_flag(params, 'dir'),
+                recursive=_flag(params, 'recursive'),
+                prev_index=int(prev_index) if prev_index else None)
+        self._handle(delete)
+
+    def _handle(self, action):
+        etcd = self.server.etcd
+        url = urlsplit(self.path)
+        params = _single(parse_qs(url.query))
+
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8') if length else ''
+        form = _single(parse_qs(body))
+
+        with etcd._lock:
+            etcd.requests += 1
+            failing = etcd.failures > 0
+            if failing:
+                etcd.failures -= 1
+
+        if etcd.latency:
+            time.sleep(etcd.latency)
+
+        if failing:
+            return self._respond(etcd.failure_status, {
+                'errorCode': 300, 'message': 'Raft Internal Error',
+                'index': etcd.index})
+
+        if not url.path.startswith(_PREFIX):
+            return self._respond(404, {'errorCode': 100,
+                                       'message': 'Key not found',
+                                       'cause': url.path,
+                                       'index': etcd.index})
+
+        key = url.path[len(_PREFIX):] or '/'
+        try:
+            result = action(etcd, key, params, form)
+        except EtcdError as error:
+            return self._respond(error.status, {
+                'errorCode': error.code, 'message': error.message,
+                'cause': error.cause, 'index': etcd.index})
+
+        if result is None:
+            # a watch that got cancelled by stopping the server
+            self.close_connection = True
+            return
+
+        status = 201 if result['action'] == 'create' else 200
+        self._respond(status, result)
+
+    def _respond(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('X-Etcd-Index', str(self.server.etcd.index))
+            self.end_headers()
+            self.wfile.write(body)
+        except (IOError, OSError):
+            # the client gave up waiting
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _single(params):
+    return dict((key, values[-1]) for key, values in params.items())
+
+
+def _flag(params, name):
+    return params.get(name) in ('true', 'True', '1')
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import keyword
+import re
+import threading
+from collections import OrderedDict
+
+import six
+
+from .source import Mapping, sort_key
+
+_IDENTIFIER = re.compile(r'^[A-Za-z][A-Za-z0-9_]*$')
+
+# generated classes by the keys of their sections, least recently used
+# first. Sections of ever new shapes must not grow it without bounds.
+_classes = OrderedDict()
+_classes_lock = threading.Lock()
+_MAX_CLASSES = 1024
+
+
+class FrozenConfig(Mapping):
+    """Immutable, merged section of a config
+
+    Values are stored in slots so that reading them is as fast as any
+    other attribute access. Keys which are no valid attribute names or
+    clash with methods can only be read by item access.
+    """
+
+    __slots__ = ()
+
+    # key -> slot name
+    _slot_names = {}
+
+    def __getitem__(self, key):
+        try:
+            name = self._slot_names[key]
+        except (KeyError, TypeError):
+            raise KeyError("Key '%s' was not found" % key)
+        return getattr(self, name)
+
+    def __iter__(self):
+        return iter(self._slot_names)
+
+    def __len__(self):
+        return len(self._slot_names)
+
+    def __setattr__(self, attr, value):
+        raise AttributeError('Frozen configs cannot be changed')
+
+    def __delattr__(self, attr):
+        raise AttributeError('Frozen configs cannot be changed')
+
+    def dump(self):
+        return dict((key, value.dump() if isinstance(value, FrozenConfig)
+                     else value) for key, value in self.items())
+
+    def __reduce__(self):
+        return (freeze, (self.dump(),))
+
+    def __repr__(self):
+        return 'FrozenConfig(%r)' % self.dump()
+
+
+def _slot_name(key, position):
+    if isinstance(key, six.string_types) and _IDENTIFIER.match(key) and \
+            not keyword.iskeyword(key) and not hasattr(FrozenConfig, key):
+        return str(key)
+    return '_slot%d' % position
+
+
+def _make_class(keys):
+    names = tuple(_slot_name(key, position)
+                  for position, key in enumerate(keys))
+
+    def __init__(self, *values):
+        for name, value in zip(names, values):
+            object.__setattr__(self, name, value)
+
+    return type('FrozenConfig', (FrozenConfig,), {
+        '__slots__': names,
+        '__init__': __init__,
+        '_slot_names': dict(zip(keys, names)),
+    })
+
+
+def frozen_class(keys):
+    """Return the frozen config class for sections with the given keys"""
+    keys = tuple(keys)
+    with _classes_lock:
+        cls = _classes.pop(keys, None)
+        if cls is None:
+            cls = _make_class(keys)
+            if len(_classes) >= _MAX_CLASSES:
+                _classes.popitem(last=False)
+        _classes[keys] = cls
+    return cls
+
+
+def freeze(data):
+    """Return a frozen config of a (nested) mapping"""
+    if isinstance(data, FrozenConfig):
+        return data
+
+    try:
+        keys = sorted(data)
+    except TypeError:
+        # keys of mixed types
+        keys = sorted(data, key=sort_key)
+    return frozen_class(keys)(*[
+        freeze(data[key]) if isinstance(data[key], Mapping) else data[key]
+        for key in keys])
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import struct
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    # py<3.3
+    from collections import Mapping
+
+from layeredconfig import packed
+
+_LENGTH = struct.Struct('<I')
+
+
+def content_hash(value):
+    """Return a hex digest of a (nested) value"""
+    return HashCache().digest((), value)
+
+
+def _encode(value):
+    """Return the bytes of a scalar value tagged with its type"""
+    try:
+        return bytes(packed.pack(value))
+    except TypeError:
+        return ('%s:%r' % (type(value).__name__, value)).encode('utf-8')
+
+
+def _scalar_hash(value):
+    return hashlib.sha1(_encode(value)).hexdigest()
+
+
+class HashCache(object):
+    """Merkle hashes of sections by keypath
+
+    Hashes are kept along with a stamp which tells the version of the
+    data they belong to, like the generation or the fingerprint of a
+    source, and are only reused for the same stamp. Nothing is kept for
+    data without a stamp. Writes drop the hashes on the path to the
+    changed value with invalidate() so that only that path gets hashed
+    again.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        # changes with every invalidation so that hashes of data read
+        # before are not stored afterwards
+        self._epoch = 0
+
+    def clear(self):
+        self._epoch += 1
+        self._entries = {}
+
+    def invalidate(self, keypath):
+        """Drop the hashes of keypath, of its parents and of its subtree"""
+        keypath = tuple(keypath)
+        length = len(keypath)
+        epoch, self._epoch = self._epoch, self._epoch + 1
+
+        entries = {}
+        for path, ((entry_epoch, stamp), digest) in self._entries.items():
+            if entry_epoch != epoch:
+                continue
+            if path[:length] == keypath or keypath[:len(path)] == path:
+                continue
+            entries[path] = ((self._epoch, stamp), digest)
+        self._entries = entries
+
+    def version(self, stamp):
+        """Return the version to pass to get() and digest()
+
+        It must be taken before the data is read.
+        """
+        if stamp is None:
+            return None
+        return (self._epoch, stamp)
+
+    def get(self, keypath, version):
+        """Return the known hash of keypath or None"""
+        if version is None:
+            return None
+        entry = self._entries.get(keypath)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        return None
+
+    def digest(self, keypath, value, version=None):
+        if not isinstance(value, Mapping):
+            return _scalar_hash(value)
+
+        digest = self.get(keypath, version)
+        if digest is not None:
+            return digest
+
+        # keys of mixed types cannot be sorted but their encodings can
+        sha = hashlib.sha1(b'd')
+        for encoded, key in sorted(((_encode(key), key) for key in value),
+                                   key=lambda item: item[0]):
+            sha.update(_LENGTH.pack(len(encoded)) + encoded)
+            sha.update(self.digest(keypath + (key,), value[key], version)
+                       .encode('ascii'))
+
+        digest = sha.hexdigest()
+        if version is not None:
+            self._entries[keypath] = (version, digest)
+        return digest
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+import six
+from six.moves import intern
+
+# longer strings are rarely repeated and would only be pinned in memory
+MAX_STRING_LENGTH = 64
+# bounds the table of interned numbers
+MAX_NUMBERS = 1 << 16
+
+_numbers = {}
+_numbers_lock = threading.Lock()
+
+
+def intern_key(key):
+    """Return the shared instance of a key string"""
+    if type(key) is str:
+        return intern(key)
+    return key
+
+
+def intern_value(value):
+    """Return a shared instance of short strings and numbers
+
+    Other values are returned as they are.
+    """
+    kind = type(value)
+    if kind is str:
+        if len(value) <= MAX_STRING_LENGTH:
+            return intern(value)
+        return value
+
+    if kind in six.integer_types or kind is float and value:
+        # bools and small ints are singletons already. Zero floats are
+        # skipped since 0.0 and -0.0 compare equal.
+        key = (kind, value)
+        shared = _numbers.get(key)
+        if shared is not None:
+            return shared
+        if len(_numbers) < MAX_NUMBERS:
+            with _numbers_lock:
+                return _numbers.setdefault(key, value)
+    return value
+
+
+def intern_pairs(pairs):
+    """Build a dict of interned (key, value) pairs
+
+    Can be used as object_pairs_hook while parsing json.
+    """
+    return dict((intern_key(key), intern_value(value))
+                for key, value in pairs)
+
+
+def intern_data(data):
+    """Intern all keys and values of a nested dict in place"""
+    stack = [data]
+    while stack:
+        section = stack.pop()
+        items = list(section.items())
+        section.clear()
+        for key, value in items:
+            if isinstance(value, dict):
+                stack.append(value)
+            elif isinstance(value, list):
+                stack.extend(item for item in value if isinstance(item, dict))
+                value[:] = [item if isinstance(item, dict)
+                            else intern_value(item) for item in value]
+            else:
+                value = intern_value(value)
+            section[intern_key(key)] = value
+    return data
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+import threading
+
+
+class RWLock(object):
+    """Reader/writer lock
+
+    Many threads may read at the same time while writers get exclusive
+    access. Waiting writers block new readers so that they do not
+    starve. Both locks are reentrant and the writing thread may also
+    acquire the read lock.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = {}
+        self._writer = None
+        self._writer_count = 0
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        me = threading.current_thread()
+
+        with self._condition:
+            if self._writer is not me and me not in self._readers:
+                while self._writer is not None or self._waiting_writers:
+                    self._condition.wait()
+            self._readers[me] = self._readers.get(me, 0) + 1
+
+    def release_read(self):
+        me = threading.current_thread()
+
+        with self._condition:
+            count = self._readers.pop(me) - 1
+            if count:
+                self._readers[me] = count
+            elif not self._readers:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        me = threading.current_thread()
+
+        with self._condition:
+            if self._writer is me:
+                self._writer_count += 1
+                return
+
+            if me in self._readers:
+                raise RuntimeError('Cannot upgrade a read lock to a'
+                                   ' write lock')
+
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+            finally:
+                self._waiting_writers -= 1
+
+            self._writer = me
+            self._writer_count = 1
+
+    def release_write(self):
+        with self._condition:
+            self._writer_count -= 1
+            if not self._writer_count:
+                self._writer = None
+                self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def reading(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def writing(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
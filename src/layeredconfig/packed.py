@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""Flat binary encoding of nested config data
+
+A packed value starts with a one byte tag followed by its payload.
+Sections store a table of (key offset, key length, value offset)
+entries sorted by key, followed by the key bytes and the values. All
+offsets are absolute positions within the buffer so that a section can
+be looked up directly from a memory-mapped file or shared memory
+without decoding anything else.
+"""
+
+import struct
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    # py<3.3
+    from collections import Mapping
+
+import six
+
+_COUNT = struct.Struct('<I')
+_ENTRY = struct.Struct('<III')
+_INT = struct.Struct('<q')
+_FLOAT = struct.Struct('<d')
+
+_INT_MIN, _INT_MAX = -2**63, 2**63 - 1
+
+
+def pack(data, offset=0):
+    """Encode data into a bytearray
+
+    The first `offset` bytes are left empty for a header so that the
+    positions within the result stay valid when it is stored as is.
+    """
+    out = bytearray(offset)
+    _pack_value(data, out)
+    return out
+
+
+def unpack(value):
+    """Recursively convert packed mappings into plain dicts"""
+    if isinstance(value, PackedMapping):
+        return dict((key, unpack(subvalue))
+                    for key, subvalue in value.items())
+    return value
+
+
+def _pack_value(value, out):
+    offset = len(out)
+
+    if value is None:
+        out += b'N'
+    elif value is True:
+        out += b'T'
+    elif value is False:
+        out += b'F'
+    elif isinstance(value, six.integer_types):
+        if _INT_MIN <= value <= _INT_MAX:
+            out += b'i' + _INT.pack(value)
+        else:
+            _pack_bytes(b'I', str(value).encode('ascii'), out)
+    elif isinstance(value, float):
+        out += b'f' + _FLOAT.pack(value)
+    elif isinstance(value, six.text_type):
+        _pack_bytes(b's', value.encode('utf-8'), out)
+    elif isinstance(value, six.binary_type):
+        _pack_bytes(b'b', value, out)
+    elif isinstance(value, (list, tuple)):
+        _pack_list(value, out)
+    elif isinstance(value, Mapping):
+        _pack_mapping(value, out)
+    else:
+        raise TypeError('Cannot pack value of type %s'
+                        % type(value).__name__)
+
+    return offset
+
+
+def _pack_bytes(tag, data, out):
+    out += tag + _COUNT.pack(len(data))
+    out += data
+
+
+def _pack_list(values, out):
+    out += b'l' + _COUNT.pack(len(values))
+    table = len(out)
+    out += b'\0' * (_COUNT.size * len(values))
+
+    for index, value in enumerate(values):
+        _COUNT.pack_into(out, table + index * _COUNT.size,
+                         _pack_value(value, out))
+
+
+def _pack_mapping(mapping, out):
+    keys = sorted((_encode_key(key), key) for key in mapping)
+
+    out += b'd' + _COUNT.pack(len(keys))
+    table = len(out)
+    out += b'\0' * (_ENTRY.size * len(keys))
+
+    key_offsets = []
+    for encoded, key in keys:
+        key_offsets.append(len(out))
+        out += encoded
+
+    for index, (encoded, key) in enumerate(keys):
+        value_offset = _pack_value(mapping[key], out)
+        _ENTRY.pack_into(out, table + index * _ENTRY.size,
+                         key_offsets[index], len(encoded), value_offset)
+
+
+def _encode_key(key):
+    if not isinstance(key, six.string_types):
+        raise TypeError('Cannot pack non-string key %r' % (key,))
+    if isinstance(key, six.text_type):
+        return key.encode('utf-8')
+    return key
+
+
+def _decode_key(data):
+    key = data.decode('utf-8')
+    if six.PY2:
+        try:
+            return key.encode('ascii')
+        except UnicodeEncodeError:
+            pass
+    return key
+
+
+def _unpack_value(buf, pos, owner=None):
+    tag = buf[pos:pos+1]
+    pos += 1
+
+    if tag == b'N':
+        return None
+    elif tag == b'T':
+        return True
+    elif tag == b'F':
+        return False
+    elif tag == b'i':
+        return _INT.unpack_from(buf, pos)[0]
+    elif tag == b'f':
+        return _FLOAT.unpack_from(buf, pos)[0]
+    elif tag in (b's', b'b', b'I'):
+        length, = _COUNT.unpack_from(buf, pos)
+        data = bytes(buf[pos+_COUNT.size:pos+_COUNT.size+length])
+        if tag == b's':
+            return data.decode('utf-8')
+        elif tag == b'I':
+            return int(data)
+        return data
+    elif tag == b'l':
+        count, = _COUNT.unpack_from(buf, pos)
+        pos += _COUNT.size
+        return [unpack(_unpack_value(buf, offset)) for offset in
+                struct.unpack_from('<%dI' % count, buf, pos)]
+    elif tag == b'd':
+        return PackedMapping(buf, pos - 1, owner)
+
+    raise ValueError('Corrupted packed data at offset %d' % (pos - 1))
+
+
+class PackedMapping(Mapping):
+    """Read-only mapping that decodes values on access
+
+    The optional owner of the buffer is kept alive for as long as the
+    mapping or any of its subsections are in use.
+    """
+
+    def __init__(self, buf, offset=0, owner=None):
+        if buf[offset:offset+1] != b'd':
+            raise ValueError('No packed mapping at offset %d' % offset)
+
+        self._buf = buf
+        self._owner = owner
+        self._count, = _COUNT.unpack_from(buf, offset + 1)
+        self._table = offset + 1 + _COUNT.size
+
+    def _entry(self, index):
+        return _ENTRY.unpack_from(self._buf, self._table + index*_ENTRY.size)
+
+    def _key_at(self, index):
+        key_offset, key_length, _ = self._entry(index)
+        return bytes(self._buf[key_offset:key_offset+key_length])
+
+    def __getitem__(self, key):
+        try:
+            wanted = _encode_key(key)
+        except TypeError:
+            raise KeyError(key)
+
+        # keys are sorted by their encoded form so use a binary search
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle) < wanted:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self._count and self._key_at(low) == wanted:
+            return _unpack_value(self._buf, self._entry(low)[2], self._owner)
+        raise KeyError(key)
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield _decode_key(self._key_at(index))
+
+    def __len__(self):
+        return self._count
+
+    def items(self):
+        for index in range(self._count):
+            key_offset, key_length, value_offset = self._entry(index)
+            key = self._buf[key_offset:key_offset+key_length]
+            yield (_decode_key(bytes(key)),
+                   _unpack_value(self._buf, value_offset, self._owner))
+
+    def __repr__(self):
+        return repr(unpack(self))
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import math
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    # py<3.3
+    from collections import Mapping
+
+# sources with more keypaths get a bloom filter instead of an exact set
+EXACT_LIMIT = 50000
+ERROR_RATE = 0.01
+
+
+def iter_keypaths(data):
+    """Yield the keypaths of all sections and values of a nested dict"""
+    stack = [((), data)]
+    while stack:
+        keypath, section = stack.pop()
+        for key, value in section.items():
+            yield keypath + (key,)
+            if isinstance(value, Mapping):
+                stack.append((keypath + (key,), value))
+
+
+class ExactIndex(object):
+    """Set of all keypaths"""
+
+    kind = 'exact'
+
+    def __init__(self, keypaths):
+        self._keypaths = frozenset(keypaths)
+
+    def __len__(self):
+        return len(self._keypaths)
+
+    def might_contain(self, keypath):
+        return keypath in self._keypaths
+
+
+class BloomIndex(object):
+    """Bloom filter of keypaths
+
+    Keypaths that were added are always reported as present while
+    absent ones are reported as present with a probability of about
+    error_rate.
+    """
+
+    kind = 'bloom'
+
+    def __init__(self, keypaths, error_rate=ERROR_RATE):
+        keypaths = list(keypaths)
+        count = max(len(keypaths), 1)
+
+        self._size = int(math.ceil(-count * math.log(error_rate) /
+                                   math.log(2) ** 2))
+        self._hashes = max(int(round(float(self._size) / count *
+                                     math.log(2))), 1)
+        self._bits = bytearray((self._size + 7) // 8)
+        self._count = len(keypaths)
+
+        for keypath in keypaths:
+            for position in self._positions(keypath):
+                self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __len__(self):
+        return self._count
+
+    def _positions(self, keypath):
+        # double hashing derives all positions from a single hash
+        value = hash(keypath) & 0xffffffffffffffff
+        first, second = value & 0xffffffff, (value >> 32) | 1
+        for index in range(self._hashes):
+            yield (first + index * second) % self._size
+
+    def might_contain(self, keypath):
+        bits = self._bits
+        for position in self._positions(keypath):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+def build_index(data, kind=True):
+    """Return an exact or bloom index of the keypaths within data
+
+    With kind=True, sources with more than EXACT_LIMIT keypaths get a
+    bloom filter and all others an exact index.
+    """
+    keypaths = list(iter_keypaths(data))
+    if kind == 'bloom' or kind is True and len(keypaths) > EXACT_LIMIT:
+        return BloomIndex(keypaths)
+    if kind in ('exact', True):
+        return ExactIndex(keypaths)
+    raise ValueError("Unknown index kind '%s'" % kind)
@@ -0,0 +1,405 @@
+# -*- coding: utf-8 -*-
+"""Profile the access to a stack of config sources
+
+Sources are given as kind:argument specs, lowest priority first, in
+the same order as they are passed to LayeredConfig:
+
+    python -m layeredconfig profile json:defaults.json env:MYAPP_ \\
+        etcd:http://127.0.0.1:2379/v2 --lookups 10000
+
+Known kinds are json, yaml and ini files, dir for conf.d directories,
+env for environment variable prefixes, etcd for etcd urls and
+fake-etcd for an in-process etcd that is seeded with the contents of
+a json file.
+
+Writes go into temporary copies of the files, unless --in-place is
+given. Writes into etcd urls need --in-place.
+"""
+
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import random
+import shutil
+import sys
+import tempfile
+from collections import defaultdict
+from timeit import default_timer
+
+import six
+
+from layeredconfig import (DirectorySource, Environment, EtcdStore, INIFile,
+                           JsonFile, LayeredConfig, YamlFile)
+from layeredconfig.source import Mapping, Source
+
+WORKLOADS = ('lookup', 'iterate', 'dump', 'write')
+
+
+class SourceStats(object):
+    """Read counts and read times of a source"""
+
+    def __init__(self, label):
+        self.label = label
+        self.reads = 0
+        self.seconds = 0.0
+
+    def reset(self):
+        self.reads = 0
+        self.seconds = 0.0
+
+
+def instrument(source, label):
+    """Count and time the reads of a source and return its stats"""
+    stats = SourceStats(label)
+    read = source._read
+
+    def timed_read():
+        began = default_timer()
+        try:
+            return read()
+        finally:
+            stats.reads += 1
+            stats.seconds += default_timer() - began
+
+    # bypass the attribute handling of sources which would store
+    # the function as user data
+    source.__dict__['_read'] = timed_read
+    return stats
+
+
+def _fake_etcd(argument, kwargs):
+    from layeredconfig.fakeetcd import FakeEtcd
+
+    etcd = FakeEtcd().start()
+    if argument:
+        with open(argument) as fh:
+            data = json.load(fh)
+        for keypath, value in iter_leaves(data):
+            if not isinstance(value, six.string_types):
+                value = json.dumps(value)
+            etcd.set('/' + '/'.join(keypath), value)
+    return EtcdStore(etcd.url, **kwargs), etcd
+
+
+_FACTORIES = {
+    'json': lambda argument, kwargs: JsonFile(argument, **kwargs),
+    'yaml': lambda argument, kwargs: YamlFile(argument, **kwargs),
+    'ini': lambda argument, kwargs: INIFile(argument, **kwargs),
+    'dir': lambda argument, kwargs: DirectorySource(argument, **kwargs),
+    'env': lambda argument, kwargs: Environment(argument, **kwargs),
+    'etcd': lambda argument, kwargs: EtcdStore(argument, **kwargs),
+}
+
+
+def make_source(spec, **kwargs):
+    """Return the source of a spec and the fake etcd it needs, if any"""
+    kind, _, argument = spec.partition(':')
+    kwargs.setdefault('name', spec)
+
+    if kind == 'fake-etcd':
+        return _fake_etcd(argument, kwargs)
+    try:
+        factory = _FACTORIES[kind]
+    except KeyError:
+        raise ValueError("Unknown source kind '%s'" % kind)
+    return factory(argument, kwargs), None
+
+
+# kinds of sources whose files are copied for writes
+_COPIED_KINDS = ('json', 'yaml', 'ini', 'dir')
+# kinds of sources whose writes stay within the process
+_LOCAL_KINDS = ('env', 'fake-etcd')
+
+
+def copy_for_writes(spec, directory):
+    """Return the spec of a copy of the files of a source in directory"""
+    kind, _, argument = spec.partition(':')
+    if kind in _LOCAL_KINDS:
+        return spec
+    if kind not in _COPIED_KINDS:
+        raise ValueError("Writes into '%s' need --in-place" % spec)
+
+    copy = os.path.join(tempfile.mkdtemp(dir=directory),
+                        os.path.basename(os.path.normpath(argument)))
+    if kind == 'dir':
+        shutil.copytree(argument, copy)
+    else:
+        shutil.copy(argument, copy)
+    return '%s:%s' % (kind, copy)
+
+
+def iter_leaves(data, keypath=()):
+    for key, value in sorted(data.items()):
+        if isinstance(value, Mapping):
+            for leaf in iter_leaves(value, keypath + (key,)):
+                yield leaf
+        else:
+            yield keypath + (key,), value
+
+
+def lookup(config, keypath):
+    value = config
+    for key in keypath:
+        value = value[key]
+    return value
+
+
+def make_data(size):
+    """Return a config of size values in sections of ten"""
+    return dict(('section%d' % section,
+                 dict(('key%d' % key, 'value%d' % key) for key in range(10)))
+                for section in range(max(size // 10, 1)))
+
+
+def measure_memory(operation, repeat=5):
+    """Return the peak bytes, retained bytes and retained blocks of a call
+
+    Every value is the minimum over several calls after a first one
+    which leaves out one-off allocations like filling caches. Garbage
+    and free lists are collected before counting retained memory.
+    """
+    import gc
+    import tracemalloc
+
+    operation()
+
+    results = []
+    for _ in range(repeat):
+        tracemalloc.start()
+        try:
+            operation()
+            gc.collect()
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        blocks = sum(stat.count for stat in snapshot.statistics('filename'))
+        results.append((peak, current, blocks))
+    return tuple(min(column) for column in zip(*results))
+
+
+def percentile(samples, fraction):
+    """Return the sample below which the given fraction of samples lie"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(int(fraction * len(ordered)), len(ordered) - 1)
+    return ordered[index]
+
+
+class Profile(object):
+    """Runs workloads against a config and collects their timings"""
+
+    def __init__(self, config, stats, seed=None):
+        self.config = config
+        self.stats = stats
+        self.random = random.Random(seed)
+        self.keypaths = [keypath for keypath, _ in
+                         iter_leaves(config.dump())]
+        # workload -> (operations, seconds)
+        self.workloads = {}
+        # keypath -> latencies of its lookups
+        self.latencies = defaultdict(list)
+        self.readonly_writes = 0
+
+        for source_stats in stats:
+            source_stats.reset()
+
+    def run(self, workload, count):
+        run = getattr(self, '_run_%s' % workload)
+        began = default_timer()
+        run(count)
+        self.workloads[workload] = (count, default_timer() - began)
+
+    def _run_lookup(self, count):
+        if not self.keypaths:
+            return
+        for _ in range(count):
+            keypath = self.random.choice(self.keypaths)
+            began = default_timer()
+            lookup(self.config, keypath)
+            self.latencies[keypath].append(default_timer() - began)
+
+    def _run_iterate(self, count):
+        def walk(config):
+            for key, value in config.items():
+                if isinstance(value, LayeredConfig):
+                    walk(value)
+
+        for _ in range(count):
+            walk(self.config)
+
+    def _run_dump(self, count):
+        for _ in range(count):
+            self.config.dump()
+
+    def _run_write(self, count):
+        # writes the current values back into the sources they come
+        # from so the data stays the same
+        if not self.keypaths:
+            return
+        for _ in range(count):
+            keypath = self.random.choice(self.keypaths)
+            section = self._providing_section(keypath)
+            try:
+                section[keypath[-1]] = section[keypath[-1]]
+            except TypeError:
+                # the value comes from a read-only source
+                self.readonly_writes += 1
+                continue
+            # cached sources only send their writes when flushed
+            root = section._root_and_keypath()[0]
+            if root._use_cache:
+                root.write_cache()
+
+    def _providing_section(self, keypath):
+        """Return the section of the source which provides a value"""
+        for source in reversed(self.config._source_list):
+            try:
+                section = lookup(source, keypath[:-1])
+                value = section[keypath[-1]]
+            except (KeyError, TypeError):
+                continue
+            if not isinstance(value, Source):
+                return section
+        raise KeyError("Key '%s' was not found" % '.'.join(keypath))
+
+    def report(self, top=10):
+        """Return the collected timings as lines of text"""
+        lines = ['%-10s %8s %10s %12s'
+                 % ('workload', 'ops', 'seconds', 'ops/s')]
+        for workload in WORKLOADS:
+            if workload in self.workloads:
+                count, seconds = self.workloads[workload]
+                lines.append('%-10s %8d %10.4f %12.1f'
+                             % (workload, count, seconds,
+                                count / seconds if seconds else 0.0))
+        if self.readonly_writes:
+            lines.append('%d writes hit read-only sources'
+                         % self.readonly_writes)
+
+        lines.append('')
+        lines.append('%-40s %8s %12s %12s'
+                     % ('source', 'reads', 'read ms', 'ms/read'))
+        for source_stats in self.stats:
+            milliseconds = source_stats.seconds * 1000
+            lines.append('%-40s %8d %12.3f %12.3f'
+                         % (source_stats.label, source_stats.reads,
+                            milliseconds,
+                            milliseconds / source_stats.reads
+                            if source_stats.reads else 0.0))
+
+        samples = [latency for latencies in self.latencies.values()
+                   for latency in latencies]
+        if samples:
+            lines.append('')
+            lines.append('lookup latency (us)  ' + '  '.join(
+                '%s %.1f' % (name, percentile(samples, fraction) * 1e6)
+                for name, fraction in [('p50', 0.5), ('p90', 0.9),
+                                       ('p99', 0.99), ('max', 1.0)]))
+
+            slowest = sorted(self.latencies.items(),
+                             key=lambda item: -sum(item[1]) / len(item[1]))
+            lines.append('')
+            lines.append('%-40s %8s %12s %12s'
+                         % ('slowest keypaths', 'lookups', 'mean us',
+                            'p99 us'))
+            for keypath, latencies in slowest[:top]:
+                lines.append('%-40s %8d %12.1f %12.1f'
+                             % ('.'.join('%s' % key for key in keypath),
+                                len(latencies),
+                                sum(latencies) / len(latencies) * 1e6,
+                                percentile(latencies, 0.99) * 1e6))
+        return lines
+
+
+def profile(args, out=sys.stdout):
+    sources, stats, fakes = [], [], []
+    copies = None
+    if args.writes and not args.in_place:
+        copies = tempfile.mkdtemp()
+    try:
+        for spec in args.sources:
+            kwargs = {'cached': True} if args.cached else {}
+            if copies is not None:
+                source, fake = make_source(copy_for_writes(spec, copies),
+                                           name=spec, **kwargs)
+            else:
+                source, fake = make_source(spec, **kwargs)
+            if fake is not None:
+                fakes.append(fake)
+            sources.append(source)
+            stats.append(instrument(source, spec))
+
+        # highest priority first, like lookups go through them
+        stats.reverse()
+        config = LayeredConfig(*sources)
+        run = Profile(config, stats, args.seed)
+
+        counts = [('lookup', args.lookups), ('iterate', args.iterations),
+                  ('dump', args.dumps), ('write', args.writes)]
+        profiler = cProfile.Profile() if args.cprofile else None
+        if profiler is not None:
+            profiler.enable()
+        try:
+            for workload, count in counts:
+                if count:
+                    run.run(workload, count)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+
+        for line in run.report(args.top):
+            out.write(line + '\n')
+
+        if profiler is not None:
+            if args.cprofile == '-':
+                out.write('\n')
+                pstats.Stats(profiler, stream=out).sort_stats(
+                    'cumulative').print_stats(args.top * 2)
+            else:
+                profiler.dump_stats(args.cprofile)
+    finally:
+        for fake in fakes:
+            fake.stop()
+        if copies is not None:
+            shutil.rmtree(copies)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m layeredconfig')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    command = commands.add_parser(
+        'profile', description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        help='profile lookups, iterations, dumps and writes')
+    command.add_argument('sources', nargs='+', metavar='kind:argument')
+    command.add_argument('--lookups', type=int, default=1000)
+    command.add_argument('--iterations', type=int, default=10)
+    command.add_argument('--dumps', type=int, default=10)
+    command.add_argument('--writes', type=int, default=0,
+                         help='writes the current values back into the '
+                              'sources they come from, by default into '
+                              'temporary copies of their files')
+    command.add_argument('--in-place', action='store_true',
+                         help='write into the files and etcds themselves')
+    command.add_argument('--cached', action='store_true',
+                         help='cache all sources')
+    command.add_argument('--seed', type=int, default=None)
+    command.add_argument('--top', type=int, default=10,
+                         help='number of slowest keypaths to report')
+    command.add_argument('--cprofile', nargs='?', const='-', default=None,
+                         metavar='FILE',
+                         help='profile with cProfile and print the stats '
+                              'or write them into FILE')
+
+    args = parser.parse_args(argv)
+    try:
+        profile(args)
+    except (IOError, ValueError, ImportError) as error:
+        parser.exit(1, '%s\n' % error)
+    return 0
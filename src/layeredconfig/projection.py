@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import fnmatch
+
+import six
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    # py<3.3
+    from collections import Mapping
+
+
+class Projection(object):
+    """Selection of the subtrees of a config
+
+    Patterns are dotted keypaths or tuples of keys which may contain
+    fnmatch wildcards per key. A pattern includes the whole subtree
+    beneath the keypaths it matches, so 'db' and 'db.*' are equal.
+    """
+
+    def __init__(self, include):
+        if isinstance(include, six.string_types):
+            include = [include]
+
+        patterns = []
+        for pattern in include:
+            if isinstance(pattern, six.string_types):
+                pattern = pattern.split('.')
+            pattern = tuple(pattern)
+            # trailing wildcards match whole subtrees anyway
+            while pattern and pattern[-1] == '*':
+                pattern = pattern[:-1]
+            patterns.append(pattern)
+        self.patterns = patterns
+
+    def __str__(self):
+        return ','.join(sorted('.'.join('%s' % key for key in pattern)
+                               for pattern in self.patterns))
+
+    @property
+    def prefixes(self):
+        """Return the literal keypaths that cover every included value
+
+        A pattern that starts with a wildcard results in the empty
+        keypath which covers everything.
+        """
+        prefixes = set()
+        for pattern in self.patterns:
+            prefix = []
+            for key in pattern:
+                if any(char in key for char in '*?['):
+                    break
+                prefix.append(key)
+            prefixes.add(tuple(prefix))
+
+        # drop prefixes within others
+        return sorted(prefix for prefix in prefixes
+                      if not any(prefix[:length] in prefixes
+                                 for length in range(len(prefix))))
+
+    def apply(self, data):
+        """Return a copy of data without the excluded subtrees"""
+        return self._apply(data, self.patterns)
+
+    def _apply(self, data, patterns):
+        result = {}
+        for key, value in data.items():
+            rest = [pattern[1:] for pattern in patterns
+                    if not pattern or fnmatch.fnmatchcase('%s' % key,
+                                                          pattern[0])]
+            if not rest:
+                continue
+
+            if any(not pattern for pattern in rest):
+                result[key] = value
+            elif isinstance(value, Mapping):
+                section = self._apply(value, rest)
+                if section:
+                    result[key] = section
+        return result
@@ -1,13 +1,41 @@
 # -*- coding: utf-8 -*-
 
+import os
+import threading
 from collections import namedtuple
 
+try:
+    from collections.abc import Mapping
+except ImportError:
+    # py<3.3
+    from collections import Mapping
+
 import six
 
+from layeredconfig import hashing, locking, presence, projection
+
 CustomType = namedtuple('CustomType', 'customize reset')
 MetaInfo = namedtuple('MetaInfo', 'readonly is_typed source_name')
 
 
+def stat_fingerprint(path):
+    """Cheap fingerprint for file based sources"""
+    stat = os.stat(path)
+    return '%s:%d:%r' % (path, stat.st_size, stat.st_mtime)
+
+
+def sort_key(key):
+    """Sort key for keys of mixed types like the int keys of yaml"""
+    return (type(key).__name__, key)
+
+
+def copy_sections(data):
+    """Return a copy of data with copies of all of its sections"""
+    return dict((key, copy_sections(value) if isinstance(value, Mapping)
+                 else value)
+                for key, value in data.items())
+
+
 class SourceMeta(type):
     """Initialize subclasses and source base class"""
 
@@ -43,13 +71,61 @@ class AbstractSource(object):
         # _parent_key is the key on the parent that led to this object
         self._parent, self._parent_key = kwargs.pop('parent', (None, None))
 
+        # optional name to tell instances of the same source type apart
+        self._label = kwargs.pop('name', None)
+
+        # lazy sources are not read before a lookup falls through to them
+        self._lazy = kwargs.pop('lazy', False)
+
+        # projected sources drop everything outside of the included
+        # subtrees right after reading and are read-only
+        include = kwargs.pop('include', None)
+        self._projection = None
+        if include is not None:
+            self._projection = projection.Projection(include)
+
+        # counts the writes and reloads of a root source
+        self._generation = 0
+
+        if self._parent is None:
+            # callables that get notified when the data was changed or
+            # reloaded and the content hashes of the sections. Sublevel
+            # sources use the ones of their root source.
+            self._listeners = []
+            self._hashes = hashing.HashCache()
+
         # kwargs.get would override the metaclass settings
         # so only change it if it's really given.
         if 'meta' in kwargs:
             self._meta = kwargs['meta']
 
     def is_writable(self):
-        return not self._meta.readonly
+        return not self._meta.readonly and not self.is_projected()
+
+    def project(self, include):
+        """Return a read-only view limited to the given subtrees
+
+        Sources that can read their subtrees one by one only read the
+        included ones until this source is read itself, others are read
+        in full and projected.
+        """
+        from layeredconfig.sources import projected
+
+        if self._parent is not None:
+            raise TypeError('Only root sources can be projected')
+        return projected.ProjectedSource(self, include)
+
+    def add_listener(self, listener):
+        self._root_and_keypath()[0]._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._root_and_keypath()[0]._listeners.remove(listener)
+
+    def reload(self):
+        """Notify listeners that the underlying data may have changed"""
+        root = self._root_and_keypath()[0]
+        root._hashes.clear()
+        root._notify()
 
     def get(self, name, default=None):
         try:
@@ -70,7 +146,7 @@ class AbstractSource(object):
     def update(self, *others):
         self._check_writable()
 
-        data = self._get_data()
+        data = dict(self._get_data())
         for other in others:
             if isinstance(other, Source):
                 data.update(other.dump())
@@ -79,17 +155,92 @@ class AbstractSource(object):
         self._set_data(data)
 
     def dump(self):
-        return self._get_data()
+        # the data may be the cache of the source
+        return copy_sections(self._get_data())
 
     def is_typed(self):
         return self._meta.is_typed
 
+    def is_lazy(self):
+        return self._lazy
+
+    def is_projected(self):
+        return self._root_and_keypath()[0]._projection is not None
+
+    def generation(self):
+        """Return a counter which increases with every write and reload"""
+        root = self._root_and_keypath()[0]
+        if root is not self:
+            return root.generation()
+        return self._generation
+
+    def content_hash(self):
+        """Return a merkle hash of the data of this (sub)source"""
+        root, keypath = self._root_and_keypath()
+        version = root._hashes.version(root._hash_stamp())
+        digest = root._hashes.get(keypath, version)
+        if digest is None:
+            digest = root._hashes.digest(keypath, self._get_data(), version)
+        return digest
+
+    def fingerprint(self):
+        """Return a string that changes whenever the data changes
+
+        Sources that can tell about changes more cheaply than by reading
+        all of their data should override this method.
+        """
+        return self.content_hash()
+
+    def _known_content_hash(self):
+        """Return the content hash if it is known already or None"""
+        root, keypath = self._root_and_keypath()
+        return root._hashes.get(
+            keypath, root._hashes.version(root._hash_stamp()))
+
+    def _hash_stamp(self):
+        """Return the version of the data the hashes are kept for
+
+        Without a fingerprint, data is assumed to change on every read
+        and no hashes are kept.
+        """
+        fingerprint = six.get_unbound_function(type(self).fingerprint)
+        if fingerprint is six.get_unbound_function(AbstractSource.fingerprint):
+            return None
+        try:
+            return (self._generation, self.fingerprint())
+        except (IOError, OSError):
+            return None
+
+    def _root_and_keypath(self):
+        root, keypath = self, ()
+        while root._parent is not None:
+            keypath = (root._parent_key,) + keypath
+            root = root._parent
+        return root, keypath
+
     def _read(self):
         raise NotImplementedError
 
     def _write(self, data):
         raise NotImplementedError
 
+    def _read_included(self, projection):
+        """Return the data of the source for the projection of a view
+
+        Sources that can read their subtrees one by one override this
+        to read only the ones the projection includes, without changing
+        the state of the source itself. The data may hold more than
+        that as the view applies the projection anyway.
+        """
+        return self._get_data()
+
+    def _load(self):
+        """Read the data and apply the projection, if any"""
+        data = self._read()
+        if self._projection is not None:
+            data = self._projection.apply(data)
+        return data
+
     def _get_data(self):
         """Proxies the underlying data source
 
@@ -97,23 +248,48 @@ class AbstractSource(object):
         user defined keys.
         """
         try:
-            return self._read()
+            return self._load()
         except NotImplementedError:
             return self._parent._get_data()[self._parent_key]
 
-    def _set_data(self, data):
+    def _set_data(self, data, changed=()):
+        """Replace the data
+
+        changed is the keypath of the changed value relative to this
+        source. Its hashes are dropped once the data was replaced so
+        that hashes of the data before cannot be stored afterwards.
+        """
         self._check_writable()
 
         try:
             self._write(data)
+            self._hashes.invalidate(changed)
+            self._notify()
         except NotImplementedError:
-            result = self._parent._get_data()
+            # copy instead of changing the parent data in place so that
+            # concurrent readers keep a consistent view of it
+            result = dict(self._parent._get_data())
             result[self._parent_key] = data
-            self._parent._set_data(result)
+            self._parent._set_data(result, (self._parent_key,) + changed)
+
+    def _is_attribute(self, key):
+        """Tell internal attributes apart from user data"""
+        return any([self._initialized is False,
+                    key == '_initialized',
+                    key in self.__dict__,
+                    key in self.__class__.__dict__])
+
+    def _notify(self):
+        self._generation += 1
+        for listener in list(self._listeners):
+            listener(self)
 
     def _check_writable(self):
         if self._meta.readonly:
             raise TypeError('%s is a read-only source' % self._meta.source_name)
+        if self.is_projected():
+            raise TypeError('%s is projected and cannot be changed'
+                            % self._meta.source_name)
 
     def __getattr__(self, name):
         # although the key was accessed with attribute style
@@ -122,28 +298,29 @@ class AbstractSource(object):
         return self[name]
 
     def __setattr__(self, attr, value):
-        self[attr] = value
+        # internal attributes skip the handling of user data
+        if self._initialized is False or attr in self.__dict__:
+            object.__setattr__(self, attr, value)
+        else:
+            self[attr] = value
 
     def __getitem__(self, key):
         attr = self._get_data()[key]
-        if isinstance(attr, dict):
+        if isinstance(attr, Mapping):
             return Source(parent=(self, key),
                           meta=self._meta,
                           )
         return attr
 
     def __setitem__(self, key, value):
-        if any([self._initialized is False,
-                key == '_initialized',
-                key in self.__dict__,
-                key in self.__class__.__dict__]):
+        if self._is_attribute(key):
             super(AbstractSource, self).__setattr__(key, value)
         else:
             self._check_writable()
 
-            data = self._get_data()
+            data = dict(self._get_data())
             data[key] = value
-            self._set_data(data)
+            self._set_data(data, (key,))
 
     def __delattr__(self, name):
         del self[name]
@@ -151,9 +328,9 @@ class AbstractSource(object):
     def __delitem__(self, key):
         self._check_writable()
 
-        data = self._get_data()
+        data = dict(self._get_data())
         del data[key]
-        self._set_data(data)
+        self._set_data(data, (key,))
 
     def __len__(self):
         return len(self._get_data().keys())
@@ -162,6 +339,13 @@ class AbstractSource(object):
         return iter(self._get_data().keys())
 
     def __eq__(self, other):
+        if isinstance(other, AbstractSource):
+            # hashing takes longer than comparing, so only hashes that
+            # are known already are used
+            known = self._known_content_hash()
+            if known is not None and known == other._known_content_hash():
+                return True
+            other = other._get_data()
         return self._get_data() == other
 
     def __repr__(self):
@@ -191,12 +375,98 @@ class CacheMixin(AbstractSource):
 
     def __init__(self, *args, **kwargs):
         # will be applied to child classes as sublevel sources
-        # do not need caching.
-        self._use_cache = kwargs.pop('cached', False)
+        # do not need caching. Lazy sources are cached by default so
+        # that they are read at most once.
+        self._use_cache = kwargs.pop('cached', kwargs.get('lazy', False))
         self._cache = None
+        if 'parent' not in kwargs:
+            self._cache_lock = threading.Lock()
+            # set while the data could not be read the last time it
+            # was revalidated or reloaded
+            self._stale = False
+
+        # the last read data is kept on disk so that the next process
+        # can start with it right away and revalidate it afterwards in
+        # a thread of its own, which is where listeners get notified
+        # about changes found by the revalidation
+        self._cache_file = kwargs.pop('cache_file', None)
+        self._revalidation = None
+        if self._cache_file is not None:
+            self._use_cache = True
+
+        # index of the keypaths within the cached data so that lookups
+        # can skip sources which cannot contain a key. It is rebuilt
+        # whenever the cached data was replaced by a write or reload.
+        self._indexed = kwargs.pop('indexed', False)
+        self._presence = None
+        if 'parent' not in kwargs:
+            self._presence_stats = {'hits': 0, 'skips': 0}
+        if self._indexed:
+            self._use_cache = True
+
+        # watched sources are reloaded in the background whenever
+        # their fingerprint changes, either by the watcher shared by
+        # the process (watch=True) or by the given one
+        watch = kwargs.pop('watch', None)
+        if watch:
+            self._use_cache = True
 
         super(CacheMixin, self).__init__(*args, **kwargs)
 
+        if watch:
+            from layeredconfig import watcher
+            if watch is True:
+                watch = watcher.default_watcher()
+            watch.watch(self)
+
+    def is_stale(self):
+        """Tell whether the data failed to be read again
+
+        Cached data is served until the source could be read again,
+        for example when the source was unreachable while the data of
+        the cache file was revalidated.
+        """
+        return self._root_and_keypath()[0]._stale
+
+    def might_contain(self, keypath):
+        """Return False if keypath definitely does not exist
+
+        Sources without an index or whose data was not read yet always
+        return True.
+        """
+        root, base = self._root_and_keypath()
+        index = root._get_presence_index()
+        if index is None:
+            return True
+
+        if index.might_contain(base + tuple(keypath)):
+            root._presence_stats['hits'] += 1
+            return True
+        root._presence_stats['skips'] += 1
+        return False
+
+    def presence_stats(self):
+        """Return the kind and size of the index and its hits and skips"""
+        root = self._root_and_keypath()[0]
+        index = root._get_presence_index()
+        stats = dict(root._presence_stats)
+        stats['kind'] = index.kind if index is not None else None
+        stats['keypaths'] = len(index) if index is not None else 0
+        return stats
+
+    def _get_presence_index(self):
+        # never read the data just to build the index
+        cache = self._cache
+        if not self._indexed or cache is None:
+            return None
+
+        presence_entry = self._presence
+        if presence_entry is None or presence_entry[0] is not cache:
+            presence_entry = (cache, presence.build_index(cache,
+                                                          self._indexed))
+            self._presence = presence_entry
+        return presence_entry[1]
+
     def write_cache(self):
         self._check_writable()
 
@@ -204,22 +474,150 @@ class CacheMixin(AbstractSource):
             self._write(self._cache)
         except NotImplementedError:
             self._parent.write_cache()
+        else:
+            self._dump_cache_file(self._cache)
 
     def _get_data(self):
         if self._use_cache:
-            if not self._cache:
-                self._cache = self._read()
+            if self._cache is None:
+                # only the first of many concurrently missing threads
+                # reads the data while the others wait for it
+                with self._cache_lock:
+                    if self._cache is None:
+                        self._cache = self._fill_cache()
             return self._cache
 
         return super(CacheMixin, self)._get_data()
 
-    def _set_data(self, data):
-        self._check_writable()
+    def _fill_cache(self):
+        try:
+            fingerprint, data = self._load_cache_file()
+        except (IOError, OSError, ValueError):
+            data = self._load()
+            self._dump_cache_file(data)
+            return data
+
+        self._revalidation = threading.Thread(
+            target=self._revalidate,
+            args=(fingerprint, data, self._generation))
+        self._revalidation.daemon = True
+        self._revalidation.start()
+        return data
+
+    def _revalidate(self, fingerprint, cached, generation):
+        """Replace the data of the cache file if the source changed
+
+        Runs in a thread of its own, so listeners are called from there.
+        """
+        try:
+            if fingerprint is not None and fingerprint == self.fingerprint():
+                self._stale = False
+                return
+            data = self._load_fresh()
+        except Exception:
+            # keep the cached data until the next reload
+            self._stale = True
+            return
+
+        with self._cache_lock:
+            # writes since the start win over the revalidated data. The
+            # cache is compared as well since writes replace it before
+            # they count.
+            if self._generation != generation or self._cache is not cached:
+                return
+            self._cache = data
+            self._dump_cache_file(data)
+        super(CacheMixin, self).reload()
+
+    def _hash_stamp(self):
+        if self._use_cache:
+            # writes invalidate the hashes they affect and reloads all
+            return 'cached'
+        return super(CacheMixin, self)._hash_stamp()
+
+    def _load_fresh(self):
+        # sources may flag the data they read as stale themselves
+        self._stale = False
+        try:
+            return self._load()
+        except Exception:
+            self._stale = True
+            raise
 
+    def _read_fingerprint(self):
+        """Return the fingerprint of the data of the last read
+
+        Sources which can only tell by reading all of their data
+        return None.
+        """
+        return None
+
+    def _load_cache_file(self):
+        from layeredconfig.sources import snapshot
+
+        if self._cache_file is None:
+            raise IOError('No cache file')
+
+        fingerprints, data = snapshot.load_snapshot(self._cache_file)
+        (source_name, fingerprint), = fingerprints
+        if source_name != self._cache_name():
+            raise ValueError('Cache file of another source')
+        if self._projection is not None:
+            data = self._projection.apply(data)
+        return fingerprint, data
+
+    def _cache_name(self):
+        # the cache files of projections only hold the included subtrees
+        # so they must not be used by other projections or the full source
+        if self._projection is None:
+            return self._meta.source_name
+        return '%s[%s]' % (self._meta.source_name, self._projection)
+
+    def _dump_cache_file(self, data):
+        from layeredconfig.sources import snapshot
+
+        if self._cache_file is None:
+            return
+
+        fingerprints = [[self._cache_name(), self._read_fingerprint()]]
+        try:
+            snapshot.dump_snapshot(self._cache_file, data, fingerprints)
+        except (IOError, OSError, TypeError):
+            # the cache only speeds up the next start
+            pass
+
+    def reload(self):
         if self._use_cache:
+            with self._cache_lock:
+                self._cache = self._load_fresh()
+                self._dump_cache_file(self._cache)
+        super(CacheMixin, self).reload()
+
+    def refresh(self):
+        """Reload the data without holding any lock while reading
+
+        The cached data is replaced by the new data in a single step so
+        readers neither wait for the read nor see partial data.
+        """
+        if not self._use_cache:
+            return self.reload()
+
+        data = self._load_fresh()
+        with self._cache_lock:
             self._cache = data
+            self._dump_cache_file(data)
+        super(CacheMixin, self).reload()
+
+    def _set_data(self, data, changed=()):
+        self._check_writable()
+
+        if self._use_cache:
+            with self._cache_lock:
+                self._cache = data
+                self._hashes.invalidate(changed)
+            self._notify()
         else:
-            return super(CacheMixin, self)._set_data(data)
+            return super(CacheMixin, self)._set_data(data, changed)
 
 
 class CustomTypeMixin(AbstractSource):
@@ -229,24 +627,75 @@ class CustomTypeMixin(AbstractSource):
         # do not need caching.
         self._custom_types = kwargs.pop('type_map', {})
 
+        # converted values by (keypath, raw type, raw value) so that
+        # expensive conversions only run once per distinct raw value.
+        # Only the root source holds the cache.
+        self._type_cache = {} if kwargs.pop('memoize_types', False) else None
+
         super(CustomTypeMixin, self).__init__(*args, **kwargs)
 
     def dump(self, with_custom_types=False):
         if with_custom_types is False:
             return super(CustomTypeMixin, self).dump()
 
-        def iter_dict(data):
+        def iter_dict(data, keypath):
             for key, value in data.items():
-                if isinstance(value, dict):
-                    yield key, dict(iter_dict(value))
+                if isinstance(value, Mapping):
+                    yield key, dict(iter_dict(value, keypath + (key,)))
                 else:
-                    yield key, self._to_custom_type(key, value)
+                    yield key, self._to_custom_type(key, value,
+                                                    keypath + (key,))
+
+        return dict(iter_dict(self._get_data(),
+                              self._root_and_keypath()[1]))
+
+    def dump_to(self, fh, format='json', with_custom_types=False,
+                **options):
+        """Stream the data into a file object without copying it first"""
+        from layeredconfig import streaming
 
-        return dict(iter_dict(self._get_data()))
+        if with_custom_types:
+            base = self._root_and_keypath()[1]
 
-    def _to_custom_type(self, key, value):
+            def to_custom_type(keypath, value):
+                return self._to_custom_type(keypath[-1], value,
+                                            base + keypath)
+
+            convert = to_custom_type
+        else:
+            convert = None
+
+        streaming.dump_to(fh, self.items(), format, convert=convert,
+                          **options)
+
+    def _to_custom_type(self, key, value, keypath=None):
         converter = self._custom_types.get(key)
-        return converter.customize(value) if converter else value
+        if not converter:
+            return value
+
+        root, parent_keypath = self._root_and_keypath()
+        if root._type_cache is None:
+            return converter.customize(value)
+
+        if keypath is None:
+            keypath = parent_keypath + (key,)
+        cache_key = (keypath, type(value), value)
+        try:
+            return root._type_cache[cache_key]
+        except KeyError:
+            pass
+        except TypeError:
+            # unhashable values cannot be memoized
+            return converter.customize(value)
+
+        result = root._type_cache[cache_key] = converter.customize(value)
+        return result
+
+    def _notify(self):
+        # writes and reloads make converted values obsolete
+        if self._type_cache is not None:
+            self._type_cache.clear()
+        super(CustomTypeMixin, self)._notify()
 
     def _to_original_type(self, key, value):
         converter = self._custom_types[key]
@@ -267,7 +716,67 @@ class CustomTypeMixin(AbstractSource):
         super(CustomTypeMixin, self).__setitem__(key, value)
 
 
-class Source(CacheMixin,
+class ThreadSafeMixin(AbstractSource):
+
+    def __init__(self, *args, **kwargs):
+        # sublevel sources share the lock of their root source
+        self._lock = None
+        if kwargs.pop('threadsafe', False):
+            self._lock = locking.RWLock()
+
+        super(ThreadSafeMixin, self).__init__(*args, **kwargs)
+
+    def update(self, *others):
+        if self._lock is None:
+            return super(ThreadSafeMixin, self).update(*others)
+
+        with self._lock.writing():
+            return super(ThreadSafeMixin, self).update(*others)
+
+    def reload(self):
+        if self._lock is None:
+            return super(ThreadSafeMixin, self).reload()
+
+        with self._lock.writing():
+            return super(ThreadSafeMixin, self).reload()
+
+    def write_cache(self):
+        if self._lock is None:
+            return super(ThreadSafeMixin, self).write_cache()
+
+        with self._lock.writing():
+            return super(ThreadSafeMixin, self).write_cache()
+
+    def _get_data(self):
+        if self._lock is None:
+            return super(ThreadSafeMixin, self)._get_data()
+
+        with self._lock.reading():
+            return super(ThreadSafeMixin, self)._get_data()
+
+    def __getitem__(self, key):
+        attr = super(ThreadSafeMixin, self).__getitem__(key)
+        if self._lock is not None and isinstance(attr, Source):
+            attr._lock = self._lock
+        return attr
+
+    def __setitem__(self, key, value):
+        if self._lock is None or self._is_attribute(key):
+            return super(ThreadSafeMixin, self).__setitem__(key, value)
+
+        with self._lock.writing():
+            super(ThreadSafeMixin, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        if self._lock is None:
+            return super(ThreadSafeMixin, self).__delitem__(key)
+
+        with self._lock.writing():
+            super(ThreadSafeMixin, self).__delitem__(key)
+
+
+class Source(ThreadSafeMixin,
+             CacheMixin,
              CustomTypeMixin,
              LockedSourceMixin,
              AbstractSource
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+import glob
+import hashlib
+import json
+import os
+from multiprocessing.pool import ThreadPool
+
+try:
+    import yaml
+except ImportError:
+    pass
+
+import six
+
+from layeredconfig import source, strategy
+
+
+def _load_json(fh):
+    return json.load(fh)
+
+
+def _load_yaml(fh):
+    try:
+        assert yaml
+    except NameError:
+        raise ImportError('You are missing the optional'
+                          ' dependency "pyyaml"')
+    return yaml.safe_load(fh)
+
+
+class DirectorySource(source.Source):
+    """Source for directories of config fragments (conf.d)
+
+    All files matching pattern that have a known extension are parsed
+    in a thread pool and merged into a single layer by filename order
+    where later fragments take precedence. On reload only fragments
+    whose stat signature changed are parsed again.
+    """
+
+    _PARSERS = {
+        '.json': _load_json,
+        '.yaml': _load_yaml,
+        '.yml': _load_yaml,
+    }
+
+    def __init__(self, source, pattern='*', workers=4, **kwargs):
+        # enable caching by default
+        kwargs['cached'] = kwargs.get('cached', True)
+
+        super(DirectorySource, self).__init__(**kwargs)
+        self._source = source
+        self._pattern = pattern
+        self._workers = workers
+
+        # fragment path -> (stat signature, parsed data)
+        self._fragments = {}
+
+        # fingerprint of the fragments at the last read
+        self._read_stat = None
+
+    def fingerprint(self):
+        sha = hashlib.sha1()
+        for path in self._list_fragments():
+            sha.update(source.stat_fingerprint(path).encode('utf-8'))
+        return sha.hexdigest()
+
+    def fragment(self, path):
+        """Return the name of the fragment that supplies a value"""
+        if isinstance(path, six.string_types):
+            path = path.split('.')
+
+        for fragment_path in sorted(self._fragments, reverse=True):
+            value = self._fragments[fragment_path][1]
+            try:
+                for key in path:
+                    value = value[key]
+            except (KeyError, TypeError):
+                continue
+            return os.path.basename(fragment_path)
+        raise KeyError("Key '%s' was not found" % '.'.join(path))
+
+    def _read_fingerprint(self):
+        return self._read_stat
+
+    def _read(self):
+        self._read_stat = self.fingerprint()
+        paths = self._list_fragments()
+        signatures = dict((path, source.stat_fingerprint(path))
+                          for path in paths)
+
+        fragments = {}
+        changed = []
+        for path in paths:
+            known = self._fragments.get(path)
+            if known is not None and known[0] == signatures[path]:
+                fragments[path] = known
+            else:
+                changed.append(path)
+
+        for path, data in zip(changed, self._parse_fragments(changed)):
+            fragments[path] = (signatures[path], data)
+        self._fragments = fragments
+
+        if not paths:
+            return {}
+        # merge gives precedence to the first value
+        return strategy.merge.finalize([fragments[path][1]
+                                        for path in reversed(paths)])
+
+    def _list_fragments(self):
+        paths = glob.glob(os.path.join(self._source, self._pattern))
+        return sorted(path for path in paths
+                      if os.path.splitext(path)[1] in self._PARSERS and
+                      os.path.isfile(path))
+
+    def _parse_fragments(self, paths):
+        if self._workers <= 1 or len(paths) <= 1:
+            return [self._parse_fragment(path) for path in paths]
+
+        pool = ThreadPool(min(self._workers, len(paths)))
+        try:
+            return pool.map(self._parse_fragment, paths)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _parse_fragment(self, path):
+        parser = self._PARSERS[os.path.splitext(path)[1]]
+        with open(path) as fh:
+            data = parser(fh)
+
+        if data is None:
+            # empty yaml file
+            return {}
+        if not isinstance(data, source.Mapping):
+            raise ValueError("Fragment '%s' does not contain a mapping"
+                             % path)
+        return data
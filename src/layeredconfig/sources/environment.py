@@ -2,7 +2,7 @@
 
 import os
 
-from layeredconfig import source
+from layeredconfig import interning, source
 
 
 class Environment(source.Source):
@@ -11,23 +11,39 @@ class Environment(source.Source):
     _is_typed = False
 
     def __init__(self, prefix=None, token='_', **kwargs):
+        self._intern = kwargs.pop('intern', False)
         super(Environment, self).__init__(**kwargs)
         self.prefix = prefix
         self.token = token
 
     def _read(self):
+        return self._read_included(self._projection)
+
+    def _read_included(self, projection):
+        # projections only need the variables beneath their prefixes
+        prefixes = None
+        if projection is not None:
+            prefixes = projection.prefixes
+
         data = {}
         for key, value in os.environ.items():
             if not key.startswith(self.prefix):
                 continue
 
             subheaders = key.lower().split(self.token)[1:]
+            if prefixes is not None and not any(
+                    tuple(subheaders[:len(prefix)]) == prefix
+                    for prefix in prefixes):
+                continue
+
             subdata = data
             last = subheaders.pop()
             for header in subheaders:
                 subdata = subdata.setdefault(header, {})
             subdata[last] = value
 
+        if self._intern:
+            interning.intern_data(data)
         return data
 
     def _write(self, data):
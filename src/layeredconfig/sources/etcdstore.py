@@ -6,40 +6,201 @@ except ImportError:
     # py>3
     import urllib.parse as urlparse
 
+import random
+import time
+
 try:
     import requests
+    from urllib3.exceptions import NewConnectionError
 except ImportError:
     pass
 
-from layeredconfig import source
+import six
+
+from layeredconfig import interning, source
+from layeredconfig.source import Mapping
 
 
 class EtcdStore(source.Source):
-    """Source for etcd stores"""
+    """Source for etcd stores
+
+    The url may also be a list of urls of the cluster members which
+    are tried in turn. With serve_stale the last successfully read
+    data is served when etcd is unreachable and is_stale() tells
+    whether that is the case.
+    """
 
     _DEFAULT_URL = "http://127.0.0.1:2379/v2"
 
     def __init__(self, url, **kwargs):
         # enable caching by default
         kwargs['cached'] = kwargs.get('cached', True)
+        connector_kwargs = dict((key, kwargs.pop(key)) for key in
+                                ['timeout', 'retries', 'backoff']
+                                if key in kwargs)
+        serve_stale = kwargs.pop('serve_stale', False)
+        self._intern = kwargs.pop('intern', False)
 
         super(EtcdStore, self).__init__(**kwargs)
 
-        self._connector = EtcdConnector(url or self._DEFAULT_URL)
+        self._connector = EtcdConnector(url or self._DEFAULT_URL,
+                                        **connector_kwargs)
+        self._serve_stale = serve_stale
+        self._last_read = None
+        # etcd index of the last read
+        self._index = None
+
+        # values and their modification index as well as directories
+        # of the last read
+        self._known_values = {}
+        self._known_dirs = set()
+
+    def fingerprint(self):
+        # etcd increments its index on every change within the store
+        return str(self._connector.current_index())
 
     def _read(self):
-        # getting a single value is broken
-        response = self._connector.get('/', recursive=True)
-        payload = self._get_payload_from_response(response)
-        return self._translate_payload_to_dict(payload)
+        try:
+            data, index = self._fetch(self._projection,
+                                      (self._known_values, self._known_dirs))
+        except IOError:
+            if not self._serve_stale or self._last_read is None:
+                raise
+            self._stale = True
+            return self._last_read
+
+        self._last_read = data
+        self._stale = False
+        self._index = index
+        return data
+
+    def _read_included(self, projection):
+        # reads for projections must not change what writes compare to
+        return self._fetch(projection, ({}, set()))[0]
+
+    def _fetch(self, projection, known):
+        """Return the data beneath the prefixes of projection and its index
+
+        The values with their modification index and the directories
+        that were read are put into the known (values, dirs) pair.
+        """
+        prefixes = [()]
+        if projection is not None:
+            # projections only fetch the directories they include
+            prefixes = projection.prefixes
+
+        responses = []
+        index = None
+        for prefix in prefixes:
+            responses.append(self._connector.get('/'.join(('',) + prefix),
+                                                 recursive=True))
+            # the oldest index is the one the data is known to be
+            # at least as recent as
+            index = index or self._connector.last_index
+
+        # remember what is stored so that writes only send changes
+        known_values, known_dirs = known
+        known_values.clear()
+        known_dirs.clear()
+
+        data = {}
+        for prefix, response in zip(prefixes, responses):
+            if not prefix:
+                # getting a single value is broken
+                payload = self._get_payload_from_response(response)
+                data = self._translate_payload_to_dict(payload, known)
+                continue
+
+            node = response.get('node')
+            if node is None:
+                # the prefix does not exist
+                continue
+            section = data
+            for key in prefix[:-1]:
+                section = section.setdefault(key, {})
+            section.update(self._translate_payload_to_dict(
+                [node], known, '/'.join(('',) + prefix[:-1])))
+        return data, index
+
+    def _read_fingerprint(self):
+        return self._index
+
+    def _load_cache_file(self):
+        fingerprint, data = super(EtcdStore, self)._load_cache_file()
+        self._last_read = data
+        return fingerprint, data
 
     def _write(self, data):
-        items = self._translate_dict_to_key_value_pairs(data)
-        self._connector.set(*items)
+        """Send the differences to the last read state to etcd
+
+        Changed values are compared and swapped against the index they
+        were read with. A ValueError is raised when a key has been
+        modified concurrently in which case the source has to be
+        reloaded before writing again.
+        """
+        if self._index is None:
+            # the data came from the cache file so the indices to
+            # compare against are still missing
+            self._read()
+
+        values = dict(self._translate_dict_to_key_value_pairs(data))
+        dirs = set(self._translate_dict_to_dirs(data))
+
+        # removed directories (and directories replaced by values)
+        # including everything beneath them
+        for key in sorted(self._known_dirs - dirs):
+            if key not in self._known_dirs:
+                continue
+            self._connector.delete(key, recursive=True)
+            self._forget(key)
+
+        # removed values (and values replaced by directories)
+        for key in sorted(set(self._known_values) - set(values)):
+            index = self._known_values[key][1]
+            self._connector.delete(key, prev_index=index)
+            del self._known_values[key]
+
+        for key, value in sorted(values.items()):
+            known = self._known_values.get(key)
+            if known is None:
+                response = self._connector.put(key, value, prev_exist=False)
+            elif known[0] != '%s' % value:
+                response = self._connector.put(key, value,
+                                               prev_index=known[1])
+            else:
+                continue
+            self._remember(key, response)
+
+        # empty directories are not created implicitly by their values
+        for key in sorted(dirs - self._known_dirs):
+            if not any(dir_.startswith(key + '/') for dir_ in dirs) and \
+                    not any(value.startswith(key + '/') for value in values):
+                self._connector.put(key, dir=True, prev_exist=False)
+            self._known_dirs.add(key)
+
+        self._last_read = data
+
+    def _remember(self, key, response):
+        node = (response or {}).get('node', {})
+        value = node.get('value')
+        self._known_values[key] = (value, node.get('modifiedIndex'))
+
+        parts = key.split('/')
+        for end in range(2, len(parts)):
+            self._known_dirs.add('/'.join(parts[:end]))
+
+    def _forget(self, key):
+        prefix = key + '/'
+        self._known_dirs.difference_update(
+            [dir_ for dir_ in self._known_dirs
+             if dir_ == key or dir_.startswith(prefix)])
+        for value in [value for value in self._known_values
+                      if value.startswith(prefix)]:
+            del self._known_values[value]
 
     def _translate_dict_to_key_value_pairs(self, data, root=None):
         for key, value in data.items():
-            if isinstance(value, dict):
+            if isinstance(value, Mapping):
                 key_parts = filter(None, [root, key])
                 items = self._translate_dict_to_key_value_pairs(value, '/'.join(key_parts))
                 for item in items:
@@ -48,33 +209,64 @@ class EtcdStore(source.Source):
                 key_parts = filter(None, [root, key])
                 yield '/' + '/'.join(key_parts), value
 
+    def _translate_dict_to_dirs(self, data, root=''):
+        for key, value in data.items():
+            if isinstance(value, Mapping):
+                path = root + '/' + key
+                yield path
+                for item in self._translate_dict_to_dirs(value, path):
+                    yield item
+
     def _get_payload_from_response(self, response):
         try:
             return response['node']['nodes']
         except KeyError:
             return {}
-        return self._convert_payload(payload, root=path)
 
-    def _translate_payload_to_dict(self, nodes, root=None):
-        root = root or '/'
+    def _translate_payload_to_dict(self, nodes, known, root=''):
+        known_values, known_dirs = known
         result = {}
 
         for node in nodes:
+            # etcd returns full keys
+            name = node['key'].rsplit('/', 1)[-1]
+            if self._intern:
+                name = interning.intern_key(name)
+            path = root + '/' + name
             if node.get('dir', False):
-                key = node.get('key', root)
+                known_dirs.add(path)
                 nodes = node.get('nodes', [])
-                result[key.lstrip(root)] = self._translate_payload_to_dict(nodes, key)
+                result[name] = self._translate_payload_to_dict(nodes, known,
+                                                               path)
             else:
-                key = node['key']
-                result[key.lstrip(root)] = node['value']
+                value = node['value']
+                if self._intern:
+                    value = interning.intern_value(value)
+                known_values[path] = (value, node.get('modifiedIndex'))
+                result[name] = value
         return result
 
 
 class EtcdConnector:
-    """Simple etcd connector"""
+    """Simple etcd connector
 
-    def __init__(self, url):
-        self.url = url + '/keys'
+    Requests time out after timeout seconds which may also be a
+    (connect, read) tuple. Failed requests are tried with the next of
+    the given urls and, once all of them failed, retried after a
+    jittered exponential backoff. Writes are only retried when they
+    did not reach etcd at all.
+    """
+
+    _DEFAULT_TIMEOUT = (3.05, 30)
+
+    def __init__(self, url, timeout=_DEFAULT_TIMEOUT, retries=2,
+                 backoff=0.1):
+        urls = [url] if isinstance(url, six.string_types) else url
+        self.urls = [url + '/keys' for url in urls]
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.last_index = None
 
         try:
             assert requests
@@ -82,16 +274,124 @@ class EtcdConnector:
             raise ImportError('You are missing the optional'
                               ' dependency "requests"')
 
+    @property
+    def url(self):
+        # the member which answered last
+        return self.urls[0]
+
     def get(self, path, recursive=False):
         params = {'recursive': recursive}
-        url = self._make_url(self.url, path)
-        response = requests.get(url, params=params)
+        response = self._request('get', path, params=params)
+        self.last_index = response.headers.get('X-Etcd-Index')
         return response.json()
 
+    def watch(self, path, recursive=False, wait_index=None, timeout=None):
+        """Wait for the next change of path and return etcd's response
+
+        With wait_index, the first change at or after that index is
+        returned right away if there is one. The timeout defaults to
+        the connect timeout only so that the request waits for changes
+        indefinitely.
+        """
+        params = {'wait': 'true', 'recursive': recursive}
+        if wait_index is not None:
+            params['waitIndex'] = wait_index
+        if timeout is None:
+            timeout = (self.timeout[0] if isinstance(self.timeout, tuple)
+                       else self.timeout, None)
+
+        response = self._request('get', path, params=params, timeout=timeout)
+        return self._check_response(path, response)
+
+    def current_index(self):
+        response = self._request('get', '/')
+        return int(response.headers['X-Etcd-Index'])
+
     def set(self, *items):
         for key, value in items:
-            url = self._make_url(self.url, key)
-            requests.put(url, data={'value': value})
+            self._request('put', key, idempotent=False,
+                          data={'value': value})
+
+    def put(self, key, value=None, dir=False, prev_index=None,
+            prev_exist=None):
+        """Set a single key and return etcd's response
+
+        With prev_index or prev_exist the key is only set when it was
+        not modified since or does (not) exist yet respectively.
+        """
+        params = {}
+        if prev_index is not None:
+            params['prevIndex'] = prev_index
+        if prev_exist is not None:
+            params['prevExist'] = 'true' if prev_exist else 'false'
+
+        data = {'dir': 'true'} if dir else {'value': value}
+        response = self._request('put', key, idempotent=False,
+                                 params=params, data=data)
+        return self._check_response(key, response)
+
+    def delete(self, key, recursive=False, prev_index=None):
+        params = {}
+        if recursive:
+            params.update(dir='true', recursive='true')
+        if prev_index is not None:
+            params['prevIndex'] = prev_index
+
+        response = self._request('delete', key, idempotent=False,
+                                 params=params)
+        if response.status_code == 404:
+            # already gone
+            return None
+        return self._check_response(key, response)
+
+    def _request(self, method, path, idempotent=True, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        send = getattr(requests, method)
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                # full jitter keeps many clients from retrying in step
+                time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+            urls = self.urls
+            for position, url in enumerate(urls):
+                try:
+                    response = send(self._make_url(url, path), **kwargs)
+                except requests.ConnectionError as error:
+                    # includes connect timeouts. Connections may also
+                    # break after a write was sent already.
+                    if not idempotent and not _was_not_sent(error):
+                        raise
+                    last_error = error
+                    continue
+                except requests.Timeout as error:
+                    if not idempotent:
+                        raise
+                    last_error = error
+                    continue
+
+                if response.status_code >= 500:
+                    if not idempotent:
+                        response.raise_for_status()
+                    last_error = response
+                    continue
+
+                if position:
+                    # prefer the answering member from now on
+                    self.urls = urls[position:] + urls[:position]
+                return response
+
+        if isinstance(last_error, Exception):
+            raise last_error
+        last_error.raise_for_status()
+
+    def _check_response(self, key, response):
+        if response.status_code == 412:
+            raise ValueError("Key '%s' was modified concurrently" % key)
+        if response.status_code >= 400:
+            raise ValueError("Could not change key '%s': %s"
+                             % (key, response.text))
+        return response.json()
 
     def _make_url(self, *path_parts):
         full_url = '/'.join(path_parts)
@@ -107,3 +407,11 @@ class EtcdConnector:
         return '/'.join([start] +
                         [part for part in middle if part] +
                         [end])
+
+
+def _was_not_sent(error):
+    """Tell whether a failed request never reached the server"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0] if error.args else None, 'reason', None)
+    return isinstance(reason, NewConnectionError)
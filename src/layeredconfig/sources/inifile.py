@@ -5,25 +5,61 @@ try:
 except ImportError:
     import ConfigParser as configparser
 
-from layeredconfig import source
+import six
+
+from layeredconfig import interning, source
 
 
 class INIFile(source.Source):
-    """Source for ini files"""
+    """Source for ini files
+
+    The source may be a file object which is parsed once or the path
+    of a file. Paths are cached by default so the file is only parsed
+    again on reload, pass cached=False to parse it on every read.
+    """
 
     _is_typed = False
 
     def __init__(self, source, subsection_token=None, **kwargs):
+        self._intern = kwargs.pop('intern', False)
+        if isinstance(source, six.string_types):
+            # enable caching by default
+            kwargs['cached'] = kwargs.get('cached', True)
         super(INIFile, self).__init__(**kwargs)
         self._source = source
-        self._parser = configparser.ConfigParser()
-        self._parser.readfp(source)
+        self._parser = None
+        # stat signature of the file at the last read
+        self._read_stat = None
+        if not isinstance(source, six.string_types):
+            self._parser = configparser.ConfigParser()
+            self._parser.readfp(source)
         self._token = subsection_token
 
+    def fingerprint(self):
+        if self._parser is not None:
+            return super(INIFile, self).fingerprint()
+        return source.stat_fingerprint(self._source)
+
+    def _hash_stamp(self):
+        if self._parser is not None:
+            # file objects are parsed once so the data never changes
+            return 'parsed'
+        return super(INIFile, self)._hash_stamp()
+
+    def _read_fingerprint(self):
+        return self._read_stat
+
     def _read(self):
+        parser = self._parser
+        if parser is None:
+            self._read_stat = self.fingerprint()
+            parser = configparser.ConfigParser()
+            with open(self._source) as fh:
+                parser.readfp(fh)
+
         data = {}
-        for section in self._parser.sections():
-            sublevel = dict(self._parser.items(section))
+        for section in parser.sections():
+            sublevel = dict(parser.items(section))
             if section == '__root__':
                 data.update(sublevel)
             elif self._token and self._token in section:
@@ -35,4 +71,6 @@ class INIFile(source.Source):
                 subdata[last] = sublevel
             else:
                 data.setdefault(section, {}).update(sublevel)
+        if self._intern:
+            interning.intern_data(data)
         return data
@@ -1,21 +1,211 @@
 # -*- coding: utf-8 -*-
 
 import json
+import mmap
+import os
+import re
 
-from layeredconfig import source
+from layeredconfig import interning, source
+
+_WHITESPACE = re.compile(br'[ \t\n\r]*')
+_STRING = re.compile(br'"(?:[^"\\]|\\.)*"', re.DOTALL)
+_SCALAR = re.compile(br'[^,}\]\s]*')
+_STRUCTURE = re.compile(br'["{}\[\]]')
 
 
 class JsonFile(source.Source):
-    """Source for json files"""
+    """Source for json files
+
+    With a `root` keypath only the subtree at that path is parsed. The
+    file is memory-mapped and all other values are skipped without
+    being decoded. Projections decode only their included subtrees
+    the same way.
+    """
 
-    def __init__(self, source, **kwargs):
+    def __init__(self, source, root=None, **kwargs):
+        self._intern = kwargs.pop('intern', False)
         super(JsonFile, self).__init__(**kwargs)
         self._source = source
+        # stat signature of the file at the last read
+        self._read_stat = None
+        self._root = tuple(root or ())
+        self._pairs_hook = interning.intern_pairs if self._intern else None
+
+    def fingerprint(self):
+        return source.stat_fingerprint(self._source)
+
+    def _read_fingerprint(self):
+        return self._read_stat
 
     def _read(self):
-        with open(self._source) as fh:
-            return json.load(fh)
+        self._read_stat = self.fingerprint()
+        return self._read_included(self._projection)
+
+    def _read_included(self, projection):
+        prefixes = [()]
+        if projection is not None:
+            # projections only decode the subtrees they include
+            prefixes = projection.prefixes
+
+        if not self._root and prefixes == [()]:
+            with open(self._source) as fh:
+                return json.load(fh, object_pairs_hook=self._pairs_hook)
+
+        with open(self._source, 'rb') as fh:
+            buf = _map(fh)
+            if buf is None:
+                raise ValueError("Empty json file '%s'" % self._source)
+            try:
+                start = 0
+                if self._root:
+                    root = _find_subtree(buf, self._root)
+                    if root is None:
+                        return {}
+                    start = root[0]
+                    if buf[start:start+1] != b'{':
+                        raise ValueError(
+                            "Root '%s' of '%s' is no json object"
+                            % ('.'.join(self._root), self._source))
+
+                data = {}
+                for prefix in prefixes:
+                    span = _find_subtree(buf, prefix, start)
+                    if span is None:
+                        continue
+                    begin, end = span
+                    value = json.loads(buf[begin:end].decode('utf-8'),
+                                       object_pairs_hook=self._pairs_hook)
+                    if not prefix:
+                        return value
+
+                    section = data
+                    for key in prefix[:-1]:
+                        section = section.setdefault(key, {})
+                    section[prefix[-1]] = value
+                return data
+            finally:
+                buf.close()
 
     def _write(self, data):
+        if self._root:
+            data = self._splice_subtree(data)
+            if data is None:
+                return
+
         with open(self._source, 'w') as fh:
             json.dump(data, fh)
+        # the file holds the written data now
+        self._read_stat = self.fingerprint()
+
+    def _splice_subtree(self, data):
+        """Replace only the bytes of the root subtree within the file
+
+        Returns None on success or the full document with data put
+        into place if the root keypath does not exist yet.
+        """
+        with open(self._source, 'rb') as fh:
+            buf = _map(fh)
+            span = None
+            if buf is not None:
+                try:
+                    span = _find_subtree(buf, self._root)
+                    if span is not None:
+                        head, tail = buf[:span[0]], buf[span[1]:]
+                finally:
+                    buf.close()
+
+        if span is None:
+            document = {}
+            if buf is not None:
+                with open(self._source) as fh:
+                    document = json.load(fh)
+            subdata = document
+            for key in self._root[:-1]:
+                subdata = subdata.setdefault(key, {})
+            subdata[self._root[-1]] = data
+            return document
+
+        with open(self._source, 'wb') as fh:
+            fh.write(head)
+            fh.write(json.dumps(data).encode('utf-8'))
+            fh.write(tail)
+        self._read_stat = self.fingerprint()
+
+
+def _map(fh):
+    """Return a read-only memory map of a file or None if it is empty"""
+    if os.fstat(fh.fileno()).st_size == 0:
+        # empty files cannot be mapped
+        return None
+    return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _skip_whitespace(buf, pos):
+    return _WHITESPACE.match(buf, pos).end()
+
+
+def _skip_value(buf, pos):
+    """Return the position right after the json value starting at pos"""
+    char = buf[pos:pos+1]
+
+    if char == b'"':
+        return _STRING.match(buf, pos).end()
+
+    if char not in (b'{', b'['):
+        return _SCALAR.match(buf, pos).end()
+
+    depth = 0
+    while True:
+        match = _STRUCTURE.search(buf, pos)
+        if match is None:
+            raise ValueError('Unexpected end of json document')
+
+        pos = match.start()
+        char = buf[pos:pos+1]
+        if char == b'"':
+            pos = _STRING.match(buf, pos).end()
+            continue
+
+        pos += 1
+        if char in (b'{', b'['):
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return pos
+
+
+def _find_subtree(buf, keychain, pos=0):
+    """Return the byte span of the value at keychain or None
+
+    The keychain is looked up in the value starting at pos. Like
+    json.load, the last of duplicate keys wins.
+    """
+    pos = _skip_whitespace(buf, pos)
+
+    for wanted in keychain:
+        if buf[pos:pos+1] != b'{':
+            return None
+        pos = _skip_whitespace(buf, pos + 1)
+
+        found = None
+        while buf[pos:pos+1] == b'"':
+            end = _STRING.match(buf, pos).end()
+            key = json.loads(buf[pos:end].decode('utf-8'))
+            pos = _skip_whitespace(buf, end)
+            if buf[pos:pos+1] != b':':
+                raise ValueError('Malformed json document at %d' % pos)
+            pos = _skip_whitespace(buf, pos + 1)
+
+            if key == wanted:
+                found = pos
+
+            pos = _skip_whitespace(buf, _skip_value(buf, pos))
+            if buf[pos:pos+1] == b',':
+                pos = _skip_whitespace(buf, pos + 1)
+
+        if found is None:
+            return None
+        pos = found
+
+    return pos, _skip_value(buf, pos)
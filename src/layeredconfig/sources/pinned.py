@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+from layeredconfig import source
+
+
+class PinnedSource(source.Source):
+    """Read-only version of the data another source holds right now
+
+    Writes never change the data of a source in place, so keeping a
+    reference to it is enough to pin the version. Lazy sources that
+    were not read yet are read on first use.
+    """
+
+    def __init__(self, pinned, **kwargs):
+        kwargs.update(
+            meta=source.MetaInfo(readonly=True,
+                                 is_typed=pinned.is_typed(),
+                                 source_name=pinned._meta.source_name),
+            type_map=pinned._custom_types,
+            name=pinned._label,
+            lazy=pinned.is_lazy(),
+        )
+        super(PinnedSource, self).__init__(**kwargs)
+
+        self._pinned = None
+        self._data = None
+        if pinned.is_lazy() and pinned._cache is None:
+            self._pinned = pinned
+        else:
+            self._data = pinned._get_data()
+        self._generation = pinned.generation()
+
+    def _hash_stamp(self):
+        # the pinned data never changes
+        return 'pinned'
+
+    def _read(self):
+        if self._data is None:
+            self._data = self._pinned._get_data()
+            self._pinned = None
+        return self._data
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+from layeredconfig import source
+
+
+class ProjectedSource(source.Source):
+    """Read-only view of the included subtrees of another source
+
+    Sources that can read single subtrees only read the included ones
+    for the view as long as they did not read all of their data. Other
+    sources, like those of file objects which can only be read once,
+    are projected after reading. The view keeps the projected data as
+    long as the other source is unchanged but neither has a cache file
+    nor a watcher of its own and follows the writes and reloads of the
+    other source.
+    """
+
+    def __init__(self, origin, include, **kwargs):
+        kwargs.update(
+            meta=source.MetaInfo(readonly=origin._meta.readonly,
+                                 is_typed=origin.is_typed(),
+                                 source_name=origin._meta.source_name),
+            type_map=origin._custom_types,
+            name=origin._label,
+            lazy=origin.is_lazy(),
+            include=include,
+            # the projection is kept below as long as the origin is
+            # unchanged instead
+            cached=False,
+        )
+        super(ProjectedSource, self).__init__(**kwargs)
+
+        self._origin = origin
+        # (version of the origin, projected data)
+        self._projected = None
+
+    def add_listener(self, listener):
+        self._origin.add_listener(listener)
+
+    def remove_listener(self, listener):
+        self._origin.remove_listener(listener)
+
+    def reload(self):
+        self._origin.reload()
+
+    def generation(self):
+        return self._origin.generation()
+
+    def _hash_stamp(self):
+        stamp = self._origin._hash_stamp()
+        if stamp is None:
+            return None
+        return (self._origin.generation(), stamp)
+
+    def _load(self):
+        # origins that cannot tell whether their data changed are
+        # projected on every read
+        version = self._hash_stamp()
+        projected = self._projected
+        if version is not None and projected is not None and \
+                projected[0] == version:
+            return projected[1]
+
+        data = super(ProjectedSource, self)._load()
+        if version is not None:
+            self._projected = (version, data)
+        return data
+
+    def _read(self):
+        origin = self._origin
+        if origin._cache is None and origin._projection is None:
+            # nothing was read that could be projected
+            return origin._read_included(self._projection)
+        return origin._get_data()
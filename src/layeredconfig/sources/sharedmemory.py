@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+import struct
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    # py<3.8
+    pass
+
+from layeredconfig import packed, source
+
+MAGIC = b'LCSHM\r\n\0'
+
+# the control segment only holds the current generation. Every
+# generation lives in its own data segment which repeats the
+# generation in its header to detect torn reads of the control segment.
+_CONTROL = struct.Struct('<Q')
+_HEADER = struct.Struct('<8sQ')
+
+
+def _check_dependencies():
+    try:
+        assert shared_memory
+    except NameError:
+        raise ImportError('Shared memory sources require python 3.8'
+                          ' or newer')
+
+
+def _segment_name(name, generation):
+    return '%s-%d' % (name, generation)
+
+
+def _attach(name):
+    segment = shared_memory.SharedMemory(name=name)
+    # only the publisher owns the segments. Otherwise the resource
+    # tracker of an exiting worker would unlink them for everyone.
+    try:
+        resource_tracker.unregister(segment._name, 'shared_memory')
+    except Exception:
+        pass
+    return segment
+
+
+class SharedMemory(source.Source):
+    """Read-only source for configs published into shared memory
+
+    Values are decoded directly from the shared segment on access so
+    that workers do not hold copies of the config. A new generation
+    published by the SharedMemoryPublisher is picked up on the next
+    access.
+    """
+
+    def __init__(self, name, **kwargs):
+        _check_dependencies()
+
+        super(SharedMemory, self).__init__(**kwargs)
+        self._name = name
+        self._control = _attach(name)
+        self._data = None
+        self._loaded_generation = None
+
+    def dump(self):
+        return packed.unpack(self._get_data())
+
+    def fingerprint(self):
+        return '%s:%d' % (self._name, self._current_generation())
+
+    def _current_generation(self):
+        return _CONTROL.unpack_from(self._control.buf, 0)[0]
+
+    def _read(self):
+        generation = self._current_generation()
+        # generation 0 means that nothing was published yet
+        while generation and generation != self._loaded_generation:
+            try:
+                segment = _attach(_segment_name(self._name, generation))
+            except (OSError, ValueError):
+                # the publisher already moved on to a newer generation
+                generation = self._current_generation()
+                continue
+
+            magic, header_generation = _HEADER.unpack_from(segment.buf, 0)
+            if magic != MAGIC or header_generation != generation:
+                segment.close()
+                generation = self._current_generation()
+                continue
+
+            # segments of older generations stay mapped for as long
+            # as values handed out for them are still referenced
+            self._data = packed.PackedMapping(segment.buf, _HEADER.size,
+                                              owner=segment)
+            self._loaded_generation = generation
+
+        return {} if self._data is None else self._data
+
+    def close(self):
+        self._data = self._loaded_generation = None
+        self._control.close()
+
+
+class SharedMemoryPublisher(object):
+    """Publishes merged configs for SharedMemory sources"""
+
+    def __init__(self, name):
+        _check_dependencies()
+
+        self.name = name
+        self.generation = 0
+        self._segment = None
+        self._control = shared_memory.SharedMemory(name=name, create=True,
+                                                   size=_CONTROL.size)
+        _CONTROL.pack_into(self._control.buf, 0, self.generation)
+
+    def publish(self, config):
+        """Publish a config, source or dict as the next generation"""
+        data = config.dump() if hasattr(config, 'dump') else config
+        generation = self.generation + 1
+
+        out = packed.pack(data, offset=_HEADER.size)
+        _HEADER.pack_into(out, 0, MAGIC, generation)
+
+        segment = shared_memory.SharedMemory(
+            name=_segment_name(self.name, generation),
+            create=True, size=len(out))
+        segment.buf[:len(out)] = out
+
+        # readers switch over as soon as the generation was bumped.
+        # Unlinking the previous segment keeps it mapped for readers
+        # which still use it.
+        _CONTROL.pack_into(self._control.buf, 0, generation)
+        previous, self._segment = self._segment, segment
+        self.generation = generation
+
+        if previous is not None:
+            previous.close()
+            previous.unlink()
+        return generation
+
+    def close(self):
+        for segment in (self._segment, self._control):
+            if segment is not None:
+                segment.close()
+                segment.unlink()
+        self._segment = self._control = None
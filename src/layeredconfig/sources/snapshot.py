@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import json
+import mmap
+import os
+import struct
+import zlib
+
+from layeredconfig import packed, source
+
+MAGIC = b'LCSNAP\r\n'
+VERSION = 1
+
+# magic, format version, crc32 of everything after the header and
+# the length of the fingerprint block which precedes the packed data
+_HEADER = struct.Struct('<8sHII')
+_CHUNK_SIZE = 1024 * 1024
+
+
+class Snapshot(source.Source):
+    """Read-only source for snapshots of merged configs
+
+    The snapshot file is memory-mapped and values are only decoded when
+    they are accessed.
+    """
+
+    def __init__(self, source, verify=True, **kwargs):
+        super(Snapshot, self).__init__(**kwargs)
+        self._source = source
+
+        with open(source, 'rb') as fh:
+            self._buffer = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.fingerprints, self._data = read_snapshot(self._buffer, verify)
+
+    def is_stale(self, *sources):
+        """Check the given sources against the recorded fingerprints"""
+        if len(sources) != len(self.fingerprints):
+            return True
+
+        for (source_name, fingerprint), src in zip(self.fingerprints, sources):
+            if source_name != src._meta.source_name:
+                return True
+            if fingerprint != src.fingerprint():
+                return True
+        return False
+
+    def dump(self):
+        return packed.unpack(self._data)
+
+    def fingerprint(self):
+        return source.stat_fingerprint(self._source)
+
+    def _read(self):
+        # packed data is immutable so there is no need for copies
+        return self._data
+
+
+def write_snapshot(path, data, sources):
+    dump_snapshot(path, data, [[src._meta.source_name, src.fingerprint()]
+                               for src in sources])
+
+
+def dump_snapshot(path, data, fingerprints):
+    fingerprints = json.dumps(fingerprints).encode('utf-8')
+
+    out = packed.pack(data, offset=_HEADER.size + len(fingerprints))
+    out[_HEADER.size:_HEADER.size+len(fingerprints)] = fingerprints
+    _HEADER.pack_into(out, 0, MAGIC, VERSION,
+                      _checksum(out, _HEADER.size), len(fingerprints))
+
+    # write to a temporary file first so that readers never
+    # map a partially written snapshot
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as fh:
+        fh.write(out)
+    os.rename(tmp_path, path)
+
+
+def load_snapshot(path):
+    """Return the fingerprints and the unpacked data of a snapshot"""
+    with open(path, 'rb') as fh:
+        fingerprints, data = read_snapshot(fh.read())
+    return fingerprints, packed.unpack(data)
+
+
+def read_snapshot(buf, verify=True):
+    try:
+        magic, version, checksum, length = _HEADER.unpack_from(buf, 0)
+    except struct.error:
+        raise ValueError('Snapshot is truncated')
+
+    if magic != MAGIC:
+        raise ValueError('Not a config snapshot')
+    if version != VERSION:
+        raise ValueError('Unsupported snapshot version %d' % version)
+    if verify and checksum != _checksum(buf, _HEADER.size):
+        raise ValueError('Snapshot checksum mismatch')
+
+    fingerprints = buf[_HEADER.size:_HEADER.size+length]
+    fingerprints = [tuple(item) for item in
+                    json.loads(fingerprints.decode('utf-8'))]
+    return fingerprints, packed.PackedMapping(buf, _HEADER.size + length)
+
+
+def _checksum(buf, start):
+    checksum = 0
+    for offset in range(start, len(buf), _CHUNK_SIZE):
+        checksum = zlib.crc32(bytes(buf[offset:offset+_CHUNK_SIZE]),
+                              checksum)
+    return checksum & 0xffffffff
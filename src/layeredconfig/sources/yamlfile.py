@@ -5,7 +5,7 @@ try:
 except ImportError:
     pass
 
-from layeredconfig import source
+from layeredconfig import interning, source
 
 
 class YamlFile(source.Source):
@@ -18,13 +18,31 @@ class YamlFile(source.Source):
             raise ImportError('You are missing the optional'
                               ' dependency "pyyaml"')
 
+        self._intern = kwargs.pop('intern', False)
         super(YamlFile, self).__init__(**kwargs)
         self._source = source
+        # stat signature of the file at the last read
+        self._read_stat = None
+
+    def fingerprint(self):
+        return source.stat_fingerprint(self._source)
+
+    def _read_fingerprint(self):
+        return self._read_stat
 
     def _read(self):
+        self._read_stat = self.fingerprint()
         with open(self._source) as fh:
-            return yaml.load(fh)
+            # the loader of yaml.load by default, which pyyaml 6
+            # requires to be passed
+            data = yaml.load(fh, Loader=getattr(yaml, 'FullLoader',
+                                                yaml.Loader))
+        if self._intern:
+            interning.intern_data(data)
+        return data
 
     def _write(self, data):
         with open(self._source, 'w') as fh:
             yaml.dump(data, fh)
+        # the file holds the written data now
+        self._read_stat = self.fingerprint()
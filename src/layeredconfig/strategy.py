@@ -1,16 +1,153 @@
 # -*- coding: utf-8 -*-
 
-def add(next_, previous=None):
-    if previous is None:
-        return next_
-    return previous + next_
+import functools
+import itertools
+import operator
 
+import six
 
-def collect(next_, previous=None):
-    if previous is None:
-        return [next_]
-    return previous + [next_]
+from .source import Mapping
 
 
-def merge(next_, previous=None):
-    return add(next_, previous)
+class Strategy(object):
+    """Folds the values of a key from consecutive sources
+
+    A lookup starts with initialize(), passes every value from the
+    highest to the lowest prioritized source to accumulate() and
+    returns the result of finalize(). Accumulators are private to a
+    single lookup and may be changed in place, values must not be.
+    """
+
+    # pass subsections as dicts instead of merging them into
+    # a sublevel config
+    folds_sections = False
+
+    def initialize(self):
+        raise NotImplementedError
+
+    def accumulate(self, accumulator, value):
+        raise NotImplementedError
+
+    def finalize(self, accumulator):
+        raise NotImplementedError
+
+    def __call__(self, next_, previous=None):
+        """Fold a single value into a previous result"""
+        raise NotImplementedError
+
+
+class FunctionStrategy(Strategy):
+    """Adapts plain fn(next_, previous=None) functions"""
+
+    def __init__(self, function):
+        self.function = function
+
+    def initialize(self):
+        return None
+
+    def accumulate(self, accumulator, value):
+        return self.function(value, accumulator)
+
+    def finalize(self, accumulator):
+        return accumulator
+
+    def __call__(self, next_, previous=None):
+        return self.function(next_, previous)
+
+
+class Collect(Strategy):
+    """Collects all values into a list"""
+
+    def initialize(self):
+        return []
+
+    def accumulate(self, accumulator, value):
+        accumulator.append(value)
+        return accumulator
+
+    def finalize(self, accumulator):
+        return accumulator
+
+    def __call__(self, next_, previous=None):
+        if previous is None:
+            return [next_]
+        return previous + [next_]
+
+
+class Add(Collect):
+    """Adds up all values
+
+    Lists, tuples, strings and sets are joined in a single step instead
+    of adding them up pairwise.
+    """
+
+    # joins for values which all are of the same kind
+    _joins = [
+        (list, lambda values: list(itertools.chain.from_iterable(values))),
+        (tuple, lambda values: tuple(itertools.chain.from_iterable(values))),
+        (six.text_type, lambda values: u''.join(values)),
+        (six.binary_type, lambda values: b''.join(values)),
+        ((set, frozenset), lambda values: type(values[0])().union(*values)),
+    ]
+
+    def finalize(self, accumulator):
+        for types, join in self._joins:
+            if all(isinstance(value, types) for value in accumulator):
+                return join(accumulator)
+
+        return functools.reduce(operator.add, accumulator)
+
+    def __call__(self, next_, previous=None):
+        if previous is None:
+            return next_
+        return previous + next_
+
+
+class Merge(Add):
+    """Deep merges mappings and adds up all other values
+
+    Within mappings, values of higher prioritized sources win unless
+    both sides are mappings again. Every section is copied once, so the
+    result never shares sections with the values and may be changed.
+    """
+
+    folds_sections = True
+
+    def finalize(self, accumulator):
+        if not isinstance(accumulator[0], Mapping):
+            return super(Merge, self).finalize(accumulator)
+
+        result = {}
+        for value in accumulator:
+            if isinstance(value, Mapping):
+                self._merge_into(result, value)
+        return result
+
+    def _merge_into(self, target, mapping):
+        for key, value in mapping.items():
+            if key not in target:
+                if isinstance(value, Mapping):
+                    value = self._merge_into({}, value)
+                target[key] = value
+                continue
+
+            current = target[key]
+            if isinstance(current, Mapping) and isinstance(value, Mapping):
+                self._merge_into(current, value)
+        return target
+
+    def __call__(self, next_, previous=None):
+        if previous is None:
+            return next_
+        return self.finalize([previous, next_])
+
+
+def as_strategy(strategy):
+    if isinstance(strategy, Strategy):
+        return strategy
+    return FunctionStrategy(strategy)
+
+
+add = Add()
+collect = Collect()
+merge = Merge()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+try:
+    import yaml
+except ImportError:
+    pass
+
+from .source import Mapping
+
+START, VALUE, END = 'start', 'value', 'end'
+
+
+def iter_events(items, is_section=None, convert=None):
+    """Walk a tree depth-first and yield (event, keypath, value)
+
+    Sections are announced with START and closed with END, all other
+    values come as VALUE events. Only the iterators of the sections on
+    the current path are held at any time and the walk does not
+    recurse, so neither the width nor the depth of the tree is limited
+    by anything but the sections themselves.
+    """
+    is_section = is_section or (lambda value: isinstance(value, Mapping))
+
+    yield START, (), None
+    stack = [iter(items)]
+    keypath = ()
+
+    while stack:
+        for key, value in stack[-1]:
+            if is_section(value):
+                keypath += (key,)
+                yield START, keypath, None
+                stack.append(iter(value.items()))
+                break
+
+            if convert is not None:
+                value = convert(keypath + (key,), value)
+            yield VALUE, keypath + (key,), value
+        else:
+            stack.pop()
+            yield END, keypath, None
+            keypath = keypath[:-1]
+
+
+def write_json(fh, events, indent=None):
+    """Encode the events of a walk as json into fh"""
+    if indent is None:
+        encoder = json.JSONEncoder(separators=(',', ':'))
+    else:
+        encoder = json.JSONEncoder(indent=indent, separators=(',', ': '))
+    newline = '\n' if indent is not None else ''
+    separator = ': ' if indent is not None else ':'
+    # whether the section on the current depth already has members
+    filled = []
+
+    for event, keypath, value in events:
+        if event == END:
+            if filled.pop() and indent is not None:
+                fh.write(newline + ' ' * (indent * len(filled)))
+            fh.write('}')
+            continue
+
+        if filled:
+            fh.write(',' if filled[-1] else '')
+            filled[-1] = True
+            fh.write(newline + ' ' * (indent or 0) * len(filled))
+            fh.write(encoder.encode(keypath[-1]) + separator)
+
+        if event == START:
+            fh.write('{')
+            filled.append(False)
+        elif indent is None:
+            fh.write(encoder.encode(value))
+        else:
+            # lists are indented relative to their key
+            fh.write(encoder.encode(value).replace(
+                '\n', newline + ' ' * indent * len(filled)))
+
+
+def write_yaml(fh, events):
+    """Encode the events of a walk as yaml block mappings into fh"""
+    try:
+        assert yaml
+    except NameError:
+        raise ImportError('You are missing the optional'
+                          ' dependency "pyyaml"')
+
+    dumper = yaml.SafeDumper(fh, default_flow_style=False)
+    dumper.open()
+    try:
+        for event, keypath, value in events:
+            if event == END:
+                dumper.emit(yaml.MappingEndEvent())
+                if not keypath:
+                    dumper.emit(yaml.DocumentEndEvent())
+                continue
+
+            if keypath:
+                _emit_node(dumper, keypath[-1])
+            elif event == START:
+                dumper.emit(yaml.DocumentStartEvent())
+
+            if event == START:
+                dumper.emit(yaml.MappingStartEvent(
+                    anchor=None, tag=None, implicit=True,
+                    flow_style=False))
+            else:
+                _emit_node(dumper, value)
+        dumper.close()
+    finally:
+        dumper.dispose()
+
+
+def _emit_node(dumper, value):
+    # represent and serialize single values with the dumper but forget
+    # about them afterwards so that the dumper does not keep every
+    # value around to create aliases
+    node = dumper.represent_data(value)
+    dumper.anchor_node(node)
+    dumper.serialize_node(node, None, None)
+
+    dumper.represented_objects = {}
+    dumper.object_keeper = []
+    dumper.alias_key = None
+    dumper.anchors = {}
+    dumper.serialized_nodes = {}
+
+
+WRITERS = {
+    'json': write_json,
+    'yaml': write_yaml,
+}
+
+
+def dump_to(fh, items, format='json', is_section=None, convert=None,
+            **options):
+    """Stream a tree of (key, value) pairs into fh"""
+    try:
+        writer = WRITERS[format]
+    except KeyError:
+        raise ValueError("Unknown format '%s'" % format)
+
+    writer(fh, iter_events(items, is_section, convert), **options)
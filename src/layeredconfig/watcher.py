@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import weakref
+
+DEFAULT_INTERVAL = 1.0
+DEFAULT_DEBOUNCE = 0.5
+
+_default = None
+_default_lock = threading.Lock()
+
+
+class _Entry(object):
+
+    def __init__(self, source):
+        self.source = weakref.ref(source)
+        # fingerprint of the loaded data, unknown until the first poll
+        self.fingerprint = None
+        # changed fingerprint and when it was first seen
+        self.pending = None
+        self.since = None
+
+
+class FileWatcher(object):
+    """Reloads sources in a background thread when their files change
+
+    The fingerprints of all watched sources, which are stat signatures
+    for file based sources, are polled every interval seconds. A change
+    is only picked up after the fingerprint did not change any further
+    for debounce seconds so that bursts of writes cause a single
+    reload. The new data is read by the watcher thread and swapped into
+    the cache of the source at once, see CacheMixin.refresh(). Files
+    that cannot be parsed, for instance because they are still being
+    written, leave the previous data in place.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, debounce=DEFAULT_DEBOUNCE):
+        self.interval = interval
+        self.debounce = debounce
+        self._entries = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def watch(self, source):
+        """Watch a (cached) source and start polling if necessary"""
+        with self._lock:
+            self._entries.append(_Entry(source))
+            if self._thread is None:
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def unwatch(self, source):
+        with self._lock:
+            self._entries = [entry for entry in self._entries
+                             if entry.source() is not source]
+
+    def is_watching(self, source):
+        return any(entry.source() is source for entry in self._entries)
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        self._stopped.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def poll(self, now=None):
+        """Check all sources once and reload the settled changes"""
+        now = time.time() if now is None else now
+
+        with self._lock:
+            entries = list(self._entries)
+
+        for entry in entries:
+            source = entry.source()
+            if source is None:
+                with self._lock:
+                    self._entries = [other for other in self._entries
+                                     if other is not entry]
+                continue
+            self._check(entry, source, now)
+
+    def _check(self, entry, source, now):
+        if not source._initialized:
+            # registered from within its __init__
+            return
+
+        try:
+            fingerprint = source.fingerprint()
+        except (IOError, OSError):
+            # the file is being replaced
+            fingerprint = 'missing'
+
+        if entry.fingerprint is None:
+            entry.fingerprint = fingerprint
+            return
+
+        if fingerprint == entry.fingerprint:
+            entry.pending = None
+            return
+
+        if fingerprint != entry.pending:
+            entry.pending, entry.since = fingerprint, now
+            return
+
+        if now - entry.since < self.debounce:
+            return
+
+        entry.pending = None
+        try:
+            source.refresh()
+        except Exception:
+            # keep the previous data and only try again once the
+            # file changed another time
+            entry.fingerprint = fingerprint
+            return
+
+        try:
+            unchanged = source.fingerprint() == fingerprint
+        except (IOError, OSError):
+            unchanged = False
+        if unchanged:
+            entry.fingerprint = fingerprint
+        # otherwise the file changed while it was read and the next
+        # polls pick the change up again
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                # a broken source must not stop watching the others
+                pass
+
+
+def default_watcher():
+    """Return the watcher that is shared by all sources of the process"""
+    global _default
+
+    with _default_lock:
+        if _default is None:
+            _default = FileWatcher()
+        return _default
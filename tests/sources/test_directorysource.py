@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+
+import pytest
+
+from layeredconfig import DirectorySource
+
+
+@pytest.fixture
+def confd(tmpdir):
+    def write(name, data):
+        path = tmpdir / name
+        path.write(json.dumps(data))
+        # make sure that every write changes the stat signature
+        stat = os.stat(str(path))
+        os.utime(str(path), (stat.st_atime, stat.st_mtime + write.offset))
+        write.offset += 1
+        return path
+    write.offset = 1
+
+    write('10-base.json', {'a': 1, 'b': {'c': 2, 'd': 3}})
+    write('20-override.json', {'b': {'c': 20}, 'e': 4})
+    tmpdir.join('30-notes.txt').write('ignored')
+    tmpdir.join('40-backup.json~').write('ignored')
+    tmpdir.write = write
+    return tmpdir
+
+
+def test_merge_fragments_by_filename(confd):
+    config = DirectorySource(str(confd))
+
+    assert config.dump() == {'a': 1, 'b': {'c': 20, 'd': 3}, 'e': 4}
+    assert config.fragment('b.c') == '20-override.json'
+    assert config.fragment('b.d') == '10-base.json'
+    with pytest.raises(KeyError):
+        config.fragment('b.x')
+
+
+def test_do_not_change_fragments_while_merging(confd):
+    config = DirectorySource(str(confd))
+    config.dump()
+
+    fragments = [data for _, data in config._fragments.values()]
+    assert {'a': 1, 'b': {'c': 2, 'd': 3}} in fragments
+    assert {'b': {'c': 20}, 'e': 4} in fragments
+
+
+def test_parse_fragments_in_parallel(confd):
+    for index in range(20):
+        confd.write('5%02d.json' % index, {'key%d' % index: index})
+
+    config = DirectorySource(str(confd), workers=4)
+
+    assert config.key19 == 19
+    assert len(config._fragments) == 22
+
+
+def test_reload_only_changed_fragments(confd, monkeypatch):
+    config = DirectorySource(str(confd))
+    config.dump()
+
+    parsed = []
+    parse = config._parse_fragment
+
+    def inspect(path):
+        parsed.append(os.path.basename(path))
+        return parse(path)
+
+    monkeypatch.setattr(config, '_parse_fragment', inspect)
+    confd.write('20-override.json', {'b': {'c': 200}})
+    confd.write('15-new.json', {'f': 5})
+    confd.join('10-base.json').remove()
+    config.reload()
+
+    assert sorted(parsed) == ['15-new.json', '20-override.json']
+    assert config.dump() == {'b': {'c': 200}, 'f': 5}
+
+
+def test_directory_fingerprint(confd):
+    config = DirectorySource(str(confd))
+    fingerprint = config.fingerprint()
+
+    assert config.fingerprint() == fingerprint
+
+    confd.write('20-override.json', {})
+    assert config.fingerprint() != fingerprint
+
+
+def test_yaml_fragments(confd):
+    pytest.importorskip('yaml')
+    confd.join('50-extra.yaml').write('b:\n  d: 30\n')
+    confd.join('60-empty.yml').write('')
+
+    config = DirectorySource(str(confd))
+
+    assert config.b.d == 30
+
+
+def test_reject_fragments_without_mapping(confd):
+    confd.write('50-list.json', [1, 2])
+
+    with pytest.raises(ValueError):
+        DirectorySource(str(confd)).dump()
+
+
+def test_directory_source_is_readonly(confd):
+    config = DirectorySource(str(confd))
+
+    with pytest.raises(TypeError):
+        config.a = 10
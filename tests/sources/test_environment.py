@@ -38,3 +38,24 @@ def test_write_environment_source(monkeypatch):
     assert config.a == '10'  # looses typing information
     assert config.b.c == '20'
     assert config.b.d == {'e': '30'}
+
+
+def test_intern_environment_source(monkeypatch):
+    monkeypatch.setenv('MVP_A_NAME', 'shared value')
+
+    first = Environment(prefix='MVP_', intern=True).dump()
+    second = Environment(prefix='MVP_', intern=True).dump()
+
+    assert first == {'a': {'name': 'shared value'}}
+    assert first['a']['name'] is second['a']['name']
+
+
+def test_project_environment_source(monkeypatch):
+    monkeypatch.setenv('MVP_A', '1')
+    monkeypatch.setenv('MVP_B_C', '2')
+    monkeypatch.setenv('MVP_BC_D', '3')
+    monkeypatch.setenv('MVP_E_F', '4')
+
+    config = Environment(prefix='MVP_', include=['b', 'e.*'])
+
+    assert config.dump() == {'b': {'c': '2'}, 'e': {'f': '4'}}
@@ -1,8 +1,13 @@
 # -*- coding: utf-8 -*-
 
+import socket
+import threading
+import time
+
 import pytest
 
-from layeredconfig import EtcdStore
+from layeredconfig import EtcdStore, LayeredConfig
+from layeredconfig.fakeetcd import FakeEtcd
 from layeredconfig.sources.etcdstore import EtcdConnector
 
 try:
@@ -20,6 +25,10 @@ def connector():
         def __init__(self):
             self.get_data = {}
             self.set_data = {}
+            self.put_args = {}
+            self.deleted = {}
+            self.index = 10
+            self.last_index = '10'
 
         @pytest.helpers.inspector
         def get(self, *args, **kwargs):
@@ -29,24 +38,39 @@ def connector():
         def set(self, *items):
             self.set_data.update(items)
 
+        @pytest.helpers.inspector
+        def put(self, key, value=None, **kwargs):
+            self.index += 1
+            self.set_data[key] = value
+            self.put_args[key] = kwargs
+            return {'node': {'key': key, 'value': '%s' % value,
+                             'modifiedIndex': self.index}}
+
+        @pytest.helpers.inspector
+        def delete(self, key, **kwargs):
+            self.deleted[key] = kwargs
+
     connector = Connector()
     connector.get_data = {
         'node': {
             'nodes': [{
-                'key': 'a',
-                'value': '1'
+                'key': '/a',
+                'value': '1',
+                'modifiedIndex': 1
              }, {
-                'key': 'b',
+                'key': '/b',
                 'dir': True,
                 'nodes': [{
-                    'key': 'c',
-                    'value': '2'
+                    'key': '/b/c',
+                    'value': '2',
+                    'modifiedIndex': 2
                 }, {
-                    'key': 'd',
+                    'key': '/b/d',
                     'dir': True,
                     'nodes': [{
-                        'key': 'e',
-                        'value': '3'
+                        'key': '/b/d/e',
+                        'value': '3',
+                        'modifiedIndex': 3
                     }]
                 }]
             }]
@@ -55,12 +79,33 @@ def connector():
     return connector
 
 
+@pytest.fixture
+def etcd():
+    with FakeEtcd() as etcd:
+        etcd.set('/a', '1')
+        etcd.set('/b/c', '2')
+        yield etcd
+
+
+@pytest.fixture
+def dead_url():
+    # a port nobody listens on
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return 'http://127.0.0.1:%d/v2' % port
+
+
 @pytest.mark.parametrize('key', ['/', '/a'])
 def test_etcd_connector_get_data(monkeypatch, key):
     url = 'http://fake-url:2379'
     connector = EtcdConnector(url)
 
     class Response(object):
+        status_code = 200
+        headers = {'X-Etcd-Index': '1'}
+
         def json(self):
             return {}
 
@@ -81,14 +126,79 @@ def test_etcd_connector_set_data(monkeypatch, key, value):
     url = 'http://fake-url:2379'
     connector = EtcdConnector(url)
 
+    class Response(object):
+        status_code = 200
+
     def put(*args, **kwargs):
         assert url + '/keys' + key == args[0]
         assert value == kwargs['data']['value']
+        return Response()
 
     monkeypatch.setattr('layeredconfig.sources.etcdstore.requests.put', put)
     connector.set((key, value))
 
 
+@pytest.mark.parametrize('kwargs, params', [
+    ({}, {}),
+    ({'prev_index': 3}, {'prevIndex': 3}),
+    ({'prev_exist': False}, {'prevExist': 'false'}),
+])
+def test_etcd_connector_put_data(monkeypatch, kwargs, params):
+    url = 'http://fake-url:2379'
+    connector = EtcdConnector(url)
+
+    class Response(object):
+        status_code = 200
+
+        def json(self):
+            return {'node': {'key': '/a', 'value': '1'}}
+
+    def put(*args, **kwargs):
+        assert url + '/keys/a' == args[0]
+        assert kwargs['params'] == params
+        assert kwargs['data'] == {'value': 1}
+        return Response()
+
+    monkeypatch.setattr('layeredconfig.sources.etcdstore.requests.put', put)
+    assert connector.put('/a', 1, **kwargs)['node']['value'] == '1'
+
+
+def test_etcd_connector_detects_concurrent_modification(monkeypatch):
+    connector = EtcdConnector('http://fake-url:2379')
+
+    class Response(object):
+        status_code = 412
+        text = '{"errorCode":101,"message":"Compare failed"}'
+
+    def put(*args, **kwargs):
+        return Response()
+
+    monkeypatch.setattr('layeredconfig.sources.etcdstore.requests.put', put)
+    with pytest.raises(ValueError) as exc_info:
+        connector.put('/a', 1, prev_index=3)
+    assert 'modified concurrently' in str(exc_info.value)
+
+
+def test_etcd_connector_deletes_directories(monkeypatch):
+    url = 'http://fake-url:2379'
+    connector = EtcdConnector(url)
+
+    class Response(object):
+        status_code = 200
+
+        def json(self):
+            return {}
+
+    def delete(*args, **kwargs):
+        assert url + '/keys/b' == args[0]
+        assert kwargs['params'] == {'dir': 'true', 'recursive': 'true'}
+        return Response()
+
+    monkeypatch.setattr('layeredconfig.sources.etcdstore.requests.delete',
+                        delete)
+    connector.delete('/b', recursive=True)
+
+
 def test_lazy_read_etcd_source(connector):
     config = EtcdStore('bogus-url')
     config._connector = connector
@@ -118,3 +228,327 @@ def test_write_etcd_source(connector):
     assert data['/a'] == '10'
     assert data['/b/c'] == '20'
     assert data['/b/d/e'] == '30'
+
+
+def test_write_only_changed_etcd_values(connector):
+    config = EtcdStore('bogus-url')
+    config._connector = connector
+
+    config.b.c = '20'
+    config.b.d.e = '3'
+    config.write_cache()
+
+    assert connector.set_data == {'/b/c': '20'}
+    assert connector.put_args['/b/c'] == {'prev_index': 2}
+
+    # the new index is used for the next write
+    config.b.c = '21'
+    config.write_cache()
+
+    assert connector.put_args['/b/c'] == {'prev_index': 11}
+
+
+def test_write_new_etcd_values(connector):
+    config = EtcdStore('bogus-url')
+    config._connector = connector
+
+    config.f = {'g': '4', 'h': {}}
+    config.write_cache()
+
+    assert connector.set_data == {'/f/g': '4', '/f/h': None}
+    assert connector.put_args['/f/g'] == {'prev_exist': False}
+    assert connector.put_args['/f/h'] == {'dir': True, 'prev_exist': False}
+
+
+def test_delete_removed_etcd_keys(connector):
+    config = EtcdStore('bogus-url')
+    config._connector = connector
+
+    del config['a']
+    del config.b['d']
+    config.write_cache()
+
+    assert connector.deleted == {
+        '/a': {'prev_index': 1},
+        '/b/d': {'recursive': True},
+    }
+    assert connector.put.calls == 0
+
+
+def test_replace_etcd_directory_with_value(connector):
+    config = EtcdStore('bogus-url')
+    config._connector = connector
+
+    config.b.d = '5'
+    config.write_cache()
+
+    assert connector.deleted == {'/b/d': {'recursive': True}}
+    assert connector.set_data == {'/b/d': '5'}
+    assert connector.put_args['/b/d'] == {'prev_exist': False}
+
+
+def test_read_from_etcd(etcd):
+    config = EtcdStore(etcd.url)
+
+    assert config.dump() == {'a': '1', 'b': {'c': '2'}}
+    assert not config.is_stale()
+
+
+def test_write_to_etcd(etcd):
+    config = EtcdStore(etcd.url)
+
+    config.b.c = '20'
+    config.b.d = {'e': '3'}
+    config.write_cache()
+
+    assert EtcdStore(etcd.url).dump() == {
+        'a': '1', 'b': {'c': '20', 'd': {'e': '3'}}}
+
+    # somebody else changes a value in between
+    etcd.set('/b/c', '30')
+    config.b.c = '40'
+    with pytest.raises(ValueError) as exc_info:
+        config.write_cache()
+    assert 'modified concurrently' in str(exc_info.value)
+
+
+def test_etcd_failover(etcd, dead_url):
+    connector = EtcdConnector([dead_url, etcd.url])
+
+    assert connector.get('/a')['node']['value'] == '1'
+    # the answering member is tried first from now on
+    assert connector.urls == [etcd.url + '/keys', dead_url + '/keys']
+
+
+def test_etcd_retries_with_backoff(etcd):
+    connector = EtcdConnector(etcd.url, retries=2, backoff=0.01)
+    etcd.failures = 2
+
+    assert connector.get('/a')['node']['value'] == '1'
+    assert etcd.requests == 3
+
+    etcd.failures = 3
+    with pytest.raises(IOError):
+        connector.get('/a')
+
+
+def test_etcd_does_not_retry_writes_which_reached_etcd(etcd):
+    connector = EtcdConnector(etcd.url, retries=2, backoff=0.01)
+    etcd.failures = 1
+
+    with pytest.raises(IOError):
+        connector.put('/a', '10')
+    assert etcd.requests == 1
+
+
+def test_etcd_does_not_retry_writes_on_broken_connections(etcd,
+                                                          monkeypatch):
+    connector = EtcdConnector(etcd.url, retries=2, backoff=0.01)
+    index = connector.get('/a')['node']['modifiedIndex']
+    put = requests.put
+
+    def reset(*args, **kwargs):
+        # the connection breaks after etcd got the request
+        put(*args, **kwargs)
+        raise requests.ConnectionError('Connection reset by peer')
+    monkeypatch.setattr(requests, 'put', reset)
+
+    with pytest.raises(requests.ConnectionError):
+        connector.put('/a', '10', prev_index=index)
+    assert etcd.get('/a')['node']['value'] == '10'
+    assert etcd.requests == 2
+
+
+def test_etcd_retries_writes_which_did_not_connect(etcd, dead_url):
+    connector = EtcdConnector([dead_url, etcd.url], retries=0)
+
+    connector.put('/a', '10')
+    assert etcd.get('/a')['node']['value'] == '10'
+
+
+def test_etcd_timeout(etcd):
+    connector = EtcdConnector(etcd.url, timeout=0.05, retries=0)
+    etcd.latency = 0.5
+
+    with pytest.raises(IOError):
+        connector.get('/a')
+
+
+def test_serve_stale_etcd_data(etcd):
+    config = EtcdStore(etcd.url, serve_stale=True, retries=0)
+    assert config.a == '1'
+
+    etcd.failures = 1
+    config.reload()
+
+    assert config.a == '1'
+    assert config.is_stale()
+
+    etcd.set('/a', '10')
+    config.reload()
+
+    assert config.a == '10'
+    assert not config.is_stale()
+
+
+def test_fail_without_stale_etcd_data(etcd):
+    config = EtcdStore(etcd.url, retries=0)
+    assert config.a == '1'
+
+    etcd.failures = 1
+    with pytest.raises(IOError):
+        config.reload()
+
+
+def test_start_etcd_store_from_cache_file(etcd, dead_url, tmpdir):
+    cache_file = str(tmpdir / 'cache')
+    EtcdStore(etcd.url, cache_file=cache_file).dump()
+
+    # etcd did not change since so it is only asked for its index
+    requests = etcd.requests
+    config = EtcdStore(etcd.url, cache_file=cache_file)
+    assert config.dump() == {'a': '1', 'b': {'c': '2'}}
+
+    config._revalidation.join()
+    assert etcd.requests == requests + 1
+
+    # changes get loaded in the background
+    etcd.set('/a', '10')
+    config = EtcdStore(etcd.url, cache_file=cache_file)
+    assert config.a == '1'
+
+    config._revalidation.join()
+    assert config.a == '10'
+
+    # etcd is not needed to start at all
+    config = EtcdStore(dead_url, cache_file=cache_file, retries=0,
+                       serve_stale=True)
+    assert config.a == '10'
+
+    config._revalidation.join()
+    assert config.a == '10'
+
+    config.reload()
+    assert config.a == '10'
+    assert config.is_stale()
+
+
+def test_flag_cached_etcd_data_as_stale_while_unreachable(etcd, dead_url,
+                                                         tmpdir):
+    cache_file = str(tmpdir / 'cache')
+    EtcdStore(etcd.url, cache_file=cache_file).dump()
+
+    config = EtcdStore(dead_url, cache_file=cache_file, retries=0)
+    assert config.dump() == {'a': '1', 'b': {'c': '2'}}
+    config._revalidation.join()
+
+    assert config.is_stale()
+    assert config.b.is_stale()
+    assert config.dump() == {'a': '1', 'b': {'c': '2'}}
+
+
+def test_write_etcd_store_started_from_cache_file(etcd, tmpdir):
+    cache_file = str(tmpdir / 'cache')
+    EtcdStore(etcd.url, cache_file=cache_file).dump()
+
+    config = EtcdStore(etcd.url, cache_file=cache_file)
+    config.b.c = '20'
+    config.write_cache()
+
+    assert EtcdStore(etcd.url).dump() == {'a': '1', 'b': {'c': '20'}}
+
+
+def test_intern_etcd_source(etcd):
+    etcd.set('/b/name', 'shared value')
+
+    first = EtcdStore(etcd.url, intern=True).dump()
+    second = EtcdStore(etcd.url, intern=True).dump()
+
+    assert first['b']['name'] == 'shared value'
+    assert first['b']['name'] is second['b']['name']
+
+
+def test_project_etcd_source(etcd):
+    etcd.set('/d/e/f', '3')
+    etcd.set('/d/g', '4')
+    etcd.set('/h', '5')
+    requests_before = etcd.requests
+
+    config = EtcdStore(etcd.url, include=['b', 'd.e', 'h', 'missing'])
+
+    assert config.dump() == {'b': {'c': '2'}, 'd': {'e': {'f': '3'}},
+                             'h': '5'}
+    # one request per included prefix
+    assert etcd.requests - requests_before == 4
+    assert not config.is_writable()
+
+
+def test_project_etcd_config_without_fetching_other_subtrees(etcd,
+                                                             monkeypatch):
+    etcd.set('/d/e', '3')
+    source = EtcdStore(etcd.url)
+    fetched = []
+    get = EtcdConnector.get
+
+    def spy(self, key, **kwargs):
+        fetched.append(key)
+        return get(self, key, **kwargs)
+    monkeypatch.setattr(EtcdConnector, 'get', spy)
+
+    config = LayeredConfig(source, include=['b', 'd.e'])
+
+    assert config.dump() == {'b': {'c': '2'}, 'd': {'e': '3'}}
+    assert sorted(fetched) == ['/b', '/d/e']
+    # the source itself still writes against its own full read
+    source.a = '10'
+    source.write_cache()
+    assert etcd.get('/a')['node']['value'] == '10'
+    assert config.dump() == {'b': {'c': '2'}, 'd': {'e': '3'}}
+
+
+def test_watch_etcd_history(etcd):
+    connector = EtcdConnector(etcd.url)
+    etcd.set('/b/d', '3')
+
+    event = connector.watch('/b', recursive=True, wait_index=1)
+    assert event['node'] == {'key': '/b/c', 'value': '2',
+                             'createdIndex': 3, 'modifiedIndex': 3}
+
+    event = connector.watch('/b/d', wait_index=1)
+    assert event['node']['value'] == '3'
+
+
+def test_watch_etcd_changes(etcd):
+    connector = EtcdConnector(etcd.url)
+    events = []
+
+    def watch():
+        events.append(connector.watch('/b', recursive=True))
+
+    thread = threading.Thread(target=watch)
+    thread.start()
+    time.sleep(0.1)
+    etcd.set('/a', '10')
+    etcd.delete('/b/c')
+    thread.join(5)
+
+    assert events[0]['action'] == 'delete'
+    assert events[0]['prevNode']['value'] == '2'
+
+
+def test_watch_etcd_timeout(etcd):
+    assert etcd.watch('/a', timeout=0.05) is None
+
+
+def test_watch_cleared_etcd_history(monkeypatch):
+    monkeypatch.setattr('layeredconfig.fakeetcd._HISTORY', 2)
+
+    with FakeEtcd() as etcd:
+        for value in range(3):
+            etcd.set('/a', '%d' % value)
+        connector = EtcdConnector(etcd.url)
+
+        with pytest.raises(ValueError) as exc_info:
+            connector.watch('/a', wait_index=2)
+        assert 'cleared' in str(exc_info.value)
+        assert connector.watch('/a', wait_index=3)['node']['value'] == '1'
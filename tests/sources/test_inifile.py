@@ -4,7 +4,7 @@ import io
 
 import pytest
 
-from layeredconfig import INIFile
+from layeredconfig import INIFile, LayeredConfig
 
 
 def test_ini_source():
@@ -53,3 +53,40 @@ def test_ini_source_subsections():
     assert config['b/d/f'].g == '4'
 
 
+def test_intern_ini_source():
+    def make_config():
+        return INIFile(io.StringIO(u'[a]\nname=shared value\n'),
+                       intern=True).dump()
+
+    first, second = make_config(), make_config()
+
+    assert first == {'a': {'name': 'shared value'}}
+    assert first['a']['name'] is second['a']['name']
+
+
+def test_project_ini_source_from_file_object():
+    source = INIFile(io.StringIO(u'[a]\nb = 1\n[c]\nd = 2\n'))
+
+    config = LayeredConfig(source, include=['a'])
+
+    assert config.dump() == {'a': {'b': '1'}}
+    assert source.dump() == {'a': {'b': '1'}, 'c': {'d': '2'}}
+
+
+def test_ini_source_from_path(tmpdir):
+    path = tmpdir / 'config.ini'
+    path.write('[a]\nb = 1\n')
+    config = INIFile(str(path))
+
+    assert config.a.b == '1'
+    path.write('[a]\nb = 2\n')
+    # paths are cached by default
+    assert config.a.b == '1'
+    config.reload()
+    assert config.a.b == '2'
+    assert str(path) in config.fingerprint()
+
+    config = INIFile(str(path), cached=False)
+    assert config.a.b == '2'
+    path.write('[a]\nb = 3\n')
+    assert config.a.b == '3'
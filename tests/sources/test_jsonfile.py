@@ -4,7 +4,7 @@ import json
 
 import pytest
 
-from layeredconfig import JsonFile
+from layeredconfig import JsonFile, LayeredConfig
 
 
 @pytest.fixture
@@ -59,3 +59,161 @@ def test_write_json_source(json_file):
 
     result = json.loads(json_file.path.read())
     assert result == expected
+
+
+@pytest.fixture
+def nested_json_file(tmpdir):
+    path = tmpdir / 'services.json'
+    path.write(json.dumps({
+        'services': {
+            'auth': {'url': 'http://auth/{"}', 'ports': [1, [2, {}]]},
+            'billing': {'url': 'http://billing', 'retries': 3,
+                        'limits': {'max': 10}},
+            'mail': None,
+        },
+        'escaped': 'a \\" b',
+    }, indent=2))
+    return path
+
+
+def test_read_json_source_subtree(nested_json_file):
+    config = JsonFile(str(nested_json_file), root=('services', 'billing'))
+
+    assert config.url == 'http://billing'
+    assert config.retries == 3
+    assert config.limits.max == 10
+    assert config.dump() == {'url': 'http://billing', 'retries': 3,
+                             'limits': {'max': 10}}
+
+
+@pytest.mark.parametrize('root', [
+    ('services', 'unknown'),
+    ('services', 'mail', 'sub'),
+    ('nonexisting',),
+])
+def test_read_json_source_missing_subtree(nested_json_file, root):
+    config = JsonFile(str(nested_json_file), root=root)
+
+    assert config.dump() == {}
+
+
+def test_write_json_source_subtree(nested_json_file):
+    config = JsonFile(str(nested_json_file), root=('services', 'billing'))
+    expected = json.loads(nested_json_file.read())
+    expected['services']['billing']['retries'] = 5
+
+    config.retries = 5
+
+    assert json.loads(nested_json_file.read()) == expected
+
+
+def test_write_json_source_new_subtree(nested_json_file):
+    config = JsonFile(str(nested_json_file), root=('services', 'queue'))
+    expected = json.loads(nested_json_file.read())
+    expected['services']['queue'] = {'workers': 4}
+
+    config.workers = 4
+
+    assert json.loads(nested_json_file.read()) == expected
+
+
+@pytest.mark.parametrize('root', [('services', 'auth', 'url'),
+                                  ('services', 'mail')])
+def test_read_json_source_subtree_of_no_object(nested_json_file, root):
+    config = JsonFile(str(nested_json_file), root=root)
+
+    with pytest.raises(ValueError) as exc_info:
+        config.dump()
+    assert 'no json object' in str(exc_info.value)
+
+
+def test_json_source_subtree_of_duplicate_keys(tmpdir):
+    path = tmpdir / 'config.json'
+    path.write('{"a": {"b": 1}, "x": 0, "a": {"b": 2}}')
+    config = JsonFile(str(path), root=('a',))
+
+    # the last key wins like with json.load
+    assert config.dump() == {'b': 2}
+    assert JsonFile(str(path), include=['a']).dump() == {'a': {'b': 2}}
+
+    config.b = 3
+    assert path.read() == '{"a": {"b": 1}, "x": 0, "a": {"b": 3}}'
+
+
+def test_json_source_subtree_of_empty_file(tmpdir):
+    path = tmpdir / 'config.json'
+    path.write('')
+    config = JsonFile(str(path), root=('a',))
+
+    with pytest.raises(ValueError):
+        config.dump()
+
+    # the subtree is written as a new document
+    config._write({'b': 1})
+    assert json.loads(path.read()) == {'a': {'b': 1}}
+
+
+@pytest.mark.parametrize('root', [None, ('b',)])
+def test_intern_json_source(tmpdir, root):
+    paths = [tmpdir / 'first.json', tmpdir / 'second.json']
+    for path in paths:
+        path.write('{"b": {"name": "shared value", "number": 123456}}')
+
+    first, second = [JsonFile(str(path), root=root, intern=True).dump()
+                     for path in paths]
+    if root is None:
+        first, second = first['b'], second['b']
+
+    assert first == {'name': 'shared value', 'number': 123456}
+    assert first['name'] is second['name']
+    assert first['number'] is second['number']
+    assert list(first)[0] is list(second)[0]
+
+
+@pytest.mark.parametrize('root, include, expected', [
+    (None, ['services.billing.limits', 'escaped'],
+     {'services': {'billing': {'limits': {'max': 10}}},
+      'escaped': 'a \\" b'}),
+    (None, ['services.*.url'],
+     {'services': {'auth': {'url': 'http://auth/{"}'},
+                   'billing': {'url': 'http://billing'}}}),
+    (('services',), ['auth', 'missing'],
+     {'auth': {'url': 'http://auth/{"}', 'ports': [1, [2, {}]]}}),
+])
+def test_project_json_source(nested_json_file, root, include, expected):
+    config = JsonFile(str(nested_json_file), root=root, include=include)
+
+    assert config.dump() == expected
+
+
+def test_project_json_config_without_decoding_other_subtrees(tmpdir):
+    path = tmpdir / 'config.json'
+    # the other subtree is not even valid json
+    path.write('{"other": {"x": [1, nope]}, "db": {"host": "a"}}')
+    source = JsonFile(str(path))
+
+    config = LayeredConfig(source, include=['db'])
+
+    assert config.dump() == {'db': {'host': 'a'}}
+    with pytest.raises(ValueError):
+        source.dump()
+
+
+def test_revalidate_json_source_by_stat(json_file, tmpdir, monkeypatch):
+    cache_file = str(tmpdir / 'cache')
+    JsonFile(str(json_file.path), cache_file=cache_file).dump()
+
+    read = pytest.helpers.inspector(JsonFile._read)
+    monkeypatch.setattr(JsonFile, '_read', read)
+
+    config = JsonFile(str(json_file.path), cache_file=cache_file)
+    assert config.a == 1
+    config._revalidation.join()
+    assert read.calls == 0
+
+    json_file.data = {'a': 10}
+    config = JsonFile(str(json_file.path), cache_file=cache_file)
+    assert config.a == 1
+    config._revalidation.join()
+    assert read.calls == 1
+    assert config.a == 10
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import os
+
+import pytest
+
+from layeredconfig import DictSource, LayeredConfig
+from layeredconfig import SharedMemory, SharedMemoryPublisher
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # skip all tests when shared memory is not supported
+    pytestmark = pytest.mark.skip(reason='Requires python 3.8 or newer')
+
+
+@pytest.fixture
+def publisher(request):
+    publisher = SharedMemoryPublisher('lc-%d-%s' % (os.getpid(),
+                                                    request.node.name[-8:]))
+    yield publisher
+    publisher.close()
+
+
+def read_in_worker(name, queue):
+    config = LayeredConfig(SharedMemory(name))
+    queue.put((config.a, config.b.c, config.b.d.dump()))
+
+
+def test_read_shared_memory_source(publisher, data):
+    config = SharedMemory(publisher.name)
+    assert config.dump() == {}
+
+    publisher.publish(LayeredConfig(DictSource(data)))
+
+    assert config.a == 1
+    assert config.b.c == 2
+    assert config.b.d == {'e': 3}
+    assert config.dump() == data
+    assert config._loaded_generation == 1
+
+
+def test_write_shared_memory_source_fails(publisher, data):
+    publisher.publish(data)
+    config = SharedMemory(publisher.name)
+
+    with pytest.raises(TypeError) as exc_info:
+        config.a = 10
+    assert 'read-only' in str(exc_info.value)
+
+
+def test_swap_shared_memory_generations(publisher, data):
+    publisher.publish(data)
+    config = SharedMemory(publisher.name)
+    section = config._get_data()['b']
+
+    data['b']['c'] = 20
+    assert publisher.publish(data) == 2
+
+    assert config.b.c == 20
+    assert config._loaded_generation == 2
+    # values of the previous generation stay valid
+    assert section['c'] == 2
+
+
+def test_snapshot_shared_memory_config(publisher, data):
+    publisher.publish(data)
+    config = LayeredConfig(SharedMemory(publisher.name))
+
+    with config.snapshot() as snapshot:
+        assert snapshot.generation() == config.generation()
+        data['b']['c'] = 20
+        publisher.publish(data)
+
+        assert snapshot.b.c == 2
+        assert config.b.c == 20
+
+
+def test_read_shared_memory_source_in_worker(publisher, data):
+    publisher.publish(data)
+    queue = multiprocessing.Queue()
+
+    worker = multiprocessing.Process(target=read_in_worker,
+                                     args=(publisher.name, queue))
+    worker.start()
+    result = queue.get(timeout=10)
+    worker.join()
+
+    assert result == (1, 2, {'e': 3})
+    # the worker must not unlink the segments on exit
+    assert SharedMemory(publisher.name).a == 1
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from layeredconfig import DictSource, JsonFile, LayeredConfig, Snapshot
+
+
+@pytest.fixture
+def snapshot_file(tmpdir, data):
+    path = str(tmpdir / 'config.snapshot')
+    LayeredConfig(DictSource(data)).compile_snapshot(path)
+    return path
+
+
+def test_read_snapshot_source(snapshot_file, data):
+    config = Snapshot(snapshot_file)
+
+    assert config.a == 1
+    assert config.b.c == 2
+    assert config.b.d == {'e': 3}
+    assert config.dump() == data
+    assert config.fingerprints == [('DictSource', DictSource(data).fingerprint())]
+
+
+def test_write_snapshot_source_fails(snapshot_file):
+    config = Snapshot(snapshot_file)
+
+    with pytest.raises(TypeError) as exc_info:
+        config.a = 10
+    assert 'read-only' in str(exc_info.value)
+
+
+def test_detect_stale_snapshot(tmpdir, data):
+    json_path = tmpdir / 'config.json'
+    json_path.write('{"a": 1}')
+    path = str(tmpdir / 'config.snapshot')
+
+    source = JsonFile(str(json_path))
+    LayeredConfig(source, DictSource(data)).compile_snapshot(path)
+    snapshot = Snapshot(path)
+
+    assert not snapshot.is_stale(source, DictSource(data))
+    assert snapshot.is_stale(source)
+    assert snapshot.is_stale(DictSource(data), source)
+    assert snapshot.is_stale(source, DictSource({'a': 2}))
+
+    json_path.write('{"a": 10}')
+    assert snapshot.is_stale(source, DictSource(data))
+
+
+@pytest.mark.parametrize('offset, content, message', [
+    (0, b'garbage!', 'Not a config snapshot'),
+    (8, b'\xff\x00', 'version'),
+    (-1, b'\x07', 'checksum'),
+])
+def test_reject_broken_snapshot(snapshot_file, offset, content, message):
+    with open(snapshot_file, 'r+b') as fh:
+        fh.seek(offset, 2 if offset < 0 else 0)
+        fh.write(content)
+
+    with pytest.raises(ValueError) as exc_info:
+        Snapshot(snapshot_file)
+    assert message in str(exc_info.value)
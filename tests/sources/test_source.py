@@ -1,5 +1,10 @@
 # -*- coding: utf-8 -*-
 
+import io
+import json
+import threading
+import time
+
 import pytest
 
 from layeredconfig import DictSource, CustomType
@@ -179,3 +184,327 @@ def test_write_cached_dict_source():
     config.write_cache()
 
     assert config._data == {'a': 1, 'b': {'c': 2, 'd': {'e': 3}}}
+
+
+def test_threadsafe_source_writes():
+    config = DictSource({'counters': {}}, cached=True, threadsafe=True)
+    keys = ['k%d' % i for i in range(8)]
+
+    def write(key):
+        for i in range(200):
+            config.counters[key] = i
+            config.counters.update({key + '-copy': i})
+
+    threads = [threading.Thread(target=write, args=(key,)) for key in keys]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # no update of another thread got lost
+    assert len(config.counters) == 2 * len(keys)
+    assert all(value == 199 for key, value in config.counters.items())
+
+
+def test_sublevel_sources_use_the_state_of_their_root(monkeypatch):
+    setitem = pytest.helpers.inspector(Source.__setitem__)
+    monkeypatch.setattr(Source, '__setitem__', setitem)
+    config = DictSource({'a': {'b': {'c': 1}}}, threadsafe=True)
+    calls = []
+
+    section = config.a.b
+    assert setitem.calls == 0
+    assert section._lock is config._lock
+    for attr in ['_listeners', '_hashes', '_cache_lock', '_presence_stats']:
+        assert attr not in section.__dict__
+
+    section.add_listener(calls.append)
+    section.c = 2
+    assert calls == [config]
+    assert section.generation() == config.generation() == 1
+
+
+def test_cached_source_reads_once_for_concurrent_misses():
+    release = threading.Event()
+
+    class SlowSource(Source):
+        @pytest.helpers.inspector
+        def _read(self):
+            release.wait()
+            return {'a': 1}
+
+    config = SlowSource(cached=True)
+    results = []
+
+    threads = [threading.Thread(target=lambda: results.append(config.a))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == [1] * 8
+    assert SlowSource._read.calls == 1
+
+
+def test_cache_file_of_source(tmpdir):
+    cache_file = str(tmpdir / 'cache')
+    data = {'a': 1, 'b': {'c': 2}}
+
+    config = DictSource(data, cache_file=cache_file)
+    assert config.dump() == data
+
+    # a new instance starts with the cached data and reads the
+    # source afterwards
+    data['a'] = 10
+    config = DictSource(data, cache_file=cache_file)
+    assert config.a == 1
+
+    config._revalidation.join()
+    assert config.a == 10
+
+    # and remembers that for the next start
+    config = DictSource({}, cache_file=cache_file)
+    assert config.a == 10
+
+
+def test_revalidation_keeps_writes(tmpdir):
+    cache_file = str(tmpdir / 'cache')
+    release = threading.Event()
+
+    class SlowSource(DictSource):
+        def _read(self):
+            release.wait()
+            return super(SlowSource, self)._read()
+
+        def _write(self, data):
+            super(SlowSource, self)._write(data)
+
+    release.set()
+    SlowSource({'a': 1, 'b': 2}, cache_file=cache_file).dump()
+    release.clear()
+
+    config = SlowSource({'a': 10, 'b': 2}, cache_file=cache_file)
+    assert config.a == 1
+
+    config.b = 20
+    release.set()
+    config._revalidation.join()
+
+    assert config.dump() == {'a': 1, 'b': 20}
+
+
+def test_cache_file_of_projected_source(tmpdir):
+    cache_file = str(tmpdir / 'cache')
+    data = {'a': 1, 'b': {'c': 2}}
+
+    config = DictSource(data, cache_file=cache_file, include=['b'])
+    assert config.dump() == {'b': {'c': 2}}
+
+    data['b']['c'] = 3
+    config = DictSource(data, cache_file=cache_file, include=['b'])
+    assert config.dump() == {'b': {'c': 2}}
+    config._revalidation.join()
+    assert config.dump() == {'b': {'c': 3}}
+
+    # neither the full source nor other projections start with the
+    # data of the projection
+    config = DictSource(data, cache_file=cache_file, include=['a'])
+    assert config.dump() == {'a': 1}
+    assert config._revalidation is None
+    config = DictSource(data, cache_file=cache_file)
+    assert config.dump() == data
+    assert config._revalidation is None
+
+
+def test_project_source_with_cache_file(tmpdir):
+    cache_file = str(tmpdir / 'cache')
+    data = {'a': 1, 'b': {'c': 2}}
+    source = DictSource(data, cache_file=cache_file)
+
+    projected = source.project(['b'])
+    assert projected.dump() == {'b': {'c': 2}}
+
+    # only the full source writes the cache file
+    config = DictSource({}, cache_file=cache_file)
+    assert config.dump() == data
+
+
+def test_flag_stale_data_of_failed_revalidation(tmpdir):
+    cache_file = str(tmpdir / 'cache')
+    reachable = threading.Event()
+    reachable.set()
+
+    class RemoteSource(DictSource):
+        def _read(self):
+            if not reachable.is_set():
+                raise IOError('unreachable')
+            return super(RemoteSource, self)._read()
+
+    RemoteSource({'a': 1}, cache_file=cache_file).dump()
+
+    reachable.clear()
+    config = RemoteSource({'a': 2}, cache_file=cache_file)
+    assert config.a == 1
+    config._revalidation.join()
+    assert config.is_stale()
+
+    with pytest.raises(IOError):
+        config.reload()
+    assert config.is_stale()
+    assert config.a == 1
+
+    reachable.set()
+    config.reload()
+    assert not config.is_stale()
+    assert config.a == 2
+
+
+def test_ignore_broken_cache_file(tmpdir):
+    cache_file = tmpdir / 'cache'
+    cache_file.write('garbage')
+
+    config = DictSource({'a': 1}, cache_file=str(cache_file))
+    assert config.a == 1
+    assert config._revalidation is None
+
+
+def test_memoize_custom_types():
+    data = {'a': 1, 'b': {'a': 1, 'c': [1]}}
+    calls = []
+
+    def customize(value):
+        calls.append(value)
+        return ('custom', value)
+
+    types = {
+        'a': CustomType(customize, lambda v: v[1]),
+        'c': CustomType(customize, lambda v: v[1]),
+    }
+    config = DictSource(data, type_map=types, memoize_types=True)
+
+    assert config.a == ('custom', 1)
+    assert config.a is config.a
+    # same raw value but another keypath
+    assert config.b.a == ('custom', 1)
+    assert len(calls) == 2
+
+    assert config.dump(with_custom_types=True) == {
+        'a': ('custom', 1), 'b': {'a': ('custom', 1), 'c': ('custom', [1])}}
+    assert config.b.dump(with_custom_types=True)['a'] is config.b.a
+    # lists cannot be memoized
+    assert calls == [1, 1, [1], [1]]
+
+    # equal raw values of different types are converted separately
+    config.a = ('custom', True)
+    assert config.a == ('custom', True)
+    assert calls[-1] is True
+
+
+def test_invalidate_memoized_custom_types():
+    calls = []
+
+    def customize(value):
+        calls.append(value)
+        return value * 2
+
+    source = DictSource({'a': 1}, memoize_types=True,
+                        type_map={'a': CustomType(customize, None)})
+    source.a
+    source.a
+    assert len(calls) == 1
+
+    source.reload()
+    source.a
+    assert len(calls) == 2
+
+    source['b'] = 2
+    source.a
+    assert len(calls) == 3
+
+
+def test_presence_index_of_source():
+    source = DictSource({'a': 1, 'b': {'c': 2}}, indexed=True)
+
+    # the data is not read just to build the index
+    assert source.might_contain(['x'])
+    assert source.presence_stats()['kind'] is None
+
+    assert source.a == 1
+    assert source.might_contain(['b', 'c'])
+    assert source.b.might_contain(['c'])
+    assert not source.might_contain(['b', 'x'])
+    assert not source.b.might_contain(['x'])
+    assert source.presence_stats() == {
+        'kind': 'exact', 'keypaths': 3, 'hits': 2, 'skips': 2}
+
+    # writes and reloads rebuild the index
+    source.b.x = 3
+    assert source.might_contain(['b', 'x'])
+    source.reload()
+    assert source.presence_stats()['keypaths'] == 3
+    assert not source.might_contain(['b', 'x'])
+
+
+def test_sources_without_presence_index():
+    source = DictSource({'a': 1})
+
+    source.dump()
+    assert source.might_contain(['x'])
+    assert source.presence_stats() == {
+        'kind': None, 'keypaths': 0, 'hits': 0, 'skips': 0}
+
+
+def test_project_source():
+    source = DictSource({'a': 1, 'b': {'c': 2, 'd': 3}, 'e': {'f': 4}},
+                        cached=True)
+
+    projected = source.project(['b.c', 'e'])
+
+    assert projected.dump() == {'b': {'c': 2}, 'e': {'f': 4}}
+    assert source.dump() == {'a': 1, 'b': {'c': 2, 'd': 3}, 'e': {'f': 4}}
+    assert projected.is_writable() is False
+    assert projected.e.is_writable() is False
+    with pytest.raises(TypeError) as exc_info:
+        projected.e.f = 5
+    assert 'projected' in str(exc_info.value)
+
+    with pytest.raises(TypeError):
+        source.b.project(['c'])
+
+
+def test_projected_source_follows_its_origin():
+    source = DictSource({'a': 1, 'b': {'c': 2}}, cached=True)
+    projected = source.project(['b'])
+    calls = []
+    projected.add_listener(calls.append)
+
+    assert projected.dump() == {'b': {'c': 2}}
+    source.b.c = 3
+    assert projected.b.c == 3
+    assert projected.generation() == source.generation() == 1
+    assert calls == [source]
+
+
+def test_include_subtrees_of_source():
+    source = DictSource({'a': 1, 'b': {'c': 2}}, include=['b'])
+
+    assert source.dump() == {'b': {'c': 2}}
+    with pytest.raises(KeyError):
+        source.a
+
+
+def test_dump_source_to_stream():
+    data = {'a': 1, 'b': {'c': 2}}
+    types = {'c': CustomType(lambda v: 2*v, lambda v: v/2)}
+    config = DictSource(data, type_map=types)
+
+    fh = io.StringIO()
+    config.dump_to(fh)
+    assert json.loads(fh.getvalue()) == data
+
+    fh = io.StringIO()
+    config.b.dump_to(fh, with_custom_types=True)
+    assert json.loads(fh.getvalue()) == {'c': 4}
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+from layeredconfig.diff import MISSING, diff
+
+
+def test_diff_equal_values():
+    data = {'a': 1, 'b': {'c': 2}}
+
+    assert list(diff(data, data)) == []
+    assert list(diff(data, {'a': 1, 'b': {'c': 2}})) == []
+
+
+def test_diff_nested_values():
+    old = {'a': 1, 'b': {'c': 2, 'd': {'e': 3}}, 'x': 5}
+    new = {'a': 1, 'b': {'c': 20, 'd': {'e': 3}}, 'y': {'z': 6}}
+
+    assert list(diff(old, new)) == [
+        ((), old, new),
+        (('b',), old['b'], new['b']),
+        (('b', 'c'), 2, 20),
+        (('x',), 5, MISSING),
+        (('y',), MISSING, {'z': 6}),
+    ]
+
+
+def test_diff_replace_section_with_value():
+    assert list(diff({'a': {'b': 1}}, {'a': 1}))[1:] == [
+        (('a',), {'b': 1}, 1),
+    ]
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import pickle
+from collections import OrderedDict
+
+import pytest
+
+from layeredconfig import FrozenConfig
+from layeredconfig import frozen as frozen_module
+from layeredconfig.frozen import freeze, frozen_class
+
+
+def test_freeze_nested_data(data):
+    frozen = freeze(data)
+
+    assert isinstance(frozen, FrozenConfig)
+    assert frozen.a == 1
+    assert frozen.b.c == 2
+    assert frozen.b.d.e == 3
+    assert frozen['b']['d']['e'] == 3
+    assert frozen == data
+    assert frozen.dump() == data
+    assert sorted(frozen) == ['a', 'b']
+
+
+def test_frozen_config_cannot_be_changed(data):
+    frozen = freeze(data)
+
+    with pytest.raises(AttributeError):
+        frozen.a = 10
+    with pytest.raises(AttributeError):
+        frozen.x = 10
+    with pytest.raises(AttributeError):
+        del frozen.a
+    with pytest.raises(TypeError):
+        frozen['a'] = 10
+
+
+def test_frozen_config_has_no_instance_dict(data):
+    frozen = freeze(data)
+
+    assert not hasattr(frozen, '__dict__')
+
+
+def test_share_classes_between_sections_of_same_shape():
+    frozen = freeze({'x': {'a': 1, 'b': 2}, 'y': {'b': 3, 'a': 4}})
+
+    assert type(frozen.x) is type(frozen.y)
+    assert type(frozen.x) is frozen_class(['a', 'b'])
+
+
+def test_freeze_mixed_keys():
+    frozen = freeze({'ports': {80: 'http', 'other': 1}})
+
+    assert frozen.ports[80] == 'http'
+    assert frozen.ports.other == 1
+    assert frozen.dump() == {'ports': {80: 'http', 'other': 1}}
+
+
+def test_bound_classes_of_section_shapes(monkeypatch):
+    monkeypatch.setattr(frozen_module, '_classes', OrderedDict())
+    monkeypatch.setattr(frozen_module, '_MAX_CLASSES', 2)
+    cls = frozen_class(['a'])
+
+    frozen_class(['b'])
+    assert frozen_class(['a']) is cls
+    frozen_class(['c'])
+
+    # the least recently used shape was dropped
+    assert list(frozen_module._classes) == [('a',), ('c',)]
+    assert frozen_class(['a']) is cls
+
+
+def test_frozen_keys_without_attribute_names():
+    frozen = freeze({'log-level': 'info', 'items': 1, 'class': 2, '_a': 3})
+
+    assert frozen['log-level'] == 'info'
+    assert frozen['items'] == 1
+    assert frozen['class'] == 2
+    assert frozen['_a'] == 3
+    # methods take precedence as they do for configs
+    assert frozen.items() is not None
+
+    with pytest.raises(KeyError):
+        frozen['missing']
+
+
+def test_pickle_frozen_config(data):
+    frozen = freeze(data)
+
+    assert pickle.loads(pickle.dumps(frozen)) == data
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from layeredconfig import DictSource, JsonFile
+from layeredconfig import hashing
+from layeredconfig.hashing import content_hash
+
+
+@pytest.mark.parametrize('value, other', [
+    ({'a': 1}, {'a': 2}),
+    ({'a': 1}, {'a': '1'}),
+    ({'a': 1}, {'a': 1.0}),
+    ({'a': 1}, {'b': 1}),
+    ({'a': {'b': 1}}, {'a': {'c': 1}}),
+    ({'ab': {'c': 1}}, {'a': {'bc': 1}}),
+    ({'a': [1, 2]}, {'a': [2, 1]}),
+    ({80: 'http'}, {'80': 'http'}),
+])
+def test_content_hash_differs(value, other):
+    assert content_hash(value) != content_hash(other)
+
+
+def test_content_hash_ignores_order():
+    assert content_hash({'a': 1, 'b': 2}) == content_hash({'b': 2, 'a': 1})
+
+
+def test_content_hash_of_mixed_keys():
+    value = {'ports': {80: 'http', 443: 'https', 'other': 1}}
+
+    assert content_hash(value) == content_hash(
+        {'ports': {'other': 1, 443: 'https', 80: 'http'}})
+
+
+def test_rehash_only_changed_sections(monkeypatch):
+    scalar_hash = pytest.helpers.inspector(hashing._scalar_hash)
+    monkeypatch.setattr(hashing, '_scalar_hash', scalar_hash)
+
+    data = {'big': dict(('k%d' % i, i) for i in range(100)),
+            'small': {'x': 1}}
+    config = DictSource(data, cached=True)
+
+    before = config.content_hash()
+    assert scalar_hash.calls == 101
+
+    config.small.x = 2
+    after = config.content_hash()
+
+    assert scalar_hash.calls == 102
+    assert before != after
+    assert after == content_hash({'big': data['big'], 'small': {'x': 2}})
+    assert config.big.content_hash() == content_hash(data['big'])
+
+
+def test_keep_no_hashes_of_changing_data():
+    config = DictSource({'a': {'b': 1}})
+
+    before = config.content_hash()
+    config._data['a']['b'] = 2
+
+    assert config._hashes._entries == {}
+    assert config.content_hash() != before
+
+
+def test_reuse_hashes_of_unchanged_files(tmpdir, monkeypatch):
+    path = tmpdir.join('config.json')
+    path.write('{"a": {"b": 1}}')
+    config = JsonFile(str(path))
+    before = config.content_hash()
+
+    scalar_hash = pytest.helpers.inspector(hashing._scalar_hash)
+    monkeypatch.setattr(hashing, '_scalar_hash', scalar_hash)
+
+    assert config.content_hash() == before
+    assert scalar_hash.calls == 0
+
+    path.write('{"a": {"b": 20}}')
+    assert config.content_hash() != before
+
+
+def test_dump_does_not_hand_out_cached_data():
+    config = DictSource({'a': {'b': 1}}, cached=True)
+    before = config.content_hash()
+
+    config.dump()['a']['b'] = 2
+
+    assert config.a.b == 1
+    assert config.content_hash() == before
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+from layeredconfig import interning
+
+
+def make_string(text):
+    # build strings at runtime so that they are distinct objects
+    return ''.join(list(text))
+
+
+def test_intern_keys():
+    key = make_string('some-key')
+
+    assert key is not make_string('some-key')
+    assert interning.intern_key(key) is interning.intern_key(
+        make_string('some-key'))
+
+
+def test_intern_short_strings_and_numbers():
+    assert interning.intern_value(make_string('info')) is \
+        interning.intern_value(make_string('info'))
+    assert interning.intern_value(int('123456789')) is \
+        interning.intern_value(int('123456789'))
+    assert interning.intern_value(float('1.5')) is \
+        interning.intern_value(float('1.5'))
+
+
+def test_do_not_intern_long_strings_or_other_values():
+    text = make_string('x' * (interning.MAX_STRING_LENGTH + 1))
+    values = [1, 2]
+
+    assert interning.intern_value(text) is text
+    assert interning.intern_value(values) is values
+
+
+def test_keep_negative_zero():
+    assert str(interning.intern_value(0.0)) == '0.0'
+    assert str(interning.intern_value(-0.0)) == '-0.0'
+
+
+def test_intern_nested_data():
+    first = {make_string('a'): {make_string('b'): make_string('value')},
+             make_string('c'): [make_string('value'),
+                                {make_string('d'): 1}]}
+    second = {make_string('a'): {make_string('b'): make_string('value')}}
+
+    interning.intern_data(first)
+    interning.intern_data(second)
+
+    assert first == {'a': {'b': 'value'}, 'c': ['value', {'d': 1}]}
+    assert first['a']['b'] is second['a']['b']
+    assert first['c'][0] is second['a']['b']
+    assert list(first['a'])[0] is list(second['a'])[0]
@@ -1,12 +1,18 @@
 # -*- coding: utf-8 -*-
 
 import io
+import json
+import sys
+import threading
+import time
 
 import pytest
 
 from layeredconfig import LayeredConfig
-from layeredconfig import DictSource, Environment, INIFile
-from layeredconfig import strategy
+from layeredconfig import CustomType, DictSource, Environment, INIFile
+from layeredconfig import hashing, strategy
+from layeredconfig.diff import MISSING
+from layeredconfig.source import Source
 
 
 def test_raise_keyerrors_on_empty_multilayer_config():
@@ -347,3 +353,667 @@ def test_read_layered_sources_with_strategies_and_untyped_sources(monkeypatch):
     assert config.x == [[50, 60], [5, 6]]
     assert config.b.c == [20, 2]
     assert config.b.d == [30, 40, 3, 4]
+
+
+def test_layered_snapshot(tmpdir):
+    path = str(tmpdir / 'config.snapshot')
+    sources = [
+        DictSource({'a': 1, 'b': {'c': 2}}),
+        DictSource({'a': '10'}),
+        DictSource({'x': 6, 'b': {'y': 7}}),
+    ]
+    config = LayeredConfig(*sources)
+    config.compile_snapshot(path)
+
+    snapshot_config = LayeredConfig.from_snapshot(path, *sources)
+
+    assert snapshot_config == config
+    assert snapshot_config.b.y == 7
+    assert snapshot_config.a == '10'
+
+    sources[0].x = 60
+    with pytest.raises(ValueError) as exc_info:
+        LayeredConfig.from_snapshot(path, *sources)
+    assert 'stale' in str(exc_info.value)
+
+
+def test_write_to_empty_section():
+    source = DictSource({'a': {}})
+    config = LayeredConfig(source)
+
+    config.a.b = 1
+
+    assert source.a.b == 1
+
+
+def test_subconfigs_set_up_bookkeeping_on_first_use():
+    config = LayeredConfig(DictSource({'a': {'b': 1}}, cached=True))
+
+    section = config.a
+    assert sorted(section.__dict__) == ['_initialized', '_keychain',
+                                        '_source_list', '_strategy_map']
+
+    changes = []
+    section.subscribe('b', lambda *change: changes.append(change))
+    assert section.freeze() == {'b': 1}
+    assert section.explain('b').value == 1
+    section.b = 2
+    assert changes == [('b', 1, 2)]
+
+
+def test_subscribe_to_writes():
+    source1 = DictSource({'a': 1, 'b': {'c': 2}})
+    source2 = DictSource({'x': 6, 'b': {'y': 7}})
+    config = LayeredConfig(source1, source2)
+    changes = []
+
+    config.subscribe('b.*', lambda *change: changes.append(change))
+    config.subscribe('a', lambda *change: changes.append(change))
+
+    config.a = 10
+    config.x = 60
+    config.b.c = 20
+    source2.b.m = 'n'
+
+    assert changes == [
+        ('a', 1, 10),
+        ('b.c', 2, 20),
+        ('b.m', MISSING, 'n'),
+    ]
+
+
+def test_subscribe_to_reloads():
+    data = {'a': 1, 'b': {'c': 2, 'd': 3}}
+    source = DictSource(data, cached=True)
+    config = LayeredConfig(DictSource({'a': 0}), source)
+    changes = []
+
+    config.subscribe('b', lambda *change: changes.append(change))
+    config.subscribe('b.c', lambda *change: changes.append(change))
+
+    data['a'] = 10
+    data['b']['c'] = 20
+    config.reload()
+
+    assert changes == [
+        ('b', {'c': 2, 'd': 3}, {'c': 20, 'd': 3}),
+        ('b.c', 2, 20),
+    ]
+
+
+def test_unsubscribe():
+    source = DictSource({'a': 1})
+    config = LayeredConfig(source)
+    changes = []
+
+    def callback(*change):
+        changes.append(change)
+
+    config.subscribe('*', callback)
+    config.unsubscribe(callback)
+    config.a = 10
+
+    assert changes == []
+    assert source._listeners == []
+
+
+def test_layered_content_hash():
+    source1 = DictSource({'a': 1, 'b': {'c': 2}}, cached=True)
+    source2 = DictSource({'x': 6, 'b': {'y': 7}}, cached=True)
+    config = LayeredConfig(source1, source2)
+
+    before = config.content_hash()
+    assert before == config.content_hash()
+    assert config.b.content_hash() != before
+
+    source2.x = 60
+
+    assert config.content_hash() != before
+
+
+def test_compare_layered_configs_by_hash(monkeypatch):
+    sources = [DictSource({'a': 1}, cached=True),
+               DictSource({'b': {'c': 2}}, cached=True)]
+    config = LayeredConfig(*sources)
+    other = LayeredConfig(*sources)
+
+    assert config == LayeredConfig(DictSource({'a': 1, 'b': {'c': 2}}))
+
+    def fail():
+        raise AssertionError('configs should not be dumped')
+
+    config.content_hash()
+    monkeypatch.setattr(config, 'dump', fail)
+    assert config == other
+
+
+def test_compare_layered_configs_without_hashing(monkeypatch):
+    config = LayeredConfig(DictSource({'a': 1}, cached=True))
+    other = LayeredConfig(DictSource({'a': 2}, cached=True))
+
+    def fail(*args):
+        raise AssertionError('configs should not be hashed')
+
+    monkeypatch.setattr(hashing, '_scalar_hash', fail)
+    assert config != other
+
+
+def test_subscriptions_reuse_unchanged_sections():
+    source = DictSource({'a': {'b': 1}, 'x': {'y': 2}}, cached=True)
+    config = LayeredConfig(source)
+    config.subscribe('*', lambda *change: None)
+    before = config._merged
+
+    config.x.y = 20
+
+    assert config._merged == {'a': {'b': 1}, 'x': {'y': 20}}
+    assert config._merged['a'] is before['a']
+
+
+def test_layered_sources_with_merge_strategy_for_sections():
+    config = LayeredConfig(
+        DictSource({'a': {'b': {'c': 1}, 'x': 5}}),
+        DictSource({'a': {'b': {'d': 2}, 'x': 50}}),
+        strategies={'a': strategy.merge},
+    )
+
+    assert config.a == {'b': {'c': 1, 'd': 2}, 'x': 50}
+    assert config.dump() == {'a': {'b': {'c': 1, 'd': 2}, 'x': 50}}
+
+
+def test_merged_sections_are_typed_copies(monkeypatch):
+    monkeypatch.setenv('MVP_A_B_PORT', '8080')
+    monkeypatch.setenv('MVP_A_B_HOST', 'local')
+    cached = DictSource({'a': {'b': {'port': 1, 'tags': 'x,y'}}},
+                        type_map={'tags': CustomType(
+                            lambda value: value.split(','), None)},
+                        cached=True)
+    config = LayeredConfig(cached, Environment('MVP_'),
+                           strategies={'a': strategy.merge})
+
+    expected = {'b': {'port': 8080, 'host': 'local', 'tags': ['x', 'y']}}
+    assert config.a == expected
+    assert config.dump()['a'] == expected
+    assert config.get_many(['a'])['a'] == expected
+
+    config.a['b']['port'] = 0
+    config.dump()['a']['b']['tags'] = None
+    assert cached.dump() == {'a': {'b': {'port': 1, 'tags': 'x,y'}}}
+
+
+def test_layered_sources_with_falsy_strategy_results():
+    config = LayeredConfig(
+        DictSource({'a': 0, 'b': []}),
+        DictSource({'a': 0, 'b': []}),
+        strategies={'a': strategy.add, 'b': strategy.add},
+    )
+
+    assert config.a == 0
+    assert config.b == []
+
+
+def test_dump_layered_trees_deeper_than_the_recursion_limit():
+    depth = sys.getrecursionlimit() + 100
+    low, high = {}, {}
+    for section in (low, high):
+        for _ in range(depth):
+            section['k'] = {}
+            section = section['k']
+    low['leaf'] = 1
+    high['k']['leaf'] = 2
+
+    class TreeSource(Source):
+        # DictSource copies its data recursively
+
+        def __init__(self, data, **kwargs):
+            super(TreeSource, self).__init__(**kwargs)
+            self._data = data
+
+        def _read(self):
+            return self._data
+
+    config = LayeredConfig(TreeSource(low), TreeSource(high))
+    fh = io.StringIO()
+    config.dump_to(fh)
+
+    assert fh.getvalue().count('"k"') == depth
+    assert fh.getvalue().count('"leaf"') == 2
+
+
+def test_layered_provenance(monkeypatch):
+    monkeypatch.setenv('MVP_A', '1000')
+    monkeypatch.setenv('MVP_B_C', '5')
+
+    defaults = DictSource({'a': 1, 'b': {'c': 2, 'd': {'e': 3}}},
+                          name='defaults')
+    config = LayeredConfig(
+        defaults,
+        DictSource({'b': {'d': {'f': 4}}, 'x': [1]}),
+        Environment('MVP_'),
+        strategies={'x': strategy.add},
+    )
+
+    provenance = config.provenance()
+
+    assert sorted(provenance) == ['a', 'b.c', 'b.d.e', 'b.d.f', 'x']
+    assert provenance['a'].value == config.a == 1000
+    assert provenance['a'].origin == ('Environment', 'Environment#2', '1000')
+    assert provenance['a'].shadowed == [('DictSource', 'defaults', 1)]
+    assert provenance['a'].coercion == ('str', 'int')
+
+    assert config.explain('b.d.e') == ((('b', 'd', 'e'), 3,
+                                        ('DictSource', 'defaults', 3),
+                                        [], None))
+    assert config.explain(['b', 'd', 'f']).origin.label == 'DictSource#1'
+    assert config.explain('x').value == [1]
+
+    with pytest.raises(KeyError):
+        config.explain('b.d')
+
+
+def test_layered_config_with_mixed_keys():
+    lower = DictSource({'ports': {80: 'http', 'other': 1}}, cached=True)
+    upper = DictSource({'ports': {443: 'https'}}, cached=True)
+    config = LayeredConfig(lower, upper)
+    changes = []
+    config.subscribe('ports.*', lambda *change: changes.append(change))
+
+    assert config.content_hash() == LayeredConfig(
+        DictSource({'ports': {'other': 1, 80: 'http'}}),
+        DictSource({'ports': {443: 'https'}}),
+    ).content_hash()
+    assert config.explain('ports.80').origin.label == 'DictSource#0'
+
+    assert config.freeze() == {'ports': {80: 'http', 443: 'https',
+                                         'other': 1}}
+
+    upper.ports[8080] = 'alt'
+    assert changes == [('ports.8080', MISSING, 'alt')]
+
+
+def test_layered_provenance_labels_count_skipped_layers():
+    config = LayeredConfig(
+        DictSource({'b': {'c': 1}}),
+        DictSource({'x': 1}, lazy=True),
+        DictSource({'b': {'d': 2}}),
+    )
+
+    assert config.b.explain('c').origin.label == 'DictSource#0'
+    assert config.b.explain('d').origin.label == 'DictSource#2'
+
+
+def test_layered_provenance_is_cached():
+    source = DictSource({'a': 1}, cached=True)
+    config = LayeredConfig(source)
+
+    before = config.provenance()
+    assert config.provenance() is before
+
+    source.a = 2
+    assert config.provenance() is not before
+    assert config.explain('a').value == 2
+
+
+def test_freeze_layered_config():
+    config = LayeredConfig(
+        DictSource({'a': 1, 'b': {'c': 2, 'd': {'e': 3}}}),
+        DictSource({'a': 10, 'f': {'g': 4}}),
+    )
+
+    frozen = config.freeze()
+
+    assert frozen.a == 10
+    assert frozen.b.c == 2
+    assert frozen.b.d.e == 3
+    assert frozen.f.g == 4
+    assert frozen == config.dump()
+
+
+def test_freeze_only_rebuilds_changed_sections():
+    source = DictSource({'a': 1, 'b': {'c': 2}, 'd': {'e': 3}})
+    config = LayeredConfig(source)
+
+    frozen = config.freeze()
+    assert config.freeze() is frozen
+
+    source.b.c = 20
+    refrozen = config.freeze()
+
+    assert refrozen is not frozen
+    assert refrozen.b.c == 20
+    assert frozen.b.c == 2
+    assert refrozen.d is frozen.d
+
+
+def test_freeze_folded_sections():
+    config = LayeredConfig(
+        DictSource({'a': {'b': 1}}),
+        DictSource({'a': {'c': 2}}),
+        strategies={'a': strategy.merge},
+    )
+
+    assert config.freeze().a.b == 1
+    assert config.freeze().a.c == 2
+
+
+@pytest.mark.parametrize('format', ['json', 'yaml'])
+def test_layered_dump_to(format):
+    loads = json.loads
+    if format == 'yaml':
+        loads = pytest.importorskip('yaml').safe_load
+
+    config = LayeredConfig(
+        DictSource({'a': 1, 'b': {'c': 2, 'd': {'e': 3}}}),
+        DictSource({'b': {'f': [1, 2]}, 'g': {'h': 4}}),
+        strategies={'g': strategy.merge},
+    )
+    fh = io.StringIO()
+
+    config.dump_to(fh, format)
+
+    assert loads(fh.getvalue()) == config.dump()
+
+
+def make_counting_source(data, reads, **kwargs):
+    class CountingSource(DictSource):
+        def _read(self):
+            reads.append(1)
+            time.sleep(0.01)
+            return super(CountingSource, self)._read()
+
+    return CountingSource(data, **kwargs)
+
+
+def test_lazy_sources_are_read_on_fall_through():
+    reads = []
+    config = LayeredConfig(
+        make_counting_source({'a': 0, 'b': {'c': 0, 'd': 0, 'e': 0},
+                              'f': 0}, reads, lazy=True),
+        DictSource({'a': 1, 'b': {'c': 2}, 'g': 3}),
+    )
+
+    assert config.a == 1
+    assert config.b.c == 2
+    assert config.g == 3
+    assert reads == []
+
+    # within a section the lookup falls through to the lazy source
+    assert config.b.d == 0
+    assert config.f == 0
+    assert reads == [1]
+
+    with pytest.raises(KeyError):
+        config.missing
+    assert reads == [1]
+
+
+def test_lazy_sources_without_the_section():
+    reads = []
+    config = LayeredConfig(
+        make_counting_source({'a': 0}, reads, lazy=True),
+        DictSource({'b': {'c': 2}}),
+    )
+
+    assert config.b.c == 2
+    with pytest.raises(KeyError):
+        config.b.d
+    assert config.b.dump() == {'c': 2}
+    assert reads == [1]
+
+
+def test_lazy_sources_are_read_once_for_concurrent_lookups():
+    reads = []
+    config = LayeredConfig(
+        make_counting_source({'a': 0}, reads, lazy=True),
+        DictSource({'b': 1}),
+    )
+    results = []
+
+    def lookup():
+        results.append(config.a)
+
+    threads = [threading.Thread(target=lookup) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [0] * 8
+    assert reads == [1]
+
+
+def test_lookups_skip_sources_by_presence_index():
+    indexed = DictSource({'a': 1, 'b': {'c': 2}, 'd': 4}, indexed=True)
+    config = LayeredConfig(
+        indexed,
+        DictSource({'b': {'x': 3}, 'y': 5}),
+    )
+    indexed.dump()
+
+    assert config.y == 5
+    assert config.b.x == 3
+    assert config.b.c == 2
+    assert config.d == 4
+    with pytest.raises(KeyError):
+        config.b.missing
+    with pytest.raises(KeyError):
+        config.missing
+
+    assert indexed.presence_stats()['skips'] == 2
+    assert config.dump() == {'a': 1, 'b': {'c': 2, 'x': 3}, 'd': 4, 'y': 5}
+
+
+def test_typed_values_skip_sources_by_presence_index(monkeypatch):
+    monkeypatch.setenv('MVP_A', '10')
+    monkeypatch.setenv('MVP_B_C', '20')
+    monkeypatch.setenv('MVP_E', 'text')
+    typed = DictSource({'a': 1, 'b': {'c': 2.0}}, indexed=True)
+    config = LayeredConfig(typed, Environment('MVP_'))
+    typed.dump()
+
+    assert config.a == 10
+    assert config.b.c == 20.0
+    assert config.e == 'text'
+    assert typed.presence_stats()['skips'] == 1
+    assert dict(config.items())['e'] == 'text'
+
+
+def test_get_many(monkeypatch):
+    monkeypatch.setenv('MVP1_A', '1000')
+    monkeypatch.setenv('MVP2_B_M_E', '4000')
+    reads = []
+
+    config = LayeredConfig(
+        Environment('MVP1_'),
+        make_counting_source({'a': 1, 'b': {'c': 2, 'e': 400}}, reads),
+        DictSource({'x': 6, 'b': {'y': 7, 'd': {'e': 8}}}),
+        DictSource({'a': 100, 'b': {'m': {'e': 800}}}),
+        DictSource({'x': 'x', 'b': {'y': 0.7, 'd': 800}}),
+        Environment('MVP2_'),
+    )
+    paths = ['a', 'x', 'b.c', ('b', 'y'), 'b.d', 'b.e', 'b.m.e', 'b.m']
+
+    values = config.get_many(paths + ['b.d.e', 'missing'],
+                             defaults={'missing': 0})
+
+    assert reads == [1]
+    assert values.pop('b.d.e') is None
+    assert values.pop('missing') == 0
+    assert values == {
+        'a': 100, 'x': 'x', 'b.c': 2, ('b', 'y'): 0.7, 'b.d': 800,
+        'b.e': 400, 'b.m.e': 4000, 'b.m': config.b.m,
+    }
+    assert values['b.m'].dump() == {'e': 4000}
+
+
+def test_get_many_with_strategies(monkeypatch):
+    monkeypatch.setenv('MVP_A', '1000')
+
+    config = LayeredConfig(
+        Environment('MVP_'),
+        DictSource({'a': 1, 'x': [5, 6], 'b': {'c': 2, 'd': [3, 4]},
+                    'f': {'g': 1}}),
+        DictSource({'a': 10, 'x': [50, 60], 'b': {'c': 20, 'd': [30, 40]},
+                    'f': {'h': 2}}),
+        strategies={
+            'a': strategy.add,
+            'x': strategy.collect,
+            'c': strategy.collect,
+            'd': strategy.merge,
+            'f': strategy.merge,
+        }
+    )
+    paths = ['a', 'x', 'b.c', 'b.d', 'f', 'f.h']
+
+    assert config.get_many(paths) == {
+        'a': 1011, 'x': [[50, 60], [5, 6]], 'b.c': [20, 2],
+        'b.d': [30, 40, 3, 4], 'f': {'g': 1, 'h': 2}, 'f.h': 2,
+    }
+    assert config.b.get_many(['c']) == {'c': [20, 2]}
+
+
+def test_get_many_reads_lazy_sources_on_fall_through():
+    reads = []
+    config = LayeredConfig(
+        make_counting_source({'a': 0, 'b': {'c': 0, 'd': 0}}, reads,
+                             lazy=True),
+        DictSource({'a': 1, 'b': {'c': 2}}),
+    )
+
+    assert config.get_many(['a', 'b.c']) == {'a': 1, 'b.c': 2}
+    assert reads == []
+
+    assert config.get_many(['a', 'b.d']) == {'a': 1, 'b.d': 0}
+    assert reads == [1]
+
+
+@pytest.mark.parametrize('read_first', [False, True])
+def test_get_many_agrees_with_item_access_on_lazy_layers(read_first):
+    config = LayeredConfig(
+        DictSource({'a': {'d': 2}}),
+        DictSource({'a': 5, 'c': 1}, lazy=True),
+        DictSource({'a': {'b': 1}}),
+    )
+    if read_first:
+        config.c
+
+    values = config.get_many(['c', 'a.b', 'a.d'])
+
+    assert values == {'c': config.c, 'a.b': config.a.b, 'a.d': config.a.d}
+    assert values == {'c': 1, 'a.b': 1, 'a.d': 2}
+
+
+def test_layered_config_with_include():
+    first = DictSource({'db': {'host': 'a', 'port': 1}, 'cache': {'ttl': 1},
+                        'other': 1})
+    second = DictSource({'db': {'host': 'b'}, 'cache': {'size': 2},
+                         'misc': {'x': 1}})
+
+    config = LayeredConfig(first, second, include=['db', 'cache.*'])
+
+    assert config.dump() == {'db': {'host': 'b', 'port': 1},
+                             'cache': {'ttl': 1, 'size': 2}}
+    with pytest.raises(KeyError):
+        config.other
+    with pytest.raises(TypeError):
+        config.db.host = 'c'
+    # the given sources are left untouched
+    assert first.other == 1
+    assert second.is_writable()
+
+
+def test_project_layered_config():
+    config = LayeredConfig(
+        DictSource({'db': {'host': 'a', 'port': 1}, 'other': 1}),
+        DictSource({'db': {'host': 'b', 'user': 'u'}}),
+    )
+
+    projected = config.project(['db.host', 'db.port'])
+    assert projected.dump() == {'db': {'host': 'b', 'port': 1}}
+
+    # patterns are relative to subconfigs
+    projected = config.db.project(['user'])
+    assert projected.dump() == {'user': 'u'}
+    assert projected.user == 'u'
+
+
+def test_config_snapshot():
+    cached = DictSource({'db': {'host': 'a', 'port': 1}}, cached=True)
+    uncached = DictSource({'db': {'user': 'u'}, 'debug': False})
+    config = LayeredConfig(uncached, cached)
+    generation = config.generation()
+
+    with config.snapshot() as snapshot:
+        assert snapshot.generation() == generation
+        assert snapshot.db.host == 'a'
+
+        config.db.host = 'b'
+        config.db.user = 'v'
+        cached.reload()
+
+        assert config.generation() == generation + 3
+        assert config.db.host == 'a'
+        assert config.db.user == 'v'
+        assert snapshot.dump() == {'db': {'host': 'a', 'port': 1,
+                                          'user': 'u'},
+                                   'debug': False}
+        with pytest.raises(TypeError):
+            snapshot.debug = True
+
+    with pytest.raises(KeyError):
+        snapshot.db
+
+
+def test_snapshot_of_subconfig_keeps_types():
+    typed = DictSource({'db': {'port': 1, 'timeout': 2.0}}, cached=True)
+    config = LayeredConfig(
+        typed,
+        INIFile(io.StringIO(u'[db]\nport = 2\n')),
+    )
+    subconfig = config.db
+
+    snapshot = subconfig.snapshot()
+    typed.db.port = 1.0
+    typed.db.timeout = 3.0
+
+    assert snapshot.port == 2
+    assert type(snapshot.port) is int
+    assert snapshot.timeout == 2.0
+    assert subconfig.port == 2.0
+    assert type(subconfig.port) is float
+    assert snapshot.explain('port').origin.source_name == 'INIFile'
+
+
+def test_snapshot_reads_lazy_sources_on_fall_through():
+    reads = []
+    lazy = make_counting_source({'a': 0, 'b': 1}, reads, lazy=True)
+    config = LayeredConfig(lazy, DictSource({'a': 1}))
+
+    with config.snapshot() as snapshot:
+        assert snapshot.a == 1
+        assert reads == []
+        assert snapshot.b == 1
+        assert reads == [1]
+
+
+def test_snapshots_are_consistent_during_writes():
+    source = DictSource({'db': {'host': 'host0', 'port': 0}}, cached=True)
+    config = LayeredConfig(source)
+    stop = threading.Event()
+
+    def write():
+        version = 0
+        while not stop.is_set():
+            version += 1
+            source.db = {'host': 'host%d' % version, 'port': version}
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        for _ in range(200):
+            with config.snapshot() as snapshot:
+                db = snapshot.db
+                assert db.host == 'host%d' % db.port
+    finally:
+        stop.set()
+        writer.join()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+import pytest
+
+from layeredconfig.locking import RWLock
+
+
+def test_concurrent_readers():
+    lock = RWLock()
+    inside = threading.Event()
+    results = []
+
+    def reader():
+        with lock.reading():
+            inside.set()
+            time.sleep(0.05)
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    inside.wait()
+
+    # a second reader must not wait for the first one
+    with lock.reading():
+        results.append(thread.is_alive())
+    thread.join()
+
+    assert results == [True]
+
+
+def test_writer_is_exclusive():
+    lock = RWLock()
+    events = []
+
+    def writer():
+        with lock.writing():
+            events.append('write')
+
+    with lock.reading():
+        thread = threading.Thread(target=writer)
+        thread.start()
+        time.sleep(0.05)
+        events.append('read')
+    thread.join()
+
+    assert events == ['read', 'write']
+
+
+def test_reentrant_locks():
+    lock = RWLock()
+
+    with lock.writing():
+        with lock.writing():
+            with lock.reading():
+                pass
+
+    with lock.reading():
+        with lock.reading():
+            pass
+
+    # everything was released again
+    with lock.writing():
+        pass
+
+
+def test_prevent_upgrading_read_locks():
+    lock = RWLock()
+
+    with lock.reading():
+        with pytest.raises(RuntimeError):
+            lock.acquire_write()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from layeredconfig import DictSource, JsonFile, LayeredConfig
+from layeredconfig.profiling import make_data, measure_memory
+
+tracemalloc = pytest.importorskip('tracemalloc')
+
+
+def make_json(size, tmpdir):
+    path = tmpdir / 'config.json'
+    path.write(repr(make_data(size)).replace("'", '"'))
+    return JsonFile(str(path), cached=True)
+
+
+SOURCES = {
+    'dict': lambda size, tmpdir: DictSource(make_data(size)),
+    'dict-cached': lambda size, tmpdir: DictSource(make_data(size),
+                                                   cached=True),
+    'json-cached': make_json,
+    'layered': lambda size, tmpdir: LayeredConfig(
+        DictSource(make_data(size), cached=True),
+        DictSource({'section0': {}}, cached=True)),
+}
+
+
+def lookup(config):
+    return config['section0']['key0']
+
+
+def write(config):
+    config['section0']['key0'] = 'changed'
+
+
+def dump(config):
+    return config.dump()
+
+
+# upper bounds of the peak bytes of single operations on configs with
+# 100 values. They leave room for differences between python versions
+# but catch for example additional copies of the data.
+@pytest.mark.parametrize('source, operation, limit', [
+    ('dict', lookup, 16 * 1024),
+    ('dict-cached', lookup, 4 * 1024),
+    ('dict-cached', write, 8 * 1024),
+    ('json-cached', lookup, 4 * 1024),
+    ('layered', lookup, 16 * 1024),
+    ('layered', write, 16 * 1024),
+    ('layered', dump, 32 * 1024),
+])
+def test_peak_memory_per_operation(tmpdir, source, operation, limit):
+    config = SOURCES[source](100, tmpdir)
+
+    peak, retained, _ = measure_memory(lambda: operation(config))
+    assert peak < limit
+
+
+@pytest.mark.parametrize('source', ['dict-cached', 'layered'])
+def test_cached_lookups_do_not_grow_with_config_size(tmpdir, source):
+    small_config = SOURCES[source](10, tmpdir)
+    large_config = SOURCES[source](1000, tmpdir)
+
+    small, _, _ = measure_memory(lambda: lookup(small_config))
+    large, _, _ = measure_memory(lambda: lookup(large_config))
+    assert large < small + 1024
+
+
+@pytest.mark.parametrize('source', ['dict', 'dict-cached', 'layered'])
+def test_lookups_do_not_retain_memory(tmpdir, source):
+    config = SOURCES[source](100, tmpdir)
+
+    def lookups():
+        for _ in range(100):
+            lookup(config)
+
+    peak, retained, _ = measure_memory(lookups)
+    assert retained < 1024
+
+
+def test_interning_reduces_retained_memory(tmpdir):
+    paths = []
+    for layer in range(3):
+        path = tmpdir / ('layer%d.json' % layer)
+        path.write(repr(make_data(1000)).replace("'", '"'))
+        paths.append(str(path))
+
+    # keeps the sources of the last load alive while measuring
+    loaded = []
+
+    def load(intern):
+        del loaded[:]
+        loaded.extend(JsonFile(path, cached=True, intern=intern)
+                      for path in paths)
+        for source in loaded:
+            source.dump()
+
+    _, plain, _ = measure_memory(lambda: load(False), repeat=1)
+    _, interned, _ = measure_memory(lambda: load(True), repeat=1)
+    assert interned < plain * 0.75
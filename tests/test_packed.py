@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from layeredconfig import packed
+
+
+def test_pack_roundtrip():
+    data = {
+        'none': None,
+        'bool': [True, False],
+        'int': -5,
+        'bigint': 2**70,
+        'float': 0.5,
+        'text': u'ünicode',
+        'list': [1, 'a', {'b': [2.5]}],
+        'section': {'z': 1, 'a': {'': 'empty key'}},
+    }
+
+    result = packed.PackedMapping(packed.pack(data))
+
+    assert result == data
+    assert packed.unpack(result) == data
+    assert isinstance(result['section'], packed.PackedMapping)
+    assert list(result['section']) == ['a', 'z']
+
+
+def test_packed_mapping_lookup():
+    data = dict(('key%03d' % i, i) for i in range(100))
+    result = packed.PackedMapping(packed.pack(data, offset=16), 16)
+
+    assert len(result) == 100
+    assert result['key042'] == 42
+    assert 'key100' not in result
+    with pytest.raises(KeyError):
+        result[1]
+
+
+@pytest.mark.parametrize('data', [
+    {'a': object()},
+    {1: 'non-string key'},
+])
+def test_pack_unsupported_values(data):
+    with pytest.raises(TypeError):
+        packed.pack(data)
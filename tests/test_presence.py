@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from layeredconfig import presence
+
+
+DATA = {'a': 1, 'b': {'c': 2, 'd': {'e': 3}}}
+
+
+def test_iter_keypaths():
+    assert sorted(presence.iter_keypaths(DATA)) == [
+        ('a',), ('b',), ('b', 'c'), ('b', 'd'), ('b', 'd', 'e')]
+
+
+@pytest.mark.parametrize('kind', ['exact', 'bloom'])
+def test_index_contains_all_keypaths(kind):
+    index = presence.build_index(DATA, kind)
+
+    assert index.kind == kind
+    assert len(index) == 5
+    for keypath in presence.iter_keypaths(DATA):
+        assert index.might_contain(keypath)
+    assert not index.might_contain(('b', 'x'))
+
+
+def test_bloom_index_error_rate():
+    data = dict(('key%d' % key, key) for key in range(10000))
+    index = presence.BloomIndex(presence.iter_keypaths(data))
+
+    assert all(index.might_contain(('key%d' % key,))
+               for key in range(10000))
+    false_positives = sum(index.might_contain(('missing%d' % key,))
+                          for key in range(10000))
+    assert false_positives < 10000 * presence.ERROR_RATE * 2
+
+
+def test_large_sources_get_a_bloom_index(monkeypatch):
+    monkeypatch.setattr(presence, 'EXACT_LIMIT', 3)
+
+    assert presence.build_index(DATA).kind == 'bloom'
+    assert presence.build_index({'a': 1}).kind == 'exact'
+
+
+def test_unknown_index_kind():
+    with pytest.raises(ValueError):
+        presence.build_index(DATA, 'other')
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import io
+import json
+import os
+import pstats
+import subprocess
+import sys
+
+import pytest
+
+from layeredconfig import DictSource, LayeredConfig, profiling
+
+
+@pytest.fixture
+def json_path(tmpdir):
+    path = tmpdir / 'config.json'
+    path.write(json.dumps({'db': {'host': 'a', 'port': 1}, 'debug': True}))
+    return str(path)
+
+
+def make_args(**kwargs):
+    defaults = dict(lookups=50, iterations=2, dumps=2, writes=0,
+                    in_place=False, cached=False, seed=1, top=3,
+                    cprofile=None)
+    defaults.update(kwargs)
+    return argparse.Namespace(**defaults)
+
+
+def test_make_source_from_spec(json_path):
+    source, fake = profiling.make_source('json:' + json_path)
+
+    assert fake is None
+    assert source.dump()['db'] == {'host': 'a', 'port': 1}
+    assert source._label == 'json:' + json_path
+
+    with pytest.raises(ValueError):
+        profiling.make_source('unknown:argument')
+
+
+def test_instrument_source_reads():
+    source = DictSource({'a': {'b': 1}})
+    stats = profiling.instrument(source, 'dict')
+
+    assert source.a.b == 1
+    assert stats.reads == 2
+    assert stats.seconds > 0
+
+
+def test_percentile():
+    samples = list(range(1, 101))
+
+    assert profiling.percentile(samples, 0.5) == 51
+    assert profiling.percentile(samples, 0.99) == 100
+    assert profiling.percentile(samples, 1.0) == 100
+    assert profiling.percentile([], 0.5) == 0.0
+
+
+def test_profile_workloads():
+    source = DictSource({'db': {'host': 'a', 'port': 1}, 'debug': True})
+    stats = profiling.instrument(source, 'dict')
+    run = profiling.Profile(LayeredConfig(source), [stats], seed=1)
+
+    assert run.keypaths == [('db', 'host'), ('db', 'port'), ('debug',)]
+    assert stats.reads == 0
+
+    for workload in profiling.WORKLOADS:
+        run.run(workload, 5)
+
+    assert sum(len(latencies) for latencies in run.latencies.values()) == 5
+    assert stats.reads > 0
+    assert source.dump() == {'db': {'host': 'a', 'port': 1}, 'debug': True}
+
+    report = '\n'.join(run.report(top=2))
+    for text in ['lookup', 'iterate', 'dump', 'write', 'dict', 'p99',
+                 'slowest keypaths']:
+        assert text in report
+
+
+def test_writes_go_into_the_providing_sources():
+    class StringSource(DictSource):
+        _is_typed = False
+
+        def _read(self):
+            return super(StringSource, self)._read()
+
+        def _write(self, data):
+            super(StringSource, self)._write(data)
+
+    lower = DictSource({'db': {'host': 'a', 'port': 1}, 'debug': True})
+    upper = StringSource({'db': {'port': '2'}})
+    run = profiling.Profile(LayeredConfig(lower, upper), [], seed=1)
+
+    run.run('write', 20)
+
+    # the raw values are written back instead of the typed ones
+    assert upper.dump() == {'db': {'port': '2'}}
+    assert lower.dump() == {'db': {'host': 'a', 'port': 1}, 'debug': True}
+    assert run.readonly_writes == 0
+
+
+def test_cached_writes_are_flushed():
+    source, fake = profiling.make_source('fake-etcd:', cached=True)
+    try:
+        fake.set('/db/host', 'a')
+        write_cache = pytest.helpers.inspector(source.write_cache)
+        source.__dict__['write_cache'] = write_cache
+        run = profiling.Profile(LayeredConfig(source), [], seed=1)
+
+        run.run('write', 3)
+
+        assert write_cache.calls == 3
+        assert fake.get('/db/host')['node']['value'] == 'a'
+    finally:
+        fake.stop()
+
+
+def test_writes_go_into_copies_of_files(json_path, tmpdir):
+    os.utime(json_path, (0, 0))
+    out = io.StringIO() if sys.version_info[0] > 2 else io.BytesIO()
+
+    profiling.profile(make_args(sources=['json:' + json_path], writes=5,
+                                cached=True), out)
+
+    assert os.stat(json_path).st_mtime == 0
+    assert 'json:' + json_path in out.getvalue()
+
+    spec = profiling.copy_for_writes('json:' + json_path, str(tmpdir))
+    assert spec != 'json:' + json_path
+    assert json.load(open(spec.partition(':')[2])) == json.load(
+        open(json_path))
+
+    assert profiling.copy_for_writes('env:MVP_', str(tmpdir)) == 'env:MVP_'
+    with pytest.raises(ValueError):
+        profiling.copy_for_writes('etcd:http://127.0.0.1:2379/v2',
+                                  str(tmpdir))
+
+
+def test_seed_fake_etcd_with_json_values(json_path):
+    source, fake = profiling.make_source('fake-etcd:' + json_path)
+    try:
+        assert source.dump() == {'db': {'host': 'a', 'port': '1'},
+                                 'debug': 'true'}
+    finally:
+        fake.stop()
+
+
+def test_profile_command(json_path, monkeypatch, tmpdir):
+    monkeypatch.setenv('MVP_DB_USER', 'u')
+    out = io.StringIO() if sys.version_info[0] > 2 else io.BytesIO()
+    stats_path = str(tmpdir / 'profile.stats')
+
+    profiling.profile(make_args(
+        sources=['json:' + json_path, 'env:MVP_', 'fake-etcd:' + json_path],
+        cprofile=stats_path), out)
+
+    report = out.getvalue()
+    assert 'env:MVP_' in report
+    assert 'fake-etcd:' + json_path in report
+    assert pstats.Stats(stats_path).total_calls > 0
+
+
+def test_profile_entry_point(json_path):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    output = subprocess.check_output(
+        [sys.executable, '-m', 'layeredconfig', 'profile',
+         'json:' + json_path, '--lookups', '10', '--cprofile'], env=env)
+
+    assert b'slowest keypaths' in output
+    assert b'cumulative' in output
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from layeredconfig.projection import Projection
+
+
+DATA = {
+    'db': {'host': 'localhost', 'port': 5432},
+    'cache': {'host': 'cachehost', 'ttl': 60},
+    'logging': {'level': 'info'},
+    'debug': True,
+}
+
+
+@pytest.mark.parametrize('include, expected', [
+    (['db'], {'db': DATA['db']}),
+    (['db', 'cache.*'], {'db': DATA['db'], 'cache': DATA['cache']}),
+    ('debug', {'debug': True}),
+    (['*.host'], {'db': {'host': 'localhost'},
+                  'cache': {'host': 'cachehost'}}),
+    ([('cache', 'ttl')], {'cache': {'ttl': 60}}),
+    (['db.missing', 'debug.deeper'], {}),
+    (['*'], DATA),
+])
+def test_apply_projection(include, expected):
+    assert Projection(include).apply(DATA) == expected
+
+
+def test_projection_keeps_included_subtrees():
+    assert Projection(['db']).apply(DATA)['db'] is DATA['db']
+
+
+@pytest.mark.parametrize('include, prefixes', [
+    (['db', 'cache.*', 'cache.host'], [('cache',), ('db',)]),
+    (['db.host', 'db.p*'], [('db',)]),
+    (['db', '*.host'], [()]),
+])
+def test_projection_prefixes(include, prefixes):
+    assert Projection(include).prefixes == prefixes
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from layeredconfig import strategy
+
+
+def fold(strategy_, *values):
+    accumulator = strategy_.initialize()
+    for value in values:
+        accumulator = strategy_.accumulate(accumulator, value)
+    return strategy_.finalize(accumulator)
+
+
+@pytest.mark.parametrize('values, expected', [
+    ((1, 10, 100), 111),
+    (([1], [2, 3], []), [1, 2, 3]),
+    (((1,), (2,)), (1, 2)),
+    ((u'a', u'b', u'c'), u'abc'),
+    ((b'a', b'b'), b'ab'),
+    (({1}, {2}, {1, 3}), {1, 2, 3}),
+    ((frozenset([1]), frozenset([2])), frozenset([1, 2])),
+])
+def test_add_strategy(values, expected):
+    result = fold(strategy.add, *values)
+
+    assert result == expected
+    assert type(result) is type(expected)
+
+
+def test_collect_strategy():
+    assert fold(strategy.collect, [1], 2, None) == [[1], 2, None]
+
+
+def test_merge_strategy():
+    high = {'a': 1, 'b': {'c': 2, 'd': {'e': 3}}}
+    middle = {'a': 10, 'b': {'d': {'f': 40}, 'g': 50}, 'h': [60]}
+    low = {'b': {'d': 700, 'i': 80}, 'j': {'k': 90}}
+
+    result = fold(strategy.merge, high, middle, low)
+
+    assert result == {'a': 1, 'b': {'c': 2, 'd': {'e': 3, 'f': 40},
+                                    'g': 50, 'i': 80}, 'h': [60],
+                      'j': {'k': 90}}
+    # all sections are copies, other values are shared
+    assert result['h'] is middle['h']
+    assert result['j'] is not low['j']
+    assert high == {'a': 1, 'b': {'c': 2, 'd': {'e': 3}}}
+    assert middle == {'a': 10, 'b': {'d': {'f': 40}, 'g': 50}, 'h': [60]}
+
+
+def test_merge_strategy_adds_non_mappings():
+    assert fold(strategy.merge, [1], [2]) == [1, 2]
+
+
+def test_legacy_strategy_interface():
+    assert strategy.add([2], strategy.add([1])) == [1, 2]
+    assert strategy.collect(2, strategy.collect(1)) == [1, 2]
+    assert strategy.merge({'a': {'c': 2}}, {'a': {'b': 1}}) == \
+        {'a': {'b': 1, 'c': 2}}
+
+
+def test_function_strategy():
+    def maximum(next_, previous=None):
+        return next_ if previous is None else max(next_, previous)
+
+    assert fold(strategy.as_strategy(maximum), 3, 7, 5) == 7
+    assert strategy.as_strategy(strategy.add) is strategy.add
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import io
+import json
+import sys
+
+import pytest
+
+from layeredconfig import streaming
+from layeredconfig.streaming import END, START, VALUE
+
+
+def deep_tree(depth):
+    tree = section = {}
+    for _ in range(depth):
+        section['k'] = {}
+        section = section['k']
+    section['leaf'] = 1
+    return tree
+
+
+def test_iter_events(data):
+    events = list(streaming.iter_events(sorted(data.items())))
+
+    assert events == [
+        (START, (), None),
+        (VALUE, ('a',), 1),
+        (START, ('b',), None),
+        (VALUE, ('b', 'c'), 2),
+        (START, ('b', 'd'), None),
+        (VALUE, ('b', 'd', 'e'), 3),
+        (END, ('b', 'd'), None),
+        (END, ('b',), None),
+        (END, (), None),
+    ]
+
+
+def test_iter_events_with_conversion(data):
+    events = streaming.iter_events(
+        data.items(), convert=lambda keypath, value: '.'.join(keypath))
+
+    assert sorted(value for event, keypath, value in events
+                  if event == VALUE) == ['a', 'b.c', 'b.d.e']
+
+
+@pytest.mark.parametrize('indent', [None, 2])
+def test_dump_json(data, indent):
+    data['b']['empty'] = {}
+    data['b']['list'] = [1, 'two']
+    fh = io.StringIO()
+
+    streaming.dump_to(fh, data.items(), 'json', indent=indent)
+
+    assert json.loads(fh.getvalue()) == data
+    assert fh.getvalue() == json.dumps(data, indent=indent, separators=(
+        (',', ':') if indent is None else (',', ': ')))
+
+
+def test_dump_yaml(data):
+    yaml = pytest.importorskip('yaml')
+    data['b']['empty'] = {}
+    data['b']['list'] = [1, 'two words']
+    fh = io.StringIO()
+
+    streaming.dump_to(fh, data.items(), 'yaml')
+
+    assert yaml.safe_load(fh.getvalue()) == data
+
+
+@pytest.mark.parametrize('format', ['json', 'yaml'])
+def test_dump_trees_deeper_than_the_recursion_limit(format):
+    if format == 'yaml':
+        pytest.importorskip('yaml')
+    depth = sys.getrecursionlimit() + 100
+    fh = io.StringIO()
+
+    streaming.dump_to(fh, deep_tree(depth).items(), format)
+
+    assert fh.getvalue().count('k') == depth
+
+
+def test_dump_unknown_format(data):
+    with pytest.raises(ValueError):
+        streaming.dump_to(io.StringIO(), data.items(), 'xml')
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import time
+
+import pytest
+
+from layeredconfig import INIFile, JsonFile
+from layeredconfig.watcher import FileWatcher
+
+
+def write_json(path, data, mtime):
+    path.write(json.dumps(data))
+    # stat signatures would not tell writes within the same tick apart
+    os.utime(str(path), (mtime, mtime))
+
+
+@pytest.fixture
+def watcher():
+    # polled by hand unless a test starts the thread by itself
+    watcher = FileWatcher(interval=60, debounce=1)
+    yield watcher
+    watcher.stop()
+
+
+def test_watch_json_file(tmpdir, watcher):
+    path = tmpdir / 'config.json'
+    write_json(path, {'a': 1}, 1000)
+    config = JsonFile(str(path), watch=watcher)
+
+    assert watcher.is_watching(config)
+    assert config.a == 1
+    watcher.poll(now=0)
+
+    write_json(path, {'a': 2}, 1001)
+    watcher.poll(now=1)
+    # bursts of writes are debounced
+    write_json(path, {'a': 3}, 1002)
+    watcher.poll(now=2)
+    watcher.poll(now=2.5)
+    assert config.a == 1
+
+    watcher.poll(now=3)
+    assert config.a == 3
+
+
+def test_watcher_keeps_data_of_broken_files(tmpdir, watcher):
+    path = tmpdir / 'config.json'
+    write_json(path, {'a': 1}, 1000)
+    config = JsonFile(str(path), watch=watcher)
+    config.dump()
+    watcher.poll(now=0)
+
+    path.write('{"a": ')
+    os.utime(str(path), (1001, 1001))
+    watcher.poll(now=1)
+    watcher.poll(now=2)
+    assert config.a == 1
+
+    # not parsed again until the file changes
+    watcher.poll(now=3)
+    write_json(path, {'a': 2}, 1002)
+    watcher.poll(now=4)
+    watcher.poll(now=5)
+    assert config.a == 2
+
+
+def test_watcher_notifies_listeners(tmpdir, watcher):
+    path = tmpdir / 'config.ini'
+    path.write('[a]\nb = 1\n')
+    os.utime(str(path), (1000, 1000))
+    config = INIFile(str(path), watch=watcher)
+    changes = []
+    config.add_listener(changes.append)
+
+    assert config.a.b == '1'
+    watcher.poll(now=0)
+    path.write('[a]\nb = 2\n')
+    os.utime(str(path), (1001, 1001))
+    watcher.poll(now=1)
+    watcher.poll(now=2)
+
+    assert config.a.b == '2'
+    assert changes == [config]
+
+
+def test_watcher_thread(tmpdir):
+    path = tmpdir / 'config.json'
+    write_json(path, {'a': 1}, 1000)
+    watcher = FileWatcher(interval=0.01, debounce=0)
+    try:
+        config = JsonFile(str(path), watch=watcher)
+        assert config.a == 1
+        time.sleep(0.05)
+
+        write_json(path, {'a': 2}, 1001)
+        deadline = time.time() + 5
+        while config.a != 2 and time.time() < deadline:
+            time.sleep(0.01)
+        assert config.a == 2
+
+        watcher.unwatch(config)
+        assert not watcher.is_watching(config)
+    finally:
+        watcher.stop()
+
+
+def test_watcher_forgets_collected_sources(tmpdir, watcher):
+    path = tmpdir / 'config.json'
+    write_json(path, {'a': 1}, 1000)
+    JsonFile(str(path), watch=watcher)
+
+    watcher.poll()
+    assert watcher._entries == []